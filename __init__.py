@@ -1,10 +1,14 @@
 import os
 import sys
+import time
 from pathlib import Path
 
-# 确保能找到 autofigure2.py
-current_dir = Path(__file__).resolve().parent
-sys.path.insert(0, str(current_dir))
+_load_start = time.perf_counter()
+
+# 确保能找到 autofigure2.py（只在此处加入一次；torch / autofigure2 均在节点首次执行时才导入）
+current_dir = str(Path(__file__).resolve().parent)
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
 
 from .nodes import *
 
@@ -28,4 +32,4 @@ NODE_DISPLAY_NAME_MAPPINGS = {
 
 __all__ = ['NODE_CLASS_MAPPINGS', 'NODE_DISPLAY_NAME_MAPPINGS']
 
-print("✅ AutoFigure-Edit for ComfyUI loaded successfully")
+print(f"✅ AutoFigure-Edit for ComfyUI loaded successfully ({(time.perf_counter() - _load_start) * 1000:.0f} ms)")
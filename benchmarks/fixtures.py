@@ -0,0 +1,95 @@
+"""程序化生成的基准测试图：不同尺寸与图标数量，附带真实 box 与对应的 SVG 模板"""
+import random
+
+from PIL import Image, ImageDraw
+
+# (名称, 宽, 高, 图标数)
+CASES = [
+    ("small", 768, 512, 4),
+    ("medium", 1536, 1024, 12),
+    ("large", 2560, 1600, 32),
+]
+
+_PALETTE = [(66, 133, 244), (219, 68, 55), (244, 180, 0), (15, 157, 88), (171, 71, 188), (0, 172, 193)]
+_SHAPES = ["ellipse", "rect", "triangle", "diamond"]
+
+
+def _grid(n: int, width: int, height: int):
+    cols = max(1, round((n * width / height) ** 0.5))
+    rows = (n + cols - 1) // cols
+    return cols, rows, width / cols, height / rows
+
+
+def _draw_icon(draw: ImageDraw.ImageDraw, box, shape: str, color):
+    x1, y1, x2, y2 = box
+    if shape == "ellipse":
+        draw.ellipse(box, fill=color, outline=(30, 30, 30), width=3)
+    elif shape == "rect":
+        draw.rounded_rectangle(box, radius=(x2 - x1) // 6, fill=color, outline=(30, 30, 30), width=3)
+    elif shape == "triangle":
+        draw.polygon([((x1 + x2) / 2, y1), (x2, y2), (x1, y2)], fill=color, outline=(30, 30, 30))
+    else:
+        draw.polygon([((x1 + x2) / 2, y1), (x2, (y1 + y2) / 2), ((x1 + x2) / 2, y2), (x1, (y1 + y2) / 2)],
+                     fill=color, outline=(30, 30, 30))
+    # 图标内部细节，让去背景 / 哈希有内容可看
+    cx, cy, r = (x1 + x2) / 2, (y1 + y2) / 2, (x2 - x1) / 8
+    draw.ellipse((cx - r, cy - r, cx + r, cy + r), fill=(255, 255, 255))
+
+
+def make_figure(width: int, height: int, n_icons: int, seed: int = 0):
+    """-> (PIL RGB 图, 检测结果列表)
+
+    图标按网格排布，约三分之一为重复图标（用于触发去重），图标之间有连线和文字。
+    检测结果格式与 sam3_engine.detect 的返回一致：{x1, y1, x2, y2, score, prompt}。
+    """
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    cols, rows, cell_w, cell_h = _grid(n_icons, width, height)
+    side = int(min(cell_w, cell_h) * 0.5)
+
+    centers, detections = [], []
+    styles = [(rng.choice(_SHAPES), rng.choice(_PALETTE)) for _ in range(max(1, n_icons * 2 // 3))]
+    for i in range(n_icons):
+        cx = int((i % cols + 0.5) * cell_w)
+        cy = int((i // cols + 0.5) * cell_h)
+        centers.append((cx, cy))
+    for a, b in zip(centers, centers[1:]):
+        draw.line([a, b], fill=(120, 120, 120), width=2)
+
+    for i, (cx, cy) in enumerate(centers):
+        box = (cx - side // 2, cy - side // 2, cx + side // 2, cy + side // 2)
+        shape, color = styles[i % len(styles)]
+        _draw_icon(draw, box, shape, color)
+        draw.text((box[0], box[3] + 6), f"module {i + 1}", fill=(20, 20, 20))
+        detections.append({
+            "x1": box[0], "y1": box[1], "x2": box[2], "y2": box[3],
+            "score": round(0.6 + rng.random() * 0.4, 3), "prompt": "icon",
+        })
+    return image, detections
+
+
+def make_svg_template(width: int, height: int, detections: list) -> str:
+    """与检测结果对应的 SVG 模板：每个图标位置一个 <AF>NN 占位 rect，编号顺序与 build_boxlib 一致"""
+    boxes = sorted(detections, key=lambda d: (d["y1"], d["x1"]))
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">',
+        f'<rect x="0" y="0" width="{width}" height="{height}" fill="#ffffff"/>',
+    ]
+    for a, b in zip(boxes, boxes[1:]):
+        parts.append(
+            f'<line x1="{(a["x1"] + a["x2"]) / 2}" y1="{(a["y1"] + a["y2"]) / 2}" '
+            f'x2="{(b["x1"] + b["x2"]) / 2}" y2="{(b["y1"] + b["y2"]) / 2}" stroke="#787878" stroke-width="2"/>'
+        )
+    for i, d in enumerate(boxes, 1):
+        parts.append(
+            f'<rect id="AF{i:02d}" x="{d["x1"]}" y="{d["y1"]}" width="{d["x2"] - d["x1"]}" '
+            f'height="{d["y2"] - d["y1"]}" fill="#808080" stroke="#000000"/>'
+        )
+        parts.append(f'<text x="{d["x1"]}" y="{d["y2"] + 18}" font-size="14">module {i}</text>')
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+
+def method_text(n_icons: int) -> str:
+    return "We propose a pipeline of " + ", ".join(f"module {i + 1}" for i in range(n_icons)) + "."
@@ -0,0 +1,131 @@
+"""框合并一致性检查：merge_boxes_vectorized / boxes_mask 与参考实现逐项比较，不加载模型
+
+    python benchmarks/merge_equivalence.py [--cases 3000] [--seed 0] [--timing]
+
+随机生成检测结果（整数 / 浮点坐标、缺失与相同的分数、重复框、越界与退化框，多个阈值），
+要求 merge_boxes_vectorized 的输出与 merge_boxes 完全相同：顺序、每个字段的取值与类型
+（包括相等时取 cur 的 min / max 与分数规则所决定的字段来源）。boxes_mask 与逐框切片赋值的
+掩码比较。任一不一致时打印首个反例并以退出码 1 结束。
+"""
+import argparse
+import importlib
+import random
+import sys
+import time
+
+import numpy as np
+
+from run_benchmark import PACKAGE_NAME, load_plugin
+
+THRESHOLDS = (0.0, 0.1, 0.3, 0.5, 0.8, 1.0)
+
+
+def random_boxes(rng: random.Random, width: int, height: int) -> list:
+    """一组候选框：簇状分布以产生多轮合并，混入各种边界情况"""
+    as_float = rng.random() < 0.5
+    n = rng.choice((0, 1, 2, 5, 20, 60, 150))
+    centers = [(rng.uniform(0, width), rng.uniform(0, height)) for _ in range(max(1, n // 6))]
+    boxes = []
+    for i in range(n):
+        cx, cy = rng.choice(centers)
+        w, h = rng.uniform(1, width / 4), rng.uniform(1, height / 4)
+        x1, y1 = cx - w / 2 + rng.gauss(0, w / 3), cy - h / 2 + rng.gauss(0, h / 3)
+        x2, y2 = x1 + w, y1 + h
+        if rng.random() < 0.05:
+            x2 = x1  # 退化框
+        coords = (x1, y1, x2, y2) if as_float else tuple(int(round(v)) for v in (x1, y1, x2, y2))
+        if not as_float and rng.random() < 0.3:
+            # 同值不同类型（5 与 5.0）：坐标取自哪个框会体现在输出类型上，能检查相等时的来源规则
+            coords = tuple(float(v) for v in coords)
+        box = dict(zip(("x1", "y1", "x2", "y2"), coords), prompt=f"p{i % 3}", index=i)
+        r = rng.random()
+        if r < 0.7:
+            box["score"] = round(rng.random(), 2)  # 两位小数，常有相同分数
+        elif r < 0.85:
+            box["score"] = 0.5
+        # 其余缺失 score，按 0 处理
+        boxes.append(box)
+        if rng.random() < 0.05:
+            boxes.append(dict(box, index=-i - 1))  # 完全重复的框
+    return boxes
+
+
+def detection_boxes(rng: random.Random, n: int, size: int) -> list:
+    """计时用：大图上散布的小框（SAM3 候选框的典型形态），大多互不重叠、需逐对比较"""
+    boxes = []
+    for i in range(n):
+        x1, y1 = rng.randrange(size), rng.randrange(size)
+        boxes.append({"x1": x1, "y1": y1, "x2": x1 + rng.randrange(16, 96), "y2": y1 + rng.randrange(16, 96),
+                      "score": round(rng.random(), 3), "prompt": "icon"})
+    return boxes
+
+
+def reference_mask(boxes: list, width: int, height: int) -> np.ndarray:
+    mask = np.zeros((height, width), dtype=np.float32)
+    for box in boxes:
+        mask[int(box["y1"]):int(box["y2"]), int(box["x1"]):int(box["x2"])] = 1
+    return mask
+
+
+def same_boxes(a: list, b: list) -> bool:
+    """逐个字段比较取值与类型（1 == 1.0 不算相同）"""
+    if len(a) != len(b):
+        return False
+    for x, y in zip(a, b):
+        if x.keys() != y.keys():
+            return False
+        if any(x[k] != y[k] or type(x[k]) is not type(y[k]) for k in x):
+            return False
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AutoFigure box merge equivalence check")
+    parser.add_argument("--cases", type=int, default=3000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timing", action="store_true", help="also time both merges on large inputs")
+    args = parser.parse_args(argv)
+
+    load_plugin()
+    boxes_mod = importlib.import_module(f"{PACKAGE_NAME}.utils.boxes")
+    rng = random.Random(args.seed)
+
+    merged_total = 0
+    for case in range(args.cases):
+        width, height = rng.choice(((256, 256), (640, 480), (1920, 1080)))
+        boxes = random_boxes(rng, width, height)
+        threshold = rng.choice(THRESHOLDS)
+        expected = boxes_mod.merge_boxes(boxes, threshold)
+        actual = boxes_mod.merge_boxes_vectorized(boxes, threshold)
+        if not same_boxes(expected, actual):
+            print(f"merge mismatch in case {case} (threshold {threshold}, {len(boxes)} boxes)")
+            print(f"  boxes:    {boxes}")
+            print(f"  expected: {expected}")
+            print(f"  actual:   {actual}")
+            return 1
+        # 掩码用未合并的框，覆盖越界 / 负坐标 / 退化框
+        if not np.array_equal(boxes_mod.boxes_mask(boxes, width, height), reference_mask(boxes, width, height)):
+            print(f"mask mismatch in case {case} ({len(boxes)} boxes, {width}x{height})")
+            return 1
+        merged_total += len(boxes) - len(expected)
+    print(f"{args.cases} cases identical ({merged_total} boxes merged away in total)")
+
+    if args.timing:
+        for n in (300, 900, 1800):
+            boxes = detection_boxes(random.Random(n), n, 4096)
+            outputs = []
+            for name, fn in (("merge_boxes", boxes_mod.merge_boxes),
+                             ("merge_boxes_vectorized", boxes_mod.merge_boxes_vectorized)):
+                start = time.perf_counter()
+                outputs.append(fn(boxes, 0.5))
+                print(f"{n:>5} boxes  {name:<24} {time.perf_counter() - start:.3f}s")
+            if not same_boxes(*outputs):
+                print(f"merge mismatch on {n} detection-like boxes")
+                return 1
+
+    print("merge equivalence check passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""本地 provider 替身：模拟 bianxie / openrouter 的 OpenAI 兼容 chat/completions 接口
+
+- 图像模型（模型名含 "image" 或请求 modalities 含 "image"）返回预置 PNG：
+  同时给出 openrouter 风格的 message.images 与 bianxie 风格的 markdown data URL；
+- 其它模型返回预置 SVG（```svg 代码块），支持 stream=true 的 SSE 分块输出；
+- latency / jitter 秒级可调，usage 中给出估算的 token 数。
+"""
+import base64
+import io
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_STREAM_CHUNK = 512
+
+
+class MockProvider:
+    """在后台线程运行的本地 HTTP 服务"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, jitter: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.image_png = b""
+        self.svg_code = ""
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def set_responses(self, image=None, svg_code: str = None):
+        """设置预置响应：image 为 PIL 图或 PNG 字节"""
+        if image is not None:
+            if not isinstance(image, bytes):
+                buf = io.BytesIO()
+                image.save(buf, format="PNG")
+                image = buf.getvalue()
+            self.image_png = image
+        if svg_code is not None:
+            self.svg_code = svg_code
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _sleep(self):
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _handler(self):
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status: int, payload: dict):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    self._send_json(200, {"object": "list", "data": [
+                        {"id": "mock-image-model", "object": "model"}, {"id": "mock-svg-model", "object": "model"},
+                    ]})
+                else:
+                    self._send_json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": "not found"}})
+                    return
+                try:
+                    request = json.loads(raw or b"{}")
+                except ValueError:
+                    self._send_json(400, {"error": {"message": "invalid JSON body"}})
+                    return
+                with provider._lock:
+                    provider.requests += 1
+                provider._sleep()
+
+                model = request.get("model", "")
+                wants_image = "image" in model or "image" in (request.get("modalities") or [])
+                usage = {"prompt_tokens": len(raw) // 4}
+                if wants_image:
+                    data_url = "data:image/png;base64," + base64.b64encode(provider.image_png).decode()
+                    message = {
+                        "role": "assistant",
+                        "content": f"![image]({data_url})",
+                        "images": [{"type": "image_url", "image_url": {"url": data_url}}],
+                    }
+                    usage["completion_tokens"] = 1290
+                else:
+                    content = f"```svg\n{provider.svg_code}\n```"
+                    usage["completion_tokens"] = len(content) // 4
+                    if request.get("stream"):
+                        self._stream(model, content)
+                        return
+                    message = {"role": "assistant", "content": content}
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                self._send_json(200, {
+                    "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+                    "usage": usage,
+                })
+
+            def _stream(self, model: str, content: str):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for start in range(0, len(content), _STREAM_CHUNK):
+                    chunk = {
+                        "object": "chat.completion.chunk", "model": model,
+                        "choices": [{"index": 0, "delta": {"content": content[start:start + _STREAM_CHUNK]}}],
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                done = {"object": "chat.completion.chunk", "model": model,
+                        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                self.wfile.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode())
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
@@ -0,0 +1,104 @@
+"""流水线冒烟测试：PipelineRunner 跑通 Stage 1 → 5（含保存），不访问网络、不加载模型
+
+    python benchmarks/pipeline_smoke.py [--jobs 3] [--cases small,medium] [--optimize-iterations 1]
+
+autofigure2 由 stub_upstream 替代（LLM 请求发往本地 MockProvider），SAM3 / RMBG 前向用
+固定检测结果替代（同 run_benchmark.py）。替身只存在于本进程，因此 CPU 阶段使用线程池执行。
+检查每个任务都无错误、保存的 SVG 存在且每个占位符都已替换为图标；任一失败时退出码为 1。
+"""
+import argparse
+import importlib
+import os
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from fixtures import CASES, make_figure, make_svg_template, method_text
+from mock_provider import MockProvider
+from run_benchmark import PACKAGE_NAME, install_model_stubs, load_plugin
+import stub_upstream
+
+# 模板中的占位 rect；替换后的 <image> / <use> 沿用占位符 id，不算遗留
+_PLACEHOLDER_RE = re.compile(r'<rect\b[^>]*?\sid\s*=\s*["\']AF\d+["\']')
+
+
+def check(result: dict, n_icons: int) -> list:
+    """-> 问题列表（空表示通过）"""
+    if result["error"]:
+        return [result["error"]]
+    problems = []
+    path = Path(result["filepath"] or "")
+    if not path.is_file():
+        return [f"saved SVG missing: {path}"]
+    svg_code = path.read_text(encoding="utf-8")
+    if _PLACEHOLDER_RE.search(svg_code):
+        problems.append("placeholders left in the final SVG")
+    embedded = svg_code.count("data:image/")
+    if embedded == 0 or embedded > n_icons:
+        problems.append(f"expected 1..{n_icons} embedded icons, found {embedded}")
+    for stage in ("stage1", "stage2", "stage3", "stage4", "stage5", "save"):
+        if stage not in result["metrics"]:
+            problems.append(f"no metrics for {stage}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AutoFigure pipeline smoke test")
+    parser.add_argument("--jobs", type=int, default=3)
+    parser.add_argument("--cases", default="small,medium")
+    parser.add_argument("--optimize-iterations", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.05, help="mock provider latency per request (s)")
+    args = parser.parse_args(argv)
+
+    cases = [c for c in CASES if c[0] in set(args.cases.split(","))]
+    if not cases:
+        parser.error(f"unknown cases: {args.cases}")
+
+    with tempfile.TemporaryDirectory(prefix="af_smoke_") as root:
+        work_dir = Path(root)
+        os.environ["AF_CACHE_DIR"] = str(work_dir / "cache")
+        stub_upstream.install()
+        load_plugin()
+        pipeline = importlib.import_module(f"{PACKAGE_NAME}.utils.pipeline")
+
+        # 所有任务共用一个 MockProvider，因此每轮只跑同一用例的任务
+        detections_ref = {"detections": []}
+        install_model_stubs(detections_ref)
+        failures = 0
+        with MockProvider(latency=args.latency) as provider:
+            for name, width, height, n_icons in cases:
+                figure, detections = make_figure(width, height, n_icons)
+                provider.set_responses(image=figure, svg_code=make_svg_template(width, height, detections))
+                detections_ref["detections"] = detections
+                jobs = [{
+                    "method_text": method_text(n_icons) + f" (job {i})",
+                    "provider": "openrouter", "api_key": "mock-key",
+                    "stage1": {"base_url": provider.base_url, "use_cache": False},
+                    "stage4": {"base_url": provider.base_url, "use_cache": False,
+                               "optimize_iterations": args.optimize_iterations},
+                    "save": {"filename_prefix": f"smoke_{name}_{i}", "output_dir": str(work_dir / "output")},
+                } for i in range(args.jobs)]
+
+                start = time.perf_counter()
+                results = pipeline.PipelineRunner(cpu_workers=2, io_workers=4, cpu_executor="thread").run(jobs)
+                elapsed = time.perf_counter() - start
+                for i, result in enumerate(results):
+                    problems = check(result, n_icons)
+                    failures += bool(problems)
+                    status = "ok" if not problems else "FAIL: " + "; ".join(problems)
+                    size = Path(result["filepath"]).stat().st_size / 1024 if not problems else 0
+                    print(f"{name:<8} job {i}  {status}  svg={size:.1f} KB  "
+                          f"stages={', '.join(f'{k}={v:.2f}s' for k, v in result['timings'].items())}")
+                    if result["traceback"]:
+                        print(result["traceback"])
+                print(f"{name:<8} {len(jobs)} jobs in {elapsed:.2f}s")
+            print(f"[AutoFigure] mock provider served {provider.requests} requests")
+
+    print("pipeline smoke test", "FAILED" if failures else "passed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
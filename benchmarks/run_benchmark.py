@@ -0,0 +1,231 @@
+"""离线端到端基准测试：六个节点 + 本地 provider 替身，不访问网络
+
+    python benchmarks/run_benchmark.py [--cases small,medium] [--repeat 3] [--latency 0.2] [--json report.json]
+
+每个用例依次运行 Stage 1 文生图、Stage 2 分割、Stage 3 图标提取、Stage 4 SVG 生成、
+Stage 5 图标替换与保存，报告各阶段的耗时（中位数）、峰值 RSS、临时文件写入量与 SVG 大小。
+
+默认用固定检测结果替代 SAM3 / RMBG 模型前向（--real-models 使用真实模型），
+这样测到的是插件自身的热点路径：张量转换、框合并、裁切、填充、替换、预览渲染。
+运行需要 autofigure2 位于插件目录的上一级（与 ComfyUI 中的部署方式一致）；
+未部署时加 --stub-upstream，用 stub_upstream.py 替代上游入口（LLM 请求仍发往 MockProvider）。
+"""
+import argparse
+import importlib
+import importlib.util
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from fixtures import CASES, make_figure, make_svg_template, method_text
+from mock_provider import MockProvider
+
+PLUGIN_DIR = Path(__file__).resolve().parent.parent
+PACKAGE_NAME = "ComfyUI_AutoFigure"
+STAGE_NAMES = ["stage1_generate", "stage2_segment", "stage3_extract", "stage4_svg", "stage5_replace", "save"]
+
+
+class PeakRSS:
+    """后台采样当前进程 RSS，记录区间峰值（字节）"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def current() -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            pass
+        try:
+            import psutil
+            return psutil.Process().memory_info().rss
+        except ImportError:
+            import resource
+            scale = 1 if sys.platform == "darwin" else 1024
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def load_plugin():
+    """按 ComfyUI 的方式把插件目录作为包加载"""
+    spec = importlib.util.spec_from_file_location(
+        PACKAGE_NAME, str(PLUGIN_DIR / "__init__.py"), submodule_search_locations=[str(PLUGIN_DIR)]
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE_NAME] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def install_model_stubs(detections_ref: dict):
+    """用固定检测结果替代模型前向：SAM3 返回用例的真实框，RMBG 以非白像素作为 alpha"""
+    sam3_engine = importlib.import_module(f"{PACKAGE_NAME}.utils.sam3_engine")
+    rmbg_engine = importlib.import_module(f"{PACKAGE_NAME}.utils.rmbg_engine")
+
+    def detect(image, prompts, min_score=0.5, max_masks=32, **kwargs):
+        return [dict(d) for d in detections_ref["detections"] if d["score"] >= min_score]
+
+    def remove_background(crops, **kwargs):
+        results = []
+        for crop in crops:
+            rgb = np.asarray(crop.convert("RGB"))
+            rgba = np.empty(rgb.shape[:2] + (4,), dtype=np.uint8)
+            rgba[:, :, :3] = rgb
+            rgba[:, :, 3] = np.where(rgb.min(axis=2) < 245, 255, 0)
+            results.append(rgba)
+        return results
+
+    sam3_engine.detect = detect
+    rmbg_engine.remove_background = remove_background
+
+
+def run_case(nodes: dict, provider: MockProvider, work_dir: Path, case, args) -> dict:
+    name, width, height, n_icons = case
+    figure, detections = make_figure(width, height, n_icons, seed=args.seed)
+    provider.set_responses(image=figure, svg_code=make_svg_template(width, height, detections))
+    args.detections_ref["detections"] = detections
+
+    common = {"provider": args.provider, "api_key": "mock-key", "base_url": provider.base_url}
+    steps = [
+        ("stage1_generate", lambda s: nodes["generator"].generate(
+            method_text(n_icons), common["provider"], common["api_key"], base_url=common["base_url"],
+            image_model="mock-image-model", use_cache=False)),
+        ("stage2_segment", lambda s: nodes["segmenter"].segment(s["stage1_generate"][0], "icon")),
+        ("stage3_extract", lambda s: nodes["extractor"].extract(
+            s["stage1_generate"][0], s["stage2_segment"][1])),
+        ("stage4_svg", lambda s: nodes["svg_generator"].generate(
+            s["stage1_generate"][0], s["stage2_segment"][0], s["stage2_segment"][1],
+            common["provider"], common["api_key"], base_url=common["base_url"], svg_model="mock-svg-model",
+            optimize_iterations=args.optimize_iterations, use_cache=False)),
+        ("stage5_replace", lambda s: nodes["svg_replacer"].replace(
+            s["stage4_svg"][0], s["stage2_segment"][1], s["stage4_svg"][2], icon_set=s["stage3_extract"][3])),
+        ("save", lambda s: nodes["svg_saver"].save(
+            s["stage5_replace"][0], f"bench_{name}", output_dir=str(work_dir / "output"))),
+    ]
+
+    samples = {stage: {"wall_s": [], "peak_rss_mb": [], "temp_written_bytes": []} for stage, _ in steps}
+    svg_bytes = 0
+    for _ in range(args.repeat):
+        state = {}
+        for stage, fn in steps:
+            with PeakRSS() as rss:
+                start = time.perf_counter()
+                state[stage] = fn(state)
+                elapsed = time.perf_counter() - start
+            samples[stage]["wall_s"].append(elapsed)
+            samples[stage]["peak_rss_mb"].append(rss.peak / 2 ** 20)
+            # 工作区在节点返回时即被删除，写入量取节点自身的 metrics 输出（最后一个返回值）
+            samples[stage]["temp_written_bytes"].append(state[stage][-1]["temp_io"]["written_bytes"])
+        svg_bytes = len(state["stage5_replace"][0].encode("utf-8"))
+
+    return {
+        "case": name, "width": width, "height": height, "icons": n_icons,
+        "svg_bytes": svg_bytes,
+        "stages": {
+            stage: {
+                "wall_s": round(statistics.median(v["wall_s"]), 4),
+                "peak_rss_mb": round(max(v["peak_rss_mb"]), 1),
+                "temp_written_bytes": int(statistics.median(v["temp_written_bytes"])),
+            }
+            for stage, v in samples.items()
+        },
+    }
+
+
+def print_report(report: list):
+    header = f"{'case':<8} {'stage':<16} {'wall(s)':>9} {'peakRSS(MB)':>12} {'temp(KB)':>10}"
+    print(header)
+    print("-" * len(header))
+    for case in report:
+        for stage, m in case["stages"].items():
+            print(f"{case['case']:<8} {stage:<16} {m['wall_s']:>9.4f} {m['peak_rss_mb']:>12.1f} "
+                  f"{m['temp_written_bytes'] / 1024:>10.1f}")
+        total = sum(m["wall_s"] for m in case["stages"].values())
+        print(f"{case['case']:<8} {'total':<16} {total:>9.4f}   svg={case['svg_bytes'] / 1024:.1f} KB")
+        print()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AutoFigure offline benchmark")
+    parser.add_argument("--cases", default=",".join(c[0] for c in CASES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.0, help="mock provider latency per request (s)")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--provider", default="openrouter", choices=["openrouter", "bianxie"])
+    parser.add_argument("--optimize-iterations", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--real-models", action="store_true", help="run real SAM3 / RMBG instead of fixture stand-ins")
+    parser.add_argument("--stub-upstream", action="store_true",
+                        help="use the autofigure2 stand-in from stub_upstream.py")
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args(argv)
+
+    wanted = set(args.cases.split(","))
+    cases = [c for c in CASES if c[0] in wanted]
+    if not cases:
+        parser.error(f"unknown cases: {args.cases}")
+
+    with tempfile.TemporaryDirectory(prefix="af_bench_") as root:
+        work_dir = Path(root)
+        # 临时文件、结果缓存与输出都落在 work_dir 中，结束后一并删除
+        (work_dir / "tmp").mkdir()
+        tempfile.tempdir = str(work_dir / "tmp")
+        os.environ["AF_CACHE_DIR"] = str(work_dir / "cache")
+
+        if args.stub_upstream:
+            import stub_upstream
+            stub_upstream.install()
+        load_plugin()
+        args.detections_ref = {"detections": []}
+        if not args.real_models:
+            install_model_stubs(args.detections_ref)
+        nodes = {
+            "generator": importlib.import_module(f"{PACKAGE_NAME}.nodes.generator").AF_LLM_ImageGenerator(),
+            "segmenter": importlib.import_module(f"{PACKAGE_NAME}.nodes.segmenter").AF_SAM3_Segment(),
+            "extractor": importlib.import_module(f"{PACKAGE_NAME}.nodes.extractor").AF_IconExtractor(),
+            "svg_generator": importlib.import_module(f"{PACKAGE_NAME}.nodes.svg_generator").AF_SVG_TemplateGenerator(),
+            "svg_replacer": importlib.import_module(f"{PACKAGE_NAME}.nodes.svg_replacer").AF_SVG_IconReplacer(),
+            "svg_saver": importlib.import_module(f"{PACKAGE_NAME}.nodes.svg_saver").AF_SVG_Saver(),
+        }
+
+        report = []
+        with MockProvider(latency=args.latency, jitter=args.jitter) as provider:
+            for case in cases:
+                report.append(run_case(nodes, provider, work_dir, case, args))
+            print(f"[AutoFigure] mock provider served {provider.requests} requests")
+
+    print_report(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return report
+
+
+if __name__ == "__main__":
+    main()
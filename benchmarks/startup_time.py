@@ -0,0 +1,64 @@
+"""插件注册耗时：在全新子进程中按 ComfyUI 的方式加载插件包，测量导入时间
+
+    python benchmarks/startup_time.py [--runs 5] [--preload numpy,PIL]
+
+--preload 先导入 ComfyUI 启动时本来就会加载的模块，只统计插件自身增加的耗时。
+同时检查注册完成后重依赖（torch / autofigure2 / transformers / cairosvg ...）是否仍未被导入。
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PLUGIN_DIR = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ["torch", "autofigure2", "transformers", "easyocr", "paddleocr", "cairosvg",
+                 "requests", "openai", "google.generativeai", "lxml"]
+
+_CHILD = r"""
+import importlib, importlib.util, json, sys, time
+for name in {preload!r}:
+    importlib.import_module(name)
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location(
+    "ComfyUI_AutoFigure", {init!r}, submodule_search_locations=[{plugin!r}]
+)
+module = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = module
+spec.loader.exec_module(module)
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "nodes": len(module.NODE_CLASS_MAPPINGS),
+    "heavy_loaded": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure_once(preload: list) -> dict:
+    code = _CHILD.format(preload=preload, init=str(PLUGIN_DIR / "__init__.py"),
+                         plugin=str(PLUGIN_DIR), heavy=HEAVY_MODULES)
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AutoFigure plugin startup time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--preload", default="", help="comma separated modules imported before the plugin")
+    args = parser.parse_args(argv)
+    preload = [m for m in args.preload.split(",") if m]
+
+    results = [measure_once(preload) for _ in range(args.runs)]
+    times_ms = [r["seconds"] * 1000 for r in results]
+    heavy = sorted({m for r in results for m in r["heavy_loaded"]})
+    print(f"nodes registered : {results[0]['nodes']}")
+    print(f"startup (median) : {statistics.median(times_ms):.1f} ms  "
+          f"(min {min(times_ms):.1f}, max {max(times_ms):.1f}, runs {args.runs})")
+    print(f"heavy modules    : {', '.join(heavy) if heavy else 'none'}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""autofigure2 替身：实现插件用到的上游入口，LLM 请求发往 MockProvider
+
+只用于基准测试与冒烟测试，在没有部署 autofigure2 的环境中也能跑通 Stage 1 → 5：
+
+    import stub_upstream
+    stub_upstream.install()   # 之后插件中的 autofigure2 即为本替身
+
+入口函数沿用上游的 `xxx_path` 参数形式（文件交接），输出写到 output_path 并返回路径；
+segment_with_sam3 / replace_icons_in_svg 只在远程 SAM 后端、autofigure2 嵌入后端中使用，未提供。
+"""
+import base64
+import json
+import re
+import sys
+import types
+
+import requests
+
+PROVIDER_CONFIGS = {
+    "openrouter": {
+        "base_url": "https://openrouter.ai/api/v1",
+        "default_image_model": "mock-image-model",
+        "default_svg_model": "mock-svg-model",
+    },
+    "bianxie": {
+        "base_url": "https://api.bianxie.ai/v1",
+        "default_image_model": "mock-image-model",
+        "default_svg_model": "mock-svg-model",
+    },
+}
+
+_DATA_URL_RE = re.compile(r'data:image/\w+;base64,([A-Za-z0-9+/=]+)')
+_SVG_BLOCK_RE = re.compile(r'```svg\s*(.*?)```', re.S)
+_VIEWBOX_RE = re.compile(r'viewBox\s*=\s*["\']\s*[\d.+-]+[\s,]+[\d.+-]+[\s,]+([\d.]+)[\s,]+([\d.]+)')
+_TIMEOUT = 60
+
+
+def _chat(base_url, api_key, model, prompt, stream_callback=None):
+    """POST chat/completions -> message dict（stream_callback 不为空时按 SSE 流式读取）"""
+    response = requests.post(
+        f"{base_url.rstrip('/')}/chat/completions",
+        headers={"Authorization": f"Bearer {api_key}"},
+        json={"model": model, "messages": [{"role": "user", "content": prompt}],
+              "stream": stream_callback is not None},
+        stream=stream_callback is not None,
+        timeout=_TIMEOUT,
+    )
+    response.raise_for_status()
+    if stream_callback is None:
+        return response.json()["choices"][0]["message"]
+    parts = []
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data: ") or line == "data: [DONE]":
+            continue
+        text = json.loads(line[len("data: "):])["choices"][0]["delta"].get("content")
+        if text:
+            parts.append(text)
+            stream_callback(text)
+    return {"content": "".join(parts)}
+
+
+def _svg_from(message) -> str:
+    content = message.get("content") or ""
+    match = _SVG_BLOCK_RE.search(content)
+    return (match.group(1) if match else content).strip()
+
+
+def _write_svg(output_path, svg_code):
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(svg_code)
+    return output_path
+
+
+def generate_figure_from_method(method_text, output_path, api_key, model, base_url, provider,
+                                use_reference_image=False, reference_image_path=None):
+    message = _chat(base_url, api_key, model, method_text)
+    urls = [item["image_url"]["url"] for item in message.get("images") or []]
+    match = _DATA_URL_RE.search(urls[0] if urls else message.get("content") or "")
+    if match is None:
+        raise RuntimeError("no image in provider response")
+    with open(output_path, 'wb') as f:
+        f.write(base64.b64decode(match.group(1)))
+    return output_path
+
+
+def generate_svg_template(figure_path, samed_path, boxlib_path, output_path, api_key, model, base_url,
+                          provider, placeholder_mode="label", stream_callback=None):
+    prompt = f"Reproduce the figure as SVG (placeholder_mode={placeholder_mode})."
+    return _write_svg(output_path, _svg_from(_chat(base_url, api_key, model, prompt, stream_callback)))
+
+
+def optimize_svg_with_llm(figure_path, samed_path, final_svg_path, output_path, api_key, model, base_url,
+                          provider, max_iterations=2, skip_base64_validation=False, stream_callback=None):
+    with open(final_svg_path, 'r', encoding='utf-8') as f:
+        prompt = f"Improve this SVG:\n{f.read()}"
+    return _write_svg(output_path, _svg_from(_chat(base_url, api_key, model, prompt, stream_callback)))
+
+
+def get_svg_dimensions(svg_code):
+    match = _VIEWBOX_RE.search(svg_code)
+    if match is None:
+        return None, None
+    return float(match.group(1)), float(match.group(2))
+
+
+def calculate_scale_factors(figure_width, figure_height, svg_width, svg_height):
+    return figure_width / svg_width, figure_height / svg_height
+
+
+def install():
+    """注册为 sys.modules["autofigure2"]（已导入过真实模块时不覆盖）"""
+    if "autofigure2" in sys.modules:
+        return sys.modules["autofigure2"]
+    module = types.ModuleType("autofigure2")
+    module.__doc__ = "AutoFigure upstream stand-in (benchmarks/stub_upstream.py)"
+    for name in ("PROVIDER_CONFIGS", "generate_figure_from_method", "generate_svg_template",
+                 "optimize_svg_with_llm", "get_svg_dimensions", "calculate_scale_factors"):
+        setattr(module, name, globals()[name])
+    sys.modules["autofigure2"] = module
+    return module
@@ -1,15 +1,13 @@
-import os
-import sys
-import json
-import tempfile
-import uuid
-from pathlib import Path
+import numpy as np
 
-import torch
-
-sys.path.insert(0, str(Path(__file__).parent.parent))
-from autofigure2 import crop_and_remove_background
 from ..utils.adapters import TypeAdapter
+from ..utils.bridge import to_json
+from ..utils.constants import DEFAULT_RMBG_BATCH_SIZE, DEFAULT_DEDUPE_DISTANCE, DEFAULT_CPU_THREADS, RMBG_BACKENDS
+from ..utils.icon_set import IconSet
+from ..utils.phash import group_duplicates
+from ..utils.metrics import instrumented, phase
+from ..utils import rmbg_engine
+from ..utils.lazy import torch
 
 class AF_IconExtractor:
     """AutoFigure 步骤三：裁切 + RMBG2 去背景"""
@@ -22,93 +20,97 @@ class AF_IconExtractor:
                 "boxlib": ("JSON",),  # 来自 SAM3 节点的 JSON
             },
             "optional": {
+                # RMBG 模型：HF 仓库名（如 briaai/RMBG-2.0）或本地模型目录，空则用 AF_RMBG_MODEL / 默认模型；
+                # 由插件内置推理加载，不再传给上游函数
                 "rmbg_model_path": ("STRING", {"default": ""}),
+                "rmbg_batch_size": ("INT", {"default": DEFAULT_RMBG_BATCH_SIZE, "min": 1, "max": 64}),
+                # 无 GPU 时可选 cpu_int8（torch 动态量化）或 onnx / onnx_int8（ONNX Runtime，首次使用时导出并缓存）
+                "rmbg_backend": (RMBG_BACKENDS, {"default": "torch"}),
+                "cpu_threads": ("INT", {"default": DEFAULT_CPU_THREADS, "min": 0, "max": 256}),
+                # 小图标按 256/512/768 档位输入 RMBG（更快；模型按 1024 训练，掩码可能与上游略有差异）
+                "rmbg_size_buckets": ("BOOLEAN", {"default": False}),
+                # 关闭后 icons_rgba / icon_masks 仅输出占位图，下游请连接 icon_set
+                "pad_icons_batch": ("BOOLEAN", {"default": True}),
+                # 感知哈希去重（有损，需手动开启）：汉明距离不超过 dedupe_distance 且颜色、宽高比相近
+                # 视为同一图标，组内图标共用首个图标的去背景结果
+                "dedupe_icons": ("BOOLEAN", {"default": False}),
+                "dedupe_distance": ("INT", {"default": DEFAULT_DEDUPE_DISTANCE, "min": 0, "max": 16}),
             }
         }
     
-    RETURN_TYPES = ("IMAGE", "MASK", "JSON")
-    RETURN_NAMES = ("icons_rgba", "icon_masks", "icon_infos")
+    RETURN_TYPES = ("IMAGE", "MASK", "JSON", "ICON_SET", "JSON")
+    RETURN_NAMES = ("icons_rgba", "icon_masks", "icon_infos", "icon_set", "metrics")
     FUNCTION = "extract"
     CATEGORY = "AutoFigure/Stage3"
     
-    def extract(self, original_image, boxlib, rmbg_model_path=""):
-        # 保存原图
+    @instrumented("stage3")
+    def extract(self, original_image, boxlib, rmbg_model_path="", rmbg_batch_size=DEFAULT_RMBG_BATCH_SIZE,
+                pad_icons_batch=True, dedupe_icons=False, dedupe_distance=DEFAULT_DEDUPE_DISTANCE,
+                rmbg_backend="torch", cpu_threads=DEFAULT_CPU_THREADS, rmbg_size_buckets=False):
         pil_img = TypeAdapter.tensor_to_pil(original_image)
-        temp_img = os.path.join(tempfile.gettempdir(), f"af_ext_{uuid.uuid4().hex}.png")
-        pil_img.save(temp_img)
+        boxes = to_json(boxlib).get("boxes", [])
         
-        # 保存 boxlib
-        temp_boxlib = os.path.join(tempfile.gettempdir(), f"af_box_{uuid.uuid4().hex}.json")
-        with open(temp_boxlib, 'w', encoding='utf-8') as f:
-            json.dump(boxlib, f, ensure_ascii=False, indent=2)
+        # 裁切所有 box；开启去重时重复图标（感知哈希相近）只保留每组首个送去背景
+        with phase("crop"):
+            icon_infos, crops = self._crop_boxes(pil_img, boxes)
+        if dedupe_icons:
+            with phase("dedupe"):
+                groups, representatives = group_duplicates(crops, dedupe_distance)
+        else:
+            groups, representatives = list(range(len(crops))), list(range(len(crops)))
+        for info, g in zip(icon_infos, groups):
+            info["group"] = g
         
-        # 输出目录
-        output_dir = os.path.join(tempfile.gettempdir(), f"af_icons_{uuid.uuid4().hex}")
+        # 一次批量 RMBG2 去背景（模型常驻，结果留在内存）
+        with phase("model"):
+            rgba_list = rmbg_engine.remove_background(
+                [crops[i] for i in representatives],
+                model_id=rmbg_model_path if rmbg_model_path else None,
+                batch_size=rmbg_batch_size,
+                backend=rmbg_backend,
+                threads=cpu_threads,
+                size_buckets=rmbg_size_buckets
+            )
         
-        # 调用原函数
-        icon_infos = crop_and_remove_background(
-            image_path=temp_img,
-            boxlib_path=temp_boxlib,
-            output_dir=output_dir,
-            rmbg_model_path=rmbg_model_path if rmbg_model_path else None
-        )
+        # 变长图标集合：各图标保持原始尺寸，打包为一块 uint8 缓冲区，重复图标共享像素
+        icon_set = IconSet.from_unique(rgba_list, groups)
         
-        if not icon_infos:
-            # 返回空
+        if not icon_infos or not pad_icons_batch:
+            # 返回空（或未开启 padding batch 时的占位输出）
             empty_img = torch.zeros((1, 64, 64, 4))  # RGBA
             empty_mask = torch.zeros((1, 64, 64))
-            return (empty_img, empty_mask, [])
-        
-        # 加载所有图标为 batch [N, H, W, C]
-        icons = []
-        masks = []
-        valid_infos = []
-        
-        for info in icon_infos:
-            try:
-                icon = Image.open(info["nobg_path"])
-                # 转换为 RGBA tensor [H, W, 4]
-                icon_np = np.array(icon.convert("RGBA")).astype(np.float32) / 255.0
-                icon_tensor = torch.from_numpy(icon_np)
-                
-                # 从 alpha 通道生成 mask
-                alpha = icon_np[:, :, 3]
-                mask_tensor = torch.from_numpy(alpha).unsqueeze(0)  # [1, H, W]
-                
-                icons.append(icon_tensor)
-                masks.append(mask_tensor)
-                valid_infos.append(info)
-            except Exception as e:
-                print(f"[AutoFigure] Skip invalid icon: {e}")
-                continue
-        
-        if not icons:
-            empty_img = torch.zeros((1, 64, 64, 4))
-            empty_mask = torch.zeros((1, 64, 64))
-            return (empty_img, empty_mask, [])
+            return (empty_img, empty_mask, icon_infos, icon_set)
         
-        # 统一尺寸（取最大尺寸 padding 或保持原样，这里直接 stack，ComfyUI 的 batch 需要相同尺寸）
-        # 实际使用时应保持原始尺寸列表，通过 JSON 传递
-        max_h = max([i.shape[0] for i in icons])
-        max_w = max([i.shape[1] for i in icons])
-        
-        padded_icons = []
-        padded_masks = []
-        for icon, mask in zip(icons, masks):
-            h, w = icon.shape[0], icon.shape[1]
-            if h != max_h or w != max_w:
-                # 创建 padding
-                new_icon = torch.zeros((max_h, max_w, 4))
-                new_mask = torch.zeros((1, max_h, max_w))
-                new_icon[:h, :w, :] = icon
-                new_mask[:, :h, :w] = mask
-                padded_icons.append(new_icon)
-                padded_masks.append(new_mask)
-            else:
-                padded_icons.append(icon)
-                padded_masks.append(mask)
-        
-        icons_batch = torch.stack(padded_icons, dim=0)  # [N, H, W, 4]
-        masks_batch = torch.stack(padded_masks, dim=0)  # [N, 1, H, W]
-        
-        return (icons_batch, masks_batch.squeeze(1), valid_infos)
+        # 兼容旧工作流：按最大尺寸 padding 为 IMAGE batch [N, H, W, 4] 与 MASK [N, H, W]
+        with phase("pad"):
+            icons_np, masks_np = icon_set.to_padded(
+                np.uint8 if TypeAdapter.image_dtype() == torch.uint8 else np.float32
+            )
+        return (torch.from_numpy(icons_np), torch.from_numpy(masks_np), icon_infos, icon_set)
+    
+    @staticmethod
+    def _crop_boxes(pil_img, boxes):
+        """boxlib 中的 box -> (icon_infos, 裁切图列表)
+
+        越界坐标裁剪到图内；退化的 box 至少保留 1 像素，保证图标与 boxlib 按序号一一对应。
+        """
+        infos, crops = [], []
+        for i, box in enumerate(boxes):
+            x1 = min(max(0, int(box["x1"])), pil_img.width - 1)
+            y1 = min(max(0, int(box["y1"])), pil_img.height - 1)
+            x2 = max(min(pil_img.width, int(box["x2"])), x1 + 1)
+            y2 = max(min(pil_img.height, int(box["y2"])), y1 + 1)
+            label = box.get("label", f"<AF>{i+1:02d}")
+            infos.append({
+                "id": box.get("id", i),
+                "label": label,
+                "label_clean": label.replace("<", "").replace(">", ""),
+                "x1": x1,
+                "y1": y1,
+                "x2": x2,
+                "y2": y2,
+                "width": x2 - x1,
+                "height": y2 - y1,
+            })
+            crops.append(pil_img.crop((x1, y1, x2, y2)))
+        return infos, crops
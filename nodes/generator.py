@@ -1,17 +1,61 @@
-import os
-import sys
+import io
+import re
 import json
-import tempfile
-import uuid
-from pathlib import Path
-
-import torch
+import asyncio
+import functools
+import contextvars
 from PIL import Image
 
-# 引入原项目
-sys.path.insert(0, str(Path(__file__).parent.parent))
-from autofigure2 import generate_figure_from_method, PROVIDER_CONFIGS
+# 原项目与 torch 延迟到首次执行时导入（插件目录已由包 __init__ 加入 sys.path）
+from ..utils.lazy import torch, autofigure2
 from ..utils.adapters import TypeAdapter
+from ..utils.bridge import StageHandoff, to_pil
+from ..utils.cache import ResultCache, make_key
+from ..utils.provider_client import get_client, run_coroutine_sync
+from ..utils.constants import DEFAULT_BATCH_CONCURRENCY, DEFAULT_UPLOAD_MAX_SIDE, DEFAULT_UPLOAD_TOKEN_BUDGET
+from ..utils.metrics import instrumented, phase
+from ..utils.workspace import scoped
+from ..utils.upload import prepare_upload
+
+# Stage 1 结果缓存：同一输入的重复运行直接返回已生成的图
+_figure_cache = ResultCache("stage1")
+
+
+def _cache_key(method_text, provider, base_url, image_model, use_reference, reference_image, temperature,
+               upload=(DEFAULT_UPLOAD_MAX_SIDE, DEFAULT_UPLOAD_TOKEN_BUDGET)):
+    config = autofigure2.PROVIDER_CONFIGS.get(provider, autofigure2.PROVIDER_CONFIGS["bianxie"])
+    ref = reference_image if use_reference and reference_image is not None else None
+    parts = [
+        "stage1",
+        method_text,
+        provider,
+        image_model or config["default_image_model"],
+        base_url or config["base_url"],
+        temperature,
+        ref,
+    ]
+    if ref is not None:
+        parts.append(list(upload))  # 参考图的上传尺寸会影响生成结果
+    return make_key(*parts)
+
+
+def split_batch(method_text, batch_mode):
+    """批量输入 -> method 文本列表"""
+    if batch_mode == "json":
+        items = json.loads(method_text)
+        if not isinstance(items, list):
+            raise ValueError("JSON batch must be an array of method texts")
+        texts = []
+        for i, item in enumerate(items):
+            if isinstance(item, dict):
+                if "method_text" not in item:
+                    raise ValueError(f"JSON batch item {i} is an object without \"method_text\"")
+                item = item["method_text"]
+            texts.append(str(item))
+        return texts
+    parts = re.split(r'^\s*---\s*$', method_text, flags=re.M)
+    return [p.strip() for p in parts if p.strip()]
+
 
 class AF_LLM_ImageGenerator:
     """AutoFigure 步骤一：Paper Method -> Figure PNG"""
@@ -30,58 +74,175 @@ class AF_LLM_ImageGenerator:
                 "use_reference": ("BOOLEAN", {"default": False}),
                 "reference_image": ("IMAGE",),
                 "temperature": ("FLOAT", {"default": 0.7, "min": 0.0, "max": 1.0}),
+                "use_cache": ("BOOLEAN", {"default": True}),
+                # 批量模式：json 为字符串数组；separator 以单独一行 --- 分隔多段 method
+                "batch_mode": (["off", "json", "separator"], {"default": "off"}),
+                "max_concurrency": ("INT", {"default": DEFAULT_BATCH_CONCURRENCY, "min": 1, "max": 64}),
+                # 参考图上传：按最长边 / 视觉 token 预算缩小（0 不限制）
+                "upload_max_side": ("INT", {"default": DEFAULT_UPLOAD_MAX_SIDE, "min": 0, "max": 8192}),
+                "upload_token_budget": ("INT", {"default": DEFAULT_UPLOAD_TOKEN_BUDGET, "min": 0, "max": 100000}),
             }
         }
     
-    RETURN_TYPES = ("IMAGE", "JSON")
-    RETURN_NAMES = ("figure_image", "metadata")
+    @classmethod
+    def IS_CHANGED(s, method_text, provider, api_key="", base_url="", image_model="",
+                   use_reference=False, reference_image=None, temperature=0.7, use_cache=True,
+                   upload_max_side=DEFAULT_UPLOAD_MAX_SIDE, upload_token_budget=DEFAULT_UPLOAD_TOKEN_BUDGET,
+                   **kwargs):
+        if not use_cache:
+            return float("nan")  # 关闭缓存时每次都重新生成
+        return _cache_key(method_text, provider, base_url, image_model,
+                          use_reference, reference_image, temperature,
+                          (upload_max_side, upload_token_budget))
+    
+    RETURN_TYPES = ("IMAGE", "JSON", "JSON")
+    RETURN_NAMES = ("figure_image", "metadata", "metrics")
     FUNCTION = "generate"
     CATEGORY = "AutoFigure/Stage1"
     
+    @instrumented("stage1")
+    @scoped
     def generate(self, method_text, provider, api_key, base_url="", 
-                image_model="", use_reference=False, reference_image=None, temperature=0.7):
+                image_model="", use_reference=False, reference_image=None, temperature=0.7,
+                use_cache=True, batch_mode="off", max_concurrency=DEFAULT_BATCH_CONCURRENCY,
+                upload_max_side=DEFAULT_UPLOAD_MAX_SIDE, upload_token_budget=DEFAULT_UPLOAD_TOKEN_BUDGET):
+        
+        upload = (upload_max_side, upload_token_budget)
+        if batch_mode != "off":
+            return self._generate_batch(
+                split_batch(method_text, batch_mode), max_concurrency, provider, api_key, base_url,
+                image_model, use_reference, reference_image, temperature, use_cache, upload
+            )
+        
+        img, metadata = self._generate_one(method_text, provider, api_key, base_url, image_model,
+                                           use_reference, reference_image, temperature, use_cache, upload)
+        with phase("encode"):
+            tensor = TypeAdapter.pil_to_tensor(img)
+        return (tensor, json.dumps(metadata))
+    
+    def _generate_batch(self, texts, max_concurrency, *args):
+        """并发生成多张图；单项失败只记录在元数据中，不中止整批"""
+        
+        async def run_all():
+            semaphore = asyncio.Semaphore(max_concurrency)
+            loop = asyncio.get_running_loop()
+            
+            async def run_one(text):
+                async with semaphore:
+                    # 复制上下文，线程池中的调用仍计入本节点指标
+                    context = contextvars.copy_context()
+                    return await loop.run_in_executor(
+                        None, functools.partial(context.run, self._generate_one, text, *args)
+                    )
+            
+            return await asyncio.gather(*(run_one(t) for t in texts), return_exceptions=True)
+        
+        results = run_coroutine_sync(run_all())
+        
+        images, items = [], []
+        for i, result in enumerate(results):
+            if isinstance(result, BaseException):
+                print(f"[AutoFigure] Batch item {i} failed: {result}")
+                images.append(None)
+                items.append({"index": i, "status": "error", "error": str(result)})
+            else:
+                img, metadata = result
+                images.append(img.convert("RGB"))
+                items.append({"index": i, "status": "ok", "width": img.width, "height": img.height, **metadata})
+        
+        ok = [img for img in images if img is not None]
+        if not ok:
+            raise RuntimeError(f"All {len(texts)} batch items failed: {items[0]['error'] if items else 'empty batch'}")
+        
+        # ComfyUI batch 需同尺寸：按最大宽高白底 padding（左上对齐），失败项为纯白
+        max_w = max(img.width for img in ok)
+        max_h = max(img.height for img in ok)
+        dtype = TypeAdapter.image_dtype()
+        batch = torch.full((len(images), max_h, max_w, 3), 255 if dtype == torch.uint8 else 1.0, dtype=dtype)
+        for i, img in enumerate(images):
+            if img is not None:
+                batch[i, :img.height, :img.width] = TypeAdapter.pil_to_tensor(img, dtype)[0]
+        
+        metadata = {
+            "batch_size": len(images),
+            "succeeded": len(ok),
+            "failed": len(images) - len(ok),
+            "items": items,
+        }
+        return (batch, json.dumps(metadata))
+    
+    def _generate_one(self, method_text, provider, api_key, base_url, image_model,
+                      use_reference, reference_image, temperature, use_cache,
+                      upload=(DEFAULT_UPLOAD_MAX_SIDE, DEFAULT_UPLOAD_TOKEN_BUDGET)):
+        """生成单张图 -> (PIL, metadata)"""
+        
+        # 命中缓存则不再调用上游（无需 API Key）
+        key = _cache_key(method_text, provider, base_url, image_model,
+                         use_reference, reference_image, temperature, upload)
+        if use_cache:
+            with phase("cache"):
+                cached_path = _figure_cache.get(key, ".png")
+                metadata = _figure_cache.get_json(key) if cached_path else None
+            if metadata is not None:
+                metadata.update(path=str(cached_path), cached=True)
+                return (Image.open(cached_path), metadata)
         
         if not api_key:
             raise ValueError("API Key is required")
         
         # 获取配置
-        config = PROVIDER_CONFIGS.get(provider, PROVIDER_CONFIGS["bianxie"])
+        config = autofigure2.PROVIDER_CONFIGS.get(provider, autofigure2.PROVIDER_CONFIGS["bianxie"])
         base_url = base_url or config["base_url"]
         model = image_model or config["default_image_model"]
         
-        # 处理参考图
-        ref_path = None
+        handoff = StageHandoff("af_gen")
+        
+        # 处理参考图：缩小（批量模式下各项命中同一份缩小缓存），上游支持时内存直传
+        ref_kwargs = {"reference_image_path": None}
         if use_reference and reference_image is not None:
-            ref_pil = TypeAdapter.tensor_to_pil(reference_image)
-            ref_path = os.path.join(tempfile.gettempdir(), f"af_ref_{uuid.uuid4().hex}.png")
-            ref_pil.save(ref_path)
-        
-        # 临时输出路径
-        output_dir = os.path.join(tempfile.gettempdir(), f"af_gen_{uuid.uuid4().hex}")
-        os.makedirs(output_dir, exist_ok=True)
-        output_path = os.path.join(output_dir, "figure.png")
-        
-        # 调用原函数
-        result_path = generate_figure_from_method(
-            method_text=method_text,
-            output_path=output_path,
-            api_key=api_key,
-            model=model,
-            base_url=base_url,
-            provider=provider,
-            use_reference_image=use_reference,
-            reference_image_path=ref_path
-        )
-        
-        # 加载结果
-        img = Image.open(result_path)
-        tensor = TypeAdapter.pil_to_tensor(img)
+            with phase("upload"):
+                ref_up = prepare_upload(TypeAdapter.tensor_to_pil(reference_image), *upload)
+            ref_kwargs = handoff.upload(autofigure2.generate_figure_from_method, "reference_image_path", ref_up)
+        
+        # 调用原函数（经共享 provider 客户端：并发上限与限流重试）
+        with phase("llm"):
+            result = get_client(provider, base_url).call(
+                autofigure2.generate_figure_from_method,
+                method_text=method_text,
+                output_path=handoff.output("figure.png"),
+                api_key=api_key,
+                model=model,
+                base_url=base_url,
+                provider=provider,
+                use_reference_image=use_reference,
+                **ref_kwargs
+            )
         
+        # 加载结果（路径或内存图片）
+        with phase("decode"):
+            img = to_pil(result)
+            img.load()
+        
+        # 上游输出文件在工作区中，节点返回后即删除；只有写入结果缓存时才给出持久路径
         metadata = {
-            "path": result_path,
+            "path": None,
             "provider": provider,
             "model": model,
             "has_reference": use_reference
         }
         
-        return (tensor, json.dumps(metadata))
+        if use_cache:
+            with phase("cache"):
+                if isinstance(result, str):
+                    with open(result, 'rb') as f:
+                        png_bytes = f.read()
+                else:
+                    buf = io.BytesIO()
+                    img.save(buf, format="PNG")
+                    png_bytes = buf.getvalue()
+                # 先写图片再写元数据：元数据存在即表示条目完整
+                metadata["path"] = str(_figure_cache.put_bytes(key, ".png", png_bytes))
+                _figure_cache.put_json(key, metadata)
+        metadata["cached"] = False
+        
+        return (img, metadata)
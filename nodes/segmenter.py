@@ -1,16 +1,18 @@
-import os
-import sys
-import json
-import tempfile
-import uuid
-from pathlib import Path
-
-import torch
-
-sys.path.insert(0, str(Path(__file__).parent.parent))
-from autofigure2 import segment_with_sam3
+from ..utils.lazy import torch, autofigure2
 from ..utils.adapters import TypeAdapter
-from ..utils.constants import DEFAULT_SAM_PROMPT, DEFAULT_MERGE_THRESHOLD
+from ..utils.bridge import StageHandoff, to_pil, to_json
+from ..utils.boxes import merge_boxes_vectorized, boxes_mask, build_boxlib, draw_samed
+from ..utils import sam3_engine
+from ..utils.constants import (
+    DEFAULT_SAM_PROMPT,
+    DEFAULT_MERGE_THRESHOLD,
+    DEFAULT_TILE_SIZE,
+    DEFAULT_TILE_OVERLAP,
+    DEFAULT_TILE_BATCH,
+    DEFAULT_CPU_THREADS,
+)
+from ..utils.metrics import instrumented, phase
+from ..utils.workspace import scoped
 
 class AF_SAM3_Segment:
     """AutoFigure 步骤二：SAM3 分割 + Box 合并"""
@@ -23,55 +25,84 @@ class AF_SAM3_Segment:
                 "sam_prompt": ("STRING", {"default": DEFAULT_SAM_PROMPT}),  # 支持逗号分隔多 prompt
             },
             "optional": {
-                "sam_backend": (["local", "fal", "roboflow"], {"default": "local"}),
+                # local / local_cpu_int8 为插件内置的 SAM3 推理，不经过上游 segment_with_sam3：框取自
+                # transformers 后处理结果、按插件规则合并编号，未与上游逐框对齐，结果可能略有差异；
+                # 需要上游原有行为时选 local_upstream。local_cpu_int8：无 GPU 时运行 int8 动态量化模型
+                "sam_backend": (["local", "local_cpu_int8", "local_upstream", "fal", "roboflow"], {"default": "local"}),
                 "min_score": ("FLOAT", {"default": 0.5, "min": 0.0, "max": 1.0}),
                 "merge_threshold": ("FLOAT", {"default": DEFAULT_MERGE_THRESHOLD, "min": 0.0, "max": 1.0}),
                 "sam_api_key": ("STRING", {"default": ""}),  # fal/roboflow 需要
                 "sam_max_masks": ("INT", {"default": 32, "min": 1, "max": 100}),
+                # 分块模式（仅 local）：大图按原分辨率重叠分块检测，再合并跨缝结果
+                "tiled": ("BOOLEAN", {"default": False}),
+                "tile_size": ("INT", {"default": DEFAULT_TILE_SIZE, "min": 256, "max": 4096, "step": 64}),
+                "tile_overlap": ("INT", {"default": DEFAULT_TILE_OVERLAP, "min": 0, "max": 1024, "step": 16}),
+                "tile_batch": ("INT", {"default": DEFAULT_TILE_BATCH, "min": 1, "max": 32}),
+                # CPU 推理线程数（torch 进程级设置，每次推理前生效；0 为 torch 默认值）
+                "cpu_threads": ("INT", {"default": DEFAULT_CPU_THREADS, "min": 0, "max": 256}),
             }
         }
     
-    RETURN_TYPES = ("IMAGE", "JSON", "MASK")
-    RETURN_NAMES = ("marked_image", "boxlib", "combined_mask")
+    RETURN_TYPES = ("IMAGE", "JSON", "MASK", "JSON")
+    RETURN_NAMES = ("marked_image", "boxlib", "combined_mask", "metrics")
     FUNCTION = "segment"
     CATEGORY = "AutoFigure/Stage2"
     
+    @instrumented("stage2")
+    @scoped
     def segment(self, image, sam_prompt, sam_backend="local", min_score=0.5, 
-               merge_threshold=DEFAULT_MERGE_THRESHOLD, sam_api_key="", sam_max_masks=32):
+               merge_threshold=DEFAULT_MERGE_THRESHOLD, sam_api_key="", sam_max_masks=32,
+               tiled=False, tile_size=DEFAULT_TILE_SIZE, tile_overlap=DEFAULT_TILE_OVERLAP,
+               tile_batch=DEFAULT_TILE_BATCH, cpu_threads=DEFAULT_CPU_THREADS):
         
-        # 保存输入图
         pil_img = TypeAdapter.tensor_to_pil(image)
-        temp_input = os.path.join(tempfile.gettempdir(), f"af_seg_input_{uuid.uuid4().hex}.png")
-        pil_img.save(temp_input)
-        
-        # 输出目录
-        output_dir = os.path.join(tempfile.gettempdir(), f"af_seg_{uuid.uuid4().hex}")
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # 调用原函数（支持多 prompt 逗号分隔）
-        samed_path, boxlib_path, boxes = segment_with_sam3(
-            image_path=temp_input,
-            output_dir=output_dir,
-            text_prompts=sam_prompt,
-            min_score=min_score,
-            merge_threshold=merge_threshold,
-            sam_backend=sam_backend,
-            sam_api_key=sam_api_key if sam_api_key else None,
-            sam_max_masks=sam_max_masks
-        )
-        
-        # 加载 samed.png
-        samed_img = Image.open(samed_path)
-        samed_tensor = TypeAdapter.pil_to_tensor(samed_img)
         
-        # 读取 boxlib
-        with open(boxlib_path, 'r', encoding='utf-8') as f:
-            boxlib_data = json.load(f)
+        if sam_backend in ("local", "local_cpu_int8"):
+            # 本地后端：进程内常驻模型，所有 prompt 一次批量前向（分块模式下多个分块同批）
+            prompts = sam3_engine.parse_prompts(sam_prompt)
+            runtime = "cpu_int8" if sam_backend == "local_cpu_int8" else "torch"
+            with phase("model"):
+                if tiled:
+                    detections = sam3_engine.detect_tiled(
+                        pil_img, prompts, min_score=min_score, max_masks=sam_max_masks,
+                        tile_size=tile_size, overlap=min(tile_overlap, tile_size // 2), tile_batch=tile_batch,
+                        runtime=runtime, threads=cpu_threads
+                    )
+                else:
+                    detections = sam3_engine.detect(
+                        pil_img, prompts, min_score=min_score, max_masks=sam_max_masks,
+                        runtime=runtime, threads=cpu_threads
+                    )
+            with phase("merge"):
+                boxlib_data = build_boxlib(merge_boxes_vectorized(detections, merge_threshold), pil_img.width, pil_img.height)
+            boxes = boxlib_data["boxes"]
+            with phase("render"):
+                samed_tensor = TypeAdapter.pil_to_tensor(draw_samed(pil_img, boxlib_data))
+        else:
+            # 上游本地 / 远程后端：调用原函数（支持多 prompt 逗号分隔，输入图上游支持时内存直传）
+            if tiled:
+                print(f"[AutoFigure] Tiled segmentation is only available for the local backend, ignored for {sam_backend}")
+            handoff = StageHandoff("af_seg")
+            image_kwargs = handoff.image(autofigure2.segment_with_sam3, "image_path", pil_img)
+            with phase("model"):
+                samed, boxlib, boxes = autofigure2.segment_with_sam3(
+                    **image_kwargs,
+                    output_dir=handoff.output_dir,
+                    text_prompts=sam_prompt,
+                    min_score=min_score,
+                    merge_threshold=merge_threshold,
+                    sam_backend="local" if sam_backend == "local_upstream" else sam_backend,
+                    sam_api_key=sam_api_key if sam_api_key else None,
+                    sam_max_masks=sam_max_masks
+                )
+            
+            # samed 图与 boxlib（路径或内存对象）
+            with phase("decode"):
+                samed_tensor = TypeAdapter.pil_to_tensor(to_pil(samed))
+                boxlib_data = to_json(boxlib)
         
         # 生成 mask tensor（所有 box 的合并 mask）
-        mask = torch.zeros((1, pil_img.height, pil_img.width), dtype=torch.float32)
-        for box in boxes:
-            x1, y1, x2, y2 = box["x1"], box["y1"], box["x2"], box["y2"]
-            mask[0, y1:y2, x1:x2] = 1.0
+        with phase("mask"):
+            mask = torch.from_numpy(boxes_mask(boxes, pil_img.width, pil_img.height)).unsqueeze(0)
         
         return (samed_tensor, boxlib_data, mask)
@@ -1,22 +1,28 @@
 import os
-import sys
-import json
-import tempfile
-import uuid
-from pathlib import Path
 
-import torch
-
-sys.path.insert(0, str(Path(__file__).parent.parent))
-from autofigure2 import (
-    generate_svg_template, 
-    optimize_svg_with_llm,
-    get_svg_dimensions,
-    calculate_scale_factors,
-    PROVIDER_CONFIGS
-)
 from ..utils.adapters import TypeAdapter
-from ..utils.constants import DEFAULT_PLACEHOLDER_MODE, DEFAULT_OPTIMIZE_ITERATIONS
+from ..utils.lazy import autofigure2
+from ..utils.preview import render_preview
+from ..utils.bridge import StageHandoff, supports, to_json, to_text
+from ..utils.cache import ResultCache, make_key
+from ..utils.provider_client import get_client
+from ..utils.similarity import ConvergenceScorer
+from ..utils.svg_stream import IncrementalSVGValidator, SVGStreamError
+from ..utils.metrics import instrumented, phase
+from ..utils.workspace import scoped
+from ..utils.upload import prepare_upload, scale_boxlib
+from ..utils.constants import (
+    DEFAULT_PLACEHOLDER_MODE,
+    DEFAULT_OPTIMIZE_ITERATIONS,
+    DEFAULT_CONVERGE_THRESHOLD,
+    DEFAULT_PREVIEW_MAX_SIDE,
+    DEFAULT_STREAM_RETRIES,
+    DEFAULT_UPLOAD_MAX_SIDE,
+    DEFAULT_UPLOAD_TOKEN_BUDGET,
+)
+
+# Stage 4 缓存：模板与每一轮优化结果分别缓存，增加迭代次数时从最后一轮续跑
+_svg_cache = ResultCache("stage4")
 
 class AF_SVG_TemplateGenerator:
     """AutoFigure 步骤四：SVG 生成 + 验证 + 优化 + 坐标对齐"""
@@ -37,91 +43,215 @@ class AF_SVG_TemplateGenerator:
                 "placeholder_mode": (["none", "box", "label"], {"default": DEFAULT_PLACEHOLDER_MODE}),
                 "optimize_iterations": ("INT", {"default": DEFAULT_OPTIMIZE_ITERATIONS, "min": 0, "max": 5}),
                 "temperature": ("FLOAT", {"default": 0.3, "min": 0.0, "max": 1.0}),
+                "use_cache": ("BOOLEAN", {"default": True}),
+                # 相似度提升低于该值即提前结束优化；0 表示关闭收敛判断
+                "converge_threshold": ("FLOAT", {"default": DEFAULT_CONVERGE_THRESHOLD, "min": 0.0, "max": 1.0, "step": 0.001}),
+                # 关闭后 preview 输出为占位图，省去 cairosvg 渲染
+                "enable_preview": ("BOOLEAN", {"default": True}),
+                "preview_max_side": ("INT", {"default": DEFAULT_PREVIEW_MAX_SIDE, "min": 64, "max": 8192}),
+                # 流式校验：边接收边解析 SVG，明显损坏时立即中止并重试
+                "stream_validation": ("BOOLEAN", {"default": False}),
+                "stream_retries": ("INT", {"default": DEFAULT_STREAM_RETRIES, "min": 0, "max": 5}),
+                # 上传给 SVG 模型的图片：按最长边 / 视觉 token 预算缩小（0 不限制）
+                "upload_max_side": ("INT", {"default": DEFAULT_UPLOAD_MAX_SIDE, "min": 0, "max": 8192}),
+                "upload_token_budget": ("INT", {"default": DEFAULT_UPLOAD_TOKEN_BUDGET, "min": 0, "max": 100000}),
             }
         }
     
-    RETURN_TYPES = ("SVG_CODE", "IMAGE", "VEC2")
-    RETURN_NAMES = ("svg_template", "preview", "scale_factors")
+    RETURN_TYPES = ("SVG_CODE", "IMAGE", "VEC2", "JSON", "JSON")
+    RETURN_NAMES = ("svg_template", "preview", "scale_factors", "optimize_scores", "metrics")
     FUNCTION = "generate"
     CATEGORY = "AutoFigure/Stage4"
     
+    @instrumented("stage4")
+    @scoped
     def generate(self, figure_image, samed_image, boxlib, provider, api_key,
                 base_url="", svg_model="", placeholder_mode=DEFAULT_PLACEHOLDER_MODE,
-                optimize_iterations=DEFAULT_OPTIMIZE_ITERATIONS, temperature=0.3):
+                optimize_iterations=DEFAULT_OPTIMIZE_ITERATIONS, temperature=0.3, use_cache=True,
+                converge_threshold=DEFAULT_CONVERGE_THRESHOLD, enable_preview=True,
+                preview_max_side=DEFAULT_PREVIEW_MAX_SIDE, stream_validation=False,
+                stream_retries=DEFAULT_STREAM_RETRIES, upload_max_side=DEFAULT_UPLOAD_MAX_SIDE,
+                upload_token_budget=DEFAULT_UPLOAD_TOKEN_BUDGET):
         
-        if not api_key:
-            raise ValueError("API Key is required for SVG generation")
-        
-        config = PROVIDER_CONFIGS.get(provider, PROVIDER_CONFIGS["bianxie"])
+        config = autofigure2.PROVIDER_CONFIGS.get(provider, autofigure2.PROVIDER_CONFIGS["bianxie"])
         base_url = base_url or config["base_url"]
         model = svg_model or config["default_svg_model"]
         
-        # 保存图片
-        paths = {}
-        for name, img in [("figure", figure_image), ("samed", samed_image)]:
-            pil = TypeAdapter.tensor_to_pil(img)
-            path = os.path.join(tempfile.gettempdir(), f"af_svg_{name}_{uuid.uuid4().hex}.png")
-            pil.save(path)
-            paths[name] = path
-        
-        # 保存 boxlib
-        boxlib_path = os.path.join(tempfile.gettempdir(), f"af_svg_box_{uuid.uuid4().hex}.json")
-        with open(boxlib_path, 'w', encoding='utf-8') as f:
-            json.dump(boxlib, f, ensure_ascii=False, indent=2)
+        # 图片与 boxlib（上游支持时内存直传，否则两次调用共享同一份落盘文件）
+        figure_pil = TypeAdapter.tensor_to_pil(figure_image)
+        samed_pil = TypeAdapter.tensor_to_pil(samed_image)
+        handoff = StageHandoff("af_svg")
         
-        output_dir = os.path.join(tempfile.gettempdir(), f"af_svg_{uuid.uuid4().hex}")
-        os.makedirs(output_dir, exist_ok=True)
+        # 上传图片只准备一次（缩小结果按内容缓存），模板生成与每轮优化共用；
+        # boxlib 换算到上传图坐标系，与模型看到的图一致
+        with phase("upload"):
+            figure_up = prepare_upload(figure_pil, upload_max_side, upload_token_budget)
+            samed_up = prepare_upload(samed_pil, upload_max_side, upload_token_budget)
+            upload_boxlib = scale_boxlib(to_json(boxlib), samed_up)
         
-        template_path = os.path.join(output_dir, "template.svg")
-        
-        # 步骤四：生成 SVG（含 4.5 自动验证修复）
-        svg_path = generate_svg_template(
-            figure_path=paths["figure"],
-            samed_path=paths["samed"],
-            boxlib_path=boxlib_path,
-            output_path=template_path,
-            api_key=api_key,
-            model=model,
-            base_url=base_url,
-            provider=provider,
-            placeholder_mode=placeholder_mode
-        )
-        
-        # 步骤 4.6：LLM 优化（迭代次数可配置，0 则跳过）
-        optimized_path = os.path.join(output_dir, "optimized.svg")
-        if optimize_iterations > 0:
-            optimize_svg_with_llm(
-                figure_path=paths["figure"],
-                samed_path=paths["samed"],
-                final_svg_path=svg_path,
-                output_path=optimized_path,
+        # 步骤四：生成 SVG（含 4.5 自动验证修复）；LLM 调用经共享 provider 客户端
+        # temperature 目前不传给上游，仍计入缓存键，避免改动后命中旧结果
+        template_key = make_key("stage4-template", figure_image, samed_image, boxlib,
+                                provider, base_url, model, placeholder_mode, temperature,
+                                upload_max_side, upload_token_budget)
+        svg_code = self._cache_get(use_cache, template_key)
+        svg_path = None  # 与 svg_code 内容一致的磁盘文件（若有），落盘时复用
+        if svg_code is None:
+            output_path = handoff.output("template.svg")
+            template = self._call_llm(
+                get_client(provider, base_url), autofigure2.generate_svg_template,
+                stream_validation, stream_retries,
+                **handoff.upload(autofigure2.generate_svg_template, "figure_path", figure_up),
+                **handoff.upload(autofigure2.generate_svg_template, "samed_path", samed_up),
+                **handoff.json(autofigure2.generate_svg_template, "boxlib_path", upload_boxlib),
+                output_path=output_path,
                 api_key=api_key,
                 model=model,
                 base_url=base_url,
                 provider=provider,
-                max_iterations=optimize_iterations,
-                skip_base64_validation=True  # 模板阶段无 base64 图片
+                placeholder_mode=placeholder_mode
             )
-            final_svg_path = optimized_path
-        else:
-            final_svg_path = svg_path
+            svg_code, svg_path = self._svg_result(template, output_path)
+            self._cache_put(use_cache, template_key, svg_code)
         
-        # 读取 SVG 代码
-        with open(final_svg_path, 'r', encoding='utf-8') as f:
-            svg_code = f.read()
+        # 步骤 4.6：LLM 优化（迭代次数可配置，0 则跳过）
+        # 逐轮调用（每次 max_iterations=1），每轮结果以前一轮为键缓存
+        # 每轮渲染候选并与原图比较相似度，提升不足 converge_threshold 时提前结束；
+        # 返回得分最高的候选（无法打分时为最后一轮）
+        scorer = None
+        scores = []
+        if optimize_iterations > 0 and converge_threshold > 0:
+            with phase("score"):
+                scorer = ConvergenceScorer(figure_pil)
+                scores.append(scorer.score(svg_code))
+        stopped_early = False
+        best = (scores[0] if scores else None, svg_code, svg_path, 0)  # (得分, svg_code, svg_path, 轮次)
+        
+        step_key = template_key
+        for i in range(1, optimize_iterations + 1):
+            step_key = make_key("stage4-optimize", step_key, i)
+            cached = self._cache_get(use_cache, step_key)
+            if cached is not None:
+                svg_code, svg_path = cached, None
+            else:
+                svg_code, svg_path = self._optimize_once(
+                    handoff, figure_up, samed_up, svg_code, svg_path, i,
+                    api_key, model, base_url, provider, stream_validation, stream_retries
+                )
+                self._cache_put(use_cache, step_key, svg_code)
+            
+            if scorer is None:
+                best = (None, svg_code, svg_path, i)
+                continue
+            with phase("score"):
+                scores.append(scorer.score(svg_code))
+            prev, curr = scores[-2], scores[-1]
+            if best[0] is None or (curr is not None and curr > best[0]):
+                best = (curr, svg_code, svg_path, i)
+            if prev is not None and curr is not None and curr - prev < converge_threshold:
+                stopped_early = i < optimize_iterations
+                break
+        
+        _, svg_code, svg_path, best_iteration = best
+        optimize_scores = {
+            "scores": scores,  # [模板, 第 1 轮, ...]
+            "iterations_run": best_iteration,  # 返回的候选对应的轮次（0 为模板）
+            "iterations_tried": i if optimize_iterations > 0 else 0,
+            "stopped_early": stopped_early,
+        }
         
         # 生成预览图
-        preview_tensor = TypeAdapter.svg_to_tensor(svg_code)
+        with phase("render"):
+            preview_tensor = render_preview(svg_code, preview_max_side, enable_preview)
         
-        # 步骤 4.7：坐标系对齐计算
-        figure_pil = Image.open(paths["figure"])
-        svg_w, svg_h = get_svg_dimensions(svg_code)
+        # 步骤 4.7：坐标系对齐计算（以原图尺寸为准，SVG 按上传图坐标生成时由缩放系数换算回原图）
+        svg_w, svg_h = autofigure2.get_svg_dimensions(svg_code)
         
         if svg_w and svg_h:
-            scale_x, scale_y = calculate_scale_factors(
+            scale_x, scale_y = autofigure2.calculate_scale_factors(
                 figure_pil.width, figure_pil.height, svg_w, svg_h
             )
         else:
             scale_x, scale_y = 1.0, 1.0
         
-        return (svg_code, preview_tensor, (scale_x, scale_y))
+        return (svg_code, preview_tensor, (scale_x, scale_y), optimize_scores)
+    
+    @staticmethod
+    def _optimize_once(handoff, figure_up, samed_up, svg_code, svg_path, i,
+                       api_key, model, base_url, provider, stream_validation=False,
+                       stream_retries=DEFAULT_STREAM_RETRIES):
+        """单轮 LLM 优化，返回 (svg_code, svg_path)"""
+        output_path = handoff.output(f"optimized_{i}.svg")
+        optimized = AF_SVG_TemplateGenerator._call_llm(
+            get_client(provider, base_url), autofigure2.optimize_svg_with_llm,
+            stream_validation, stream_retries,
+            **handoff.upload(autofigure2.optimize_svg_with_llm, "figure_path", figure_up),
+            **handoff.upload(autofigure2.optimize_svg_with_llm, "samed_path", samed_up),
+            **handoff.text(autofigure2.optimize_svg_with_llm, "final_svg_path", svg_code, path=svg_path),
+            output_path=output_path,
+            api_key=api_key,
+            model=model,
+            base_url=base_url,
+            provider=provider,
+            max_iterations=1,
+            skip_base64_validation=True  # 模板阶段无 base64 图片
+        )
+        return AF_SVG_TemplateGenerator._svg_result(optimized, output_path)
+    
+    @staticmethod
+    def _svg_result(result, output_path):
+        """上游返回值 -> (svg_code, svg_path)
+
+        返回值为 SVG 代码时不对应磁盘文件（svg_path 为 None，需要时由 handoff.text 落盘）；
+        为已存在的文件路径时复用该文件；其它返回值（None 等）读取上游写入的 output_path。
+        """
+        if isinstance(result, (str, bytes)) and not os.path.isfile(result):
+            return to_text(result), None
+        svg_path = result if isinstance(result, str) else output_path
+        return to_text(svg_path), svg_path
+    
+    @staticmethod
+    def _call_llm(client, func, stream_validation, stream_retries, **kwargs):
+        """调用上游 LLM 函数；开启流式校验时逐块校验响应，损坏即中止重试
+
+        上游函数需接受 stream_callback（每收到一段文本回调一次）才能流式校验，否则按普通调用执行。
+        只有接收途中的校验失败才中止重试；流已完整结束（如缺少 </svg>）时直接返回结果，
+        与最后一次不做校验的尝试一样交由上游 4.5 验证修复兜底。
+        缓存全部命中时不会调用到这里，因此 API Key 只在确需请求时检查（与 Stage 1 一致）。
+        """
+        if not kwargs.get("api_key"):
+            raise ValueError("API Key is required for SVG generation")
+        with phase("llm"):
+            if not stream_validation or not supports(func, "stream_callback"):
+                if stream_validation:
+                    print(f"[AutoFigure] {func.__name__} does not support stream_callback, streaming validation skipped")
+                return client.call(func, **kwargs)
+            
+            for attempt in range(stream_retries):
+                validator = IncrementalSVGValidator()
+                try:
+                    result = client.call(func, stream_callback=validator.feed, **kwargs)
+                except SVGStreamError as e:
+                    print(f"[AutoFigure] Aborted {func.__name__} after {validator.chars} chars: {e} "
+                          f"(retry {attempt + 1}/{stream_retries})")
+                    continue
+                try:
+                    validator.close()
+                except SVGStreamError as e:
+                    print(f"[AutoFigure] {func.__name__} returned an incomplete SVG ({e}), left to repair")
+                return result
+            return client.call(func, **kwargs)
+    
+    @staticmethod
+    def _cache_get(use_cache, key):
+        if not use_cache:
+            return None
+        with phase("cache"):
+            data = _svg_cache.get_bytes(key, ".svg")
+        return data.decode('utf-8') if data is not None else None
+    
+    @staticmethod
+    def _cache_put(use_cache, key, svg_code):
+        if use_cache:
+            with phase("cache"):
+                _svg_cache.put_bytes(key, ".svg", svg_code.encode('utf-8'))
@@ -1,17 +1,16 @@
-import os
-import sys
-import re
-import tempfile
-import uuid
-from pathlib import Path
+import json
 
-import torch
 import numpy as np
 from PIL import Image
 
-sys.path.insert(0, str(Path(__file__).parent.parent))
-from autofigure2 import replace_icons_in_svg
-from ..utils.adapters import TypeAdapter
+from ..utils.adapters import float_to_uint8
+from ..utils.lazy import autofigure2
+from ..utils.preview import render_preview
+from ..utils.constants import DEFAULT_PREVIEW_MAX_SIDE
+from ..utils.bridge import StageHandoff, supports, to_text, FAST_PNG_COMPRESS_LEVEL
+from ..utils.svg_embed import ICON_FORMATS, embed_icons_within_budget, rendered_sizes
+from ..utils.metrics import instrumented, phase, record_file_written
+from ..utils.workspace import scoped
 
 class AF_SVG_IconReplacer:
     """AutoFigure 步骤五：图标替换到 SVG 占位符"""
@@ -21,21 +20,37 @@ class AF_SVG_IconReplacer:
         return {
             "required": {
                 "svg_template": ("SVG_CODE",),    # 字符串类型的 SVG
-                "icons_rgba": ("IMAGE",),         # [N, H, W, 4] batch
                 "boxlib": ("JSON",),              # box 信息，用于坐标
                 "scale_factors": ("VEC2",),       # (scale_x, scale_y)
             },
             "optional": {
+                "icon_set": ("ICON_SET",),        # 变长图标集合（优先使用）
+                "icons_rgba": ("IMAGE",),         # [N, H, W, 4] padding batch（旧接口）
                 "match_by_label": ("BOOLEAN", {"default": True}),
+                # builtin：内存中并行编码并一次性替换；autofigure2：调用原函数（经临时文件）
+                "embed_backend": (["builtin", "autofigure2"], {"default": "builtin"}),
+                # 以下仅 builtin 生效：嵌入格式、按渲染尺寸缩小、最终 SVG 字节预算（0 为不限）
+                "icon_format": (ICON_FORMATS, {"default": "png"}),
+                "icon_quality": ("INT", {"default": 90, "min": 1, "max": 100}),
+                "fit_to_box": ("BOOLEAN", {"default": False}),
+                "icon_render_scale": ("FLOAT", {"default": 2.0, "min": 0.25, "max": 8.0, "step": 0.25}),
+                "max_svg_kb": ("INT", {"default": 0, "min": 0, "max": 1024 * 1024}),
+                # 关闭后 final_preview 输出为占位图，省去 cairosvg 渲染
+                "enable_preview": ("BOOLEAN", {"default": True}),
+                "preview_max_side": ("INT", {"default": DEFAULT_PREVIEW_MAX_SIDE, "min": 64, "max": 8192}),
             }
         }
     
-    RETURN_TYPES = ("SVG_CODE", "IMAGE")
-    RETURN_NAMES = ("final_svg", "final_preview")
+    RETURN_TYPES = ("SVG_CODE", "IMAGE", "JSON")
+    RETURN_NAMES = ("final_svg", "final_preview", "metrics")
     FUNCTION = "replace"
     CATEGORY = "AutoFigure/Stage5"
     
-    def replace(self, svg_template, icons_rgba, boxlib, scale_factors, match_by_label=True):
+    @instrumented("stage5")
+    @scoped
+    def replace(self, svg_template, boxlib, scale_factors, icon_set=None, icons_rgba=None, match_by_label=True,
+               embed_backend="builtin", icon_format="png", icon_quality=90, fit_to_box=False,
+               icon_render_scale=2.0, max_svg_kb=0, enable_preview=True, preview_max_side=DEFAULT_PREVIEW_MAX_SIDE):
         
         if isinstance(boxlib, str):
             boxlib = json.loads(boxlib)
@@ -44,34 +59,32 @@ class AF_SVG_IconReplacer:
         
         if len(boxes) == 0:
             # 无图标，直接返回模板
-            preview = TypeAdapter.svg_to_tensor(svg_template)
-            return (svg_template, preview)
+            with phase("render"):
+                final_preview = render_preview(svg_template, preview_max_side, enable_preview)
+            return (svg_template, final_preview)
         
-        # 准备 icon_infos
+        if icon_set is None and icons_rgba is None:
+            raise ValueError("icon_set or icons_rgba is required")
+        
+        # 准备图标与 icon_infos
+        icons_np = icons_rgba.cpu().numpy() if icon_set is None else None
+        n_icons = len(icon_set) if icon_set is not None else len(icons_np)
+        if icon_set is None and n_icons < len(boxes):
+            # 上游关闭 pad_icons_batch 时 icons_rgba 只是占位图，不能静默只替换部分占位符
+            raise ValueError(f"icons_rgba holds {n_icons} icon(s) for {len(boxes)} boxes; "
+                             "connect icon_set or enable pad_icons_batch on AF_IconExtractor")
+        icons = []
         icon_infos = []
-        icons_np = icons_rgba.cpu().numpy()
         
         for i, box in enumerate(boxes):
-            if i >= len(icons_np):
+            if i >= n_icons:
                 break
             
-            # 获取第 i 个图标
-            icon_np = icons_np[i]  # [H, W, 4]
-            
-            # 去除 padding（找到非零区域）
-            alpha = icon_np[:, :, 3]
-            coords = np.where(alpha > 0)
-            if len(coords[0]) > 0:
-                y1, x1 = coords[0].min(), coords[1].min()
-                y2, x2 = coords[0].max() + 1, coords[1].max() + 1
-                icon_crop = icon_np[y1:y2, x1:x2]
+            # 获取第 i 个图标：ICON_SET 为原始尺寸，无需裁剪
+            if icon_set is not None:
+                icons.append(icon_set[i])
             else:
-                icon_crop = icon_np
-            
-            # 保存为临时文件
-            icon_pil = Image.fromarray((icon_crop * 255).astype(np.uint8), 'RGBA')
-            temp_icon = os.path.join(tempfile.gettempdir(), f"af_icon_{i:02d}_{uuid.uuid4().hex}.png")
-            icon_pil.save(temp_icon)
+                icons.append(self._unpad(icons_np[i]))
             
             label = box.get("label", f"<AF>{i+1:02d}")
             label_clean = label.replace("<", "").replace(">", "")
@@ -86,29 +99,65 @@ class AF_SVG_IconReplacer:
                 "y2": box["y2"],
                 "width": box["x2"] - box["x1"],
                 "height": box["y2"] - box["y1"],
-                "nobg_path": temp_icon
             })
         
-        # 保存模板 SVG
-        temp_svg = os.path.join(tempfile.gettempdir(), f"af_template_{uuid.uuid4().hex}.svg")
-        with open(temp_svg, 'w', encoding='utf-8') as f:
-            f.write(svg_template)
+        if embed_backend == "builtin":
+            # 线程池并行编码 base64，占位符索引一次建立，单次拼接完成全部替换
+            max_sizes = rendered_sizes(icon_infos, scale_factors, icon_render_scale) if fit_to_box else None
+            with phase("encode"):
+                final_svg = embed_icons_within_budget(
+                    svg_template, icons, icon_infos, scale_factors, match_by_label,
+                    fmt=icon_format, max_sizes=max_sizes, quality=icon_quality,
+                    max_bytes=max_svg_kb * 1024,
+                    groups=icon_set.groups[:len(icons)].tolist() if icon_set is not None else None
+                )
+        else:
+            with phase("encode"):
+                final_svg = self._replace_with_autofigure2(svg_template, icons, icon_infos,
+                                                           scale_factors, match_by_label)
         
-        output_path = os.path.join(tempfile.gettempdir(), f"af_final_{uuid.uuid4().hex}.svg")
+        with phase("render"):
+            final_preview = render_preview(final_svg, preview_max_side, enable_preview)
+        
+        return (final_svg, final_preview)
+    
+    @staticmethod
+    def _replace_with_autofigure2(svg_template, icons, icon_infos, scale_factors, match_by_label):
+        """调用原函数（上游支持内存模板时图标也以 nobg_image 直传）"""
+        handoff = StageHandoff("af_final")
+        in_memory = supports(autofigure2.replace_icons_in_svg, "template_svg")
+        for i, (icon, info) in enumerate(zip(icons, icon_infos)):
+            icon_pil = Image.fromarray(icon, 'RGBA')
+            if in_memory:
+                info["nobg_image"] = icon_pil
+            else:
+                info["nobg_path"] = handoff.output(f"icon_{i:02d}.png")
+                icon_pil.save(info["nobg_path"], compress_level=FAST_PNG_COMPRESS_LEVEL)
+                record_file_written(info["nobg_path"])
         
-        # 调用原函数
-        final_path = replace_icons_in_svg(
-            template_svg_path=temp_svg,
+        final = autofigure2.replace_icons_in_svg(
+            **handoff.text(autofigure2.replace_icons_in_svg, "template_svg_path", svg_template),
             icon_infos=icon_infos,
-            output_path=output_path,
+            output_path=handoff.output("final.svg"),
             scale_factors=scale_factors,
             match_by_label=match_by_label
         )
         
-        # 读取结果
-        with open(final_path, 'r', encoding='utf-8') as f:
-            final_svg = f.read()
-        
-        final_preview = TypeAdapter.svg_to_tensor(final_svg)
-        
-        return (final_svg, final_preview)
+        # 读取结果（路径或 SVG 代码）
+        return to_text(final)
+    
+    @staticmethod
+    def _unpad(icon_np):
+        """padding batch 中的单个图标 [H, W, 4]（float 0-1 或 uint8）-> uint8，并按 alpha 非零区域去除 padding
+
+        注意：本身带透明边框的图标也会被裁掉边框，使用 ICON_SET 可避免。
+        """
+        alpha = icon_np[:, :, 3]
+        coords = np.where(alpha > 0)
+        if len(coords[0]) > 0:
+            y1, x1 = coords[0].min(), coords[1].min()
+            y2, x2 = coords[0].max() + 1, coords[1].max() + 1
+            icon_np = icon_np[y1:y2, x1:x2]
+        if icon_np.dtype == np.uint8:
+            return icon_np
+        return float_to_uint8(icon_np)
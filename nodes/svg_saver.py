@@ -1,6 +1,13 @@
-import os
+import gzip
+import hashlib
+from datetime import datetime
 from pathlib import Path
 
+from ..utils.constants import DEFAULT_SVG_PRECISION, SVGZ_COMPRESS_LEVEL
+from ..utils.metrics import instrumented, phase
+from ..utils.svg_minify import minify_svg
+from ..utils.writer import write_atomic, write_background
+
 class AF_SVG_Saver:
     """保存 SVG 到指定路径"""
     
@@ -13,28 +20,59 @@ class AF_SVG_Saver:
             },
             "optional": {
                 "output_dir": ("STRING", {"default": "./output"}),
+                # 压缩：去注释与空白、数值保留 precision 位小数、重复内嵌图片只保留一份
+                "minify": ("BOOLEAN", {"default": False}),
+                "precision": ("INT", {"default": DEFAULT_SVG_PRECISION, "min": 0, "max": 8}),
+                # svgz 为 gzip 压缩的 SVG，浏览器与矢量编辑器均可直接打开
+                "file_format": (["svg", "svgz"], {"default": "svg"}),
+                # content_hash：文件名取内容哈希，相同内容已存在时不再写入
+                "filename_mode": (["timestamp", "content_hash"], {"default": "timestamp"}),
+                # 后台写入：立即返回路径，由写入线程落盘（适合慢速网络存储）
+                "background_write": ("BOOLEAN", {"default": False}),
             }
         }
     
-    RETURN_TYPES = ("STRING",)
-    RETURN_NAMES = ("filepath",)
+    RETURN_TYPES = ("STRING", "JSON")
+    RETURN_NAMES = ("filepath", "metrics")
     FUNCTION = "save"
     CATEGORY = "AutoFigure/IO"
     OUTPUT_NODE = True
     
-    def save(self, svg_code, filename_prefix, output_dir="./output"):
+    @instrumented("save")
+    def save(self, svg_code, filename_prefix, output_dir="./output", minify=False,
+             precision=DEFAULT_SVG_PRECISION, file_format="svg", filename_mode="timestamp",
+             background_write=False):
         # 确保目录存在
         out_path = Path(output_dir)
         out_path.mkdir(parents=True, exist_ok=True)
         
-        # 生成文件名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{filename_prefix}_{timestamp}.svg"
+        if minify:
+            with phase("minify"):
+                svg_code = minify_svg(svg_code, precision)
+        data = svg_code.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        if file_format == "svgz":
+            with phase("compress"):
+                data = gzip.compress(data, compresslevel=SVGZ_COMPRESS_LEVEL, mtime=0)
+        
+        # 生成文件名：时间戳后附内容哈希，同一秒内的并发保存不会互相覆盖
+        if filename_mode == "content_hash":
+            filename = f"{filename_prefix}_{digest[:16]}.{file_format}"
+        else:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"{filename_prefix}_{timestamp}_{digest[:8]}.{file_format}"
         filepath = out_path / filename
         
-        # 写入文件
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(svg_code)
+        if filename_mode == "content_hash" and filepath.exists():
+            print(f"[AutoFigure] SVG unchanged, kept: {filepath}")
+            return (str(filepath),)
+        
+        # 原子写入（临时文件 + rename），可选交给后台写入线程
+        with phase("write"):
+            if background_write:
+                write_background(str(filepath), data)
+            else:
+                write_atomic(str(filepath), data)
         
-        print(f"[AutoFigure] SVG saved to: {filepath}")
+        print(f"[AutoFigure] SVG {'queued' if background_write else 'saved'} to: {filepath} ({len(data) / 1024:.1f} KB)")
         return (str(filepath),)
@@ -1,33 +1,98 @@
-import torch
+from __future__ import annotations
+
+import contextvars
+from contextlib import contextmanager
+
 import numpy as np
 from PIL import Image
 import io
 
+from .lazy import torch
+
+# float -> uint8 转换时每个分块的元素数（临时 float 缓冲只有一个分块大小）
+_CHUNK_ELEMS = 4 * 1024 * 1024
+
+_compact = contextvars.ContextVar("af_compact_images", default=False)
+
+
+@contextmanager
+def compact_images():
+    """范围内 pil_to_tensor 默认输出 uint8 IMAGE
+
+    ComfyUI 的 IMAGE 约定为 float32 0-1，非 AutoFigure 节点只认这种格式；
+    仅在下游全是 AutoFigure 节点时使用（如无界面流水线），各节点的输入两种格式都接受。
+    """
+    token = _compact.set(True)
+    try:
+        yield
+    finally:
+        _compact.reset(token)
+
+
+def float_to_uint8(array: np.ndarray) -> np.ndarray:
+    """float 0-1 -> uint8（截断，与 astype 一致），按首维分块避免整幅 float 中间副本"""
+    out = np.empty(array.shape, dtype=np.uint8)
+    if array.size == 0:
+        return out
+    rows = max(1, _CHUNK_ELEMS // max(1, array[0].size))
+    buf = np.empty((min(rows, len(array)),) + array.shape[1:], dtype=np.float32)
+    for start in range(0, len(array), rows):
+        chunk = buf[:min(rows, len(array) - start)]
+        np.multiply(array[start:start + len(chunk)], np.float32(255), out=chunk)
+        np.clip(chunk, 0, 255, out=chunk)
+        out[start:start + len(chunk)] = chunk
+    return out
+
+
 class TypeAdapter:
-    """AutoFigure (PIL) <=> ComfyUI (Tensor) 适配器"""
+    """AutoFigure (PIL) <=> ComfyUI (Tensor) 适配器
+    
+    IMAGE 张量可以是 float32 0-1（ComfyUI 约定）或 uint8 0-255（compact_images 范围内）；
+    uint8 与 numpy / PIL 之间尽量共享内存，不做整幅的 float 中间副本。
+    """
+    
+    @staticmethod
+    def image_dtype():
+        """当前范围内 IMAGE 输出的 dtype"""
+        return torch.uint8 if _compact.get() else torch.float32
+    
+    @staticmethod
+    def to_uint8(t_image) -> np.ndarray:
+        """IMAGE [B,H,W,C] / [H,W,C] -> 第一张图的 uint8 ndarray（uint8 CPU 张量时为视图）"""
+        if len(t_image.shape) == 4:
+            t_image = t_image[0]
+        array = t_image.cpu().numpy() if hasattr(t_image, "cpu") else np.asarray(t_image)
+        if array.dtype == np.uint8:
+            return array
+        return float_to_uint8(array)
     
     @staticmethod
     def tensor_to_pil(t_image: torch.Tensor) -> Image.Image:
-        """ComfyUI [B,H,W,C] 0-1 -> PIL RGB"""
+        """ComfyUI [B,H,W,C]（float32 0-1 或 uint8）-> PIL"""
         if t_image is None:
             return None
-        
-        # 处理 batch
-        if len(t_image.shape) == 4:
-            t_image = t_image[0]
-        
-        # 转为 numpy 0-255
-        np_image = (t_image.cpu().numpy() * 255).astype(np.uint8)
-        return Image.fromarray(np_image)
+        return Image.fromarray(TypeAdapter.to_uint8(t_image))
+    
+    @staticmethod
+    def from_uint8(array: np.ndarray, dtype=None) -> torch.Tensor:
+        """uint8 [H,W,C] -> IMAGE [1,H,W,C]；uint8 输出直接共享 array 的内存，float32 只分配一次"""
+        dtype = dtype or TypeAdapter.image_dtype()
+        if dtype == torch.uint8:
+            return torch.from_numpy(array).unsqueeze(0)
+        out = torch.empty(array.shape, dtype=torch.float32)
+        np.divide(array, np.float32(255), out=out.numpy())
+        return out.unsqueeze(0)
     
     @staticmethod
-    def pil_to_tensor(pil_image: Image.Image) -> torch.Tensor:
-        """PIL RGB -> ComfyUI [B,H,W,C] 0-1"""
+    def pil_to_tensor(pil_image: Image.Image, dtype=None) -> torch.Tensor:
+        """PIL -> ComfyUI [B,H,W,3]（默认 float32 0-1；compact_images 范围内为 uint8）"""
+        dtype = dtype or TypeAdapter.image_dtype()
         if pil_image is None:
-            return torch.zeros((1, 512, 512, 3))
+            return torch.zeros((1, 512, 512, 3), dtype=dtype)
         
-        np_image = np.array(pil_image.convert("RGB")).astype(np.float32) / 255.0
-        return torch.from_numpy(np_image).unsqueeze(0)
+        if pil_image.mode != "RGB":
+            pil_image = pil_image.convert("RGB")
+        return TypeAdapter.from_uint8(np.array(pil_image), dtype)
     
     @staticmethod
     def svg_to_tensor(svg_code: str, width: int = 1024, height: int = 1024) -> torch.Tensor:
@@ -35,8 +100,8 @@ class TypeAdapter:
         try:
             import cairosvg
             png_data = cairosvg.svg2png(
-                bytestring=svg_code.encode(), 
-                output_width=width, 
+                bytestring=svg_code.encode(),
+                output_width=width,
                 output_height=height
             )
             pil_image = Image.open(io.BytesIO(png_data)).convert('RGB')
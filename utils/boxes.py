@@ -0,0 +1,200 @@
+"""检测框合并、boxlib 构建与 samed 标记图绘制"""
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+_COORDS = ("x1", "y1", "x2", "y2")
+
+
+def overlap_ratio(a: dict, b: dict) -> float:
+    """交集面积 / 较小框面积"""
+    iw = min(a["x2"], b["x2"]) - max(a["x1"], b["x1"])
+    ih = min(a["y2"], b["y2"]) - max(a["y1"], b["y1"])
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    area_a = (a["x2"] - a["x1"]) * (a["y2"] - a["y1"])
+    area_b = (b["x2"] - b["x1"]) * (b["y2"] - b["y1"])
+    return (iw * ih) / max(1, min(area_a, area_b))
+
+
+def merge_boxes(boxes: list, threshold: float) -> list:
+    """反复合并重叠比例超过 threshold 的框（取并集），直到没有可合并的框
+
+    合并后保留较高分数与对应 prompt；输出按 (y1, x1) 排序。
+    """
+    merged = [dict(b) for b in boxes]
+    changed = True
+    while changed:
+        changed = False
+        result = []
+        while merged:
+            cur = merged.pop(0)
+            i = 0
+            while i < len(merged):
+                other = merged[i]
+                if overlap_ratio(cur, other) > threshold:
+                    cur = _union(cur, other)
+                    merged.pop(i)
+                    changed = True
+                else:
+                    i += 1
+            result.append(cur)
+        merged = result
+    return sorted(merged, key=lambda b: (b["y1"], b["x1"]))
+
+
+def _overlap_rows(cur: np.ndarray, others: np.ndarray) -> np.ndarray:
+    """cur [..., 4] 与 others [N, 4] 的重叠比例，逐元素与 overlap_ratio 的计算顺序一致"""
+    iw = np.minimum(cur[..., 2], others[:, 2]) - np.maximum(cur[..., 0], others[:, 0])
+    ih = np.minimum(cur[..., 3], others[:, 3]) - np.maximum(cur[..., 1], others[:, 1])
+    area_cur = (cur[..., 2] - cur[..., 0]) * (cur[..., 3] - cur[..., 1])
+    area = (others[:, 2] - others[:, 0]) * (others[:, 3] - others[:, 1])
+    ratio = (iw * ih) / np.maximum(1, np.minimum(area_cur, area))
+    return np.where((iw > 0) & (ih > 0), ratio, 0.0)
+
+
+def overlap_matrix(boxes: list) -> np.ndarray:
+    """两两重叠比例矩阵 [N, N]（与 overlap_ratio 一致）"""
+    coords = np.array([[b[k] for k in _COORDS] for b in boxes], dtype=np.float64).reshape(-1, 4)
+    return _overlap_rows(coords[:, None, :], coords)
+
+
+def _merge_pass(coords, src, best, scores, threshold):
+    """merge_boxes 内层一轮的向量化实现
+
+    与参考实现相同：按列表顺序取出 cur，从其后第一个仍存在的框开始扫描，
+    找到第一个重叠超过阈值的框即合并，并从该位置之后继续用新的 cur 扫描。
+    cur 未增长时直接查预先算好的两两重叠矩阵，增长后只对剩余尾部做一次向量化计算。
+    """
+    n = len(coords)
+    hit_matrix = _overlap_rows(coords[:, None, :], coords) > threshold
+    alive = np.ones(n, dtype=bool)
+    out_coords, out_src, out_best = [], [], []
+    changed = False
+    for k in range(n):
+        if not alive[k]:
+            continue
+        alive[k] = False
+        cur, cur_src, cur_best = coords[k].copy(), src[k].copy(), best[k]
+        grown = False
+        p = k + 1
+        while p < n:
+            tail = np.flatnonzero(alive[p:]) + p
+            if tail.size == 0:
+                break
+            hits = hit_matrix[k, tail] if not grown else _overlap_rows(cur, coords[tail]) > threshold
+            first = np.argmax(hits)
+            if not hits[first]:
+                break
+            q = tail[first]
+            # 与 _union 一致：min / max 相等时保留 cur 的值，分数相等时保留 cur 的字段
+            for c in (0, 1):
+                if coords[q, c] < cur[c]:
+                    cur[c], cur_src[c] = coords[q, c], src[q, c]
+            for c in (2, 3):
+                if coords[q, c] > cur[c]:
+                    cur[c], cur_src[c] = coords[q, c], src[q, c]
+            if not scores[cur_best] >= scores[best[q]]:
+                cur_best = best[q]
+            alive[q] = False
+            grown = changed = True
+            p = q + 1
+        out_coords.append(cur)
+        out_src.append(cur_src)
+        out_best.append(cur_best)
+    return np.array(out_coords), np.array(out_src), out_best, changed
+
+
+def merge_boxes_vectorized(boxes: list, threshold: float) -> list:
+    """merge_boxes 的 NumPy 实现，结果（含字段来源与排序）与之完全相同
+
+    框数为数百时参考实现的逐对 Python 比较成为瓶颈；这里每个框只做一次向量化的重叠计算。
+    坐标记录来源框下标，输出时取回原始值，保证类型与取值都和参考实现一致
+    （由 benchmarks/merge_equivalence.py 的随机用例检查）。
+    """
+    if not boxes:
+        return []
+    n = len(boxes)
+    coords = np.array([[b[k] for k in _COORDS] for b in boxes], dtype=np.float64)
+    src = np.repeat(np.arange(n)[:, None], 4, axis=1)
+    best = list(range(n))
+    scores = [b.get("score", 0) for b in boxes]
+    changed = True
+    while changed:
+        coords, src, best, changed = _merge_pass(coords, src, best, scores, threshold)
+    merged = [
+        {**boxes[b], **{k: boxes[s[c]][k] for c, k in enumerate(_COORDS)}}
+        for s, b in zip(src, best)
+    ]
+    return sorted(merged, key=lambda b: (b["y1"], b["x1"]))
+
+
+def boxes_mask(boxes: list, width: int, height: int) -> np.ndarray:
+    """所有框的并集掩码 [H, W] float32（差分数组 + 二维前缀和，一次完成）
+
+    越界与负坐标按 Python 切片语义处理，与逐框 mask[y1:y2, x1:x2] = 1 的结果一致。
+    """
+    diff = np.zeros((height + 1, width + 1), dtype=np.int32)
+    rows, cols, values = [], [], []
+    for box in boxes:
+        y1, y2, _ = slice(int(box["y1"]), int(box["y2"])).indices(height)
+        x1, x2, _ = slice(int(box["x1"]), int(box["x2"])).indices(width)
+        if y2 <= y1 or x2 <= x1:
+            continue
+        rows += [y1, y1, y2, y2]
+        cols += [x1, x2, x1, x2]
+        values += [1, -1, -1, 1]
+    if rows:
+        np.add.at(diff, (np.array(rows), np.array(cols)), np.array(values, dtype=np.int32))
+    coverage = diff.cumsum(axis=0).cumsum(axis=1)[:height, :width]
+    return (coverage > 0).astype(np.float32)
+
+
+def _union(a: dict, b: dict) -> dict:
+    best = a if a.get("score", 0) >= b.get("score", 0) else b
+    return {
+        **best,
+        "x1": min(a["x1"], b["x1"]),
+        "y1": min(a["y1"], b["y1"]),
+        "x2": max(a["x2"], b["x2"]),
+        "y2": max(a["y2"], b["y2"]),
+    }
+
+
+def build_boxlib(boxes: list, width: int, height: int) -> dict:
+    """合并后的框 -> boxlib（编号与占位符标签 <AF>01...）"""
+    out = []
+    for i, b in enumerate(boxes):
+        out.append({
+            "id": i,
+            "label": f"<AF>{i + 1:02d}",
+            "x1": int(b["x1"]),
+            "y1": int(b["y1"]),
+            "x2": int(b["x2"]),
+            "y2": int(b["y2"]),
+            "score": round(float(b.get("score", 0.0)), 4),
+            "prompt": b.get("prompt", ""),
+        })
+    return {"image_width": width, "image_height": height, "boxes": out}
+
+
+def _label_font(size: int):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # Pillow < 10.1
+        return ImageFont.load_default()
+
+
+def draw_samed(image: Image.Image, boxlib: dict) -> Image.Image:
+    """在原图上用灰底黑框覆盖每个 box，并居中标注其标签"""
+    samed = image.convert("RGB").copy()
+    draw = ImageDraw.Draw(samed)
+    for box in boxlib["boxes"]:
+        x1, y1, x2, y2 = box["x1"], box["y1"], box["x2"], box["y2"]
+        draw.rectangle([x1, y1, x2 - 1, y2 - 1], fill=(128, 128, 128), outline=(0, 0, 0), width=2)
+        font = _label_font(max(10, min(x2 - x1, y2 - y1) // 4))
+        try:
+            draw.text(((x1 + x2) / 2, (y1 + y2) / 2), box["label"], fill=(255, 255, 255),
+                      font=font, anchor="mm")
+        except ValueError:  # 位图字体不支持 anchor
+            draw.text((x1 + 2, y1 + 2), box["label"], fill=(255, 255, 255), font=font)
+    return samed
@@ -0,0 +1,164 @@
+"""ComfyUI 节点 <=> autofigure2 阶段交接
+
+autofigure2 的入口函数以 `xxx_path` 形式接收图片 / boxlib / SVG。
+若上游函数同时提供去掉 `_path` 后缀的同名参数（如 `image_path` -> `image`），
+则直接传入 PIL / ndarray / dict / str 对象，完全跳过 PNG/JSON 编解码与磁盘 I/O；
+否则才退化为写临时文件（快速 PNG 压缩 + 紧凑 JSON）。
+"""
+import inspect
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+
+from .metrics import record_file_read, record_file_written
+from .workspace import Workspace, new_workspace
+
+# 退化落盘时使用的 PNG 压缩等级：1 级编码速度约为默认 6 级的数倍，体积略大
+FAST_PNG_COMPRESS_LEVEL = 1
+
+
+@lru_cache(maxsize=None)
+def _param_names(func) -> frozenset:
+    try:
+        return frozenset(inspect.signature(func).parameters)
+    except (TypeError, ValueError):
+        return frozenset()
+
+
+def supports(func, name: str) -> bool:
+    """上游函数是否接受名为 name 的参数"""
+    return name in _param_names(func)
+
+
+def in_memory_name(path_param: str) -> str:
+    """`image_path` -> `image`"""
+    return path_param[:-len("_path")] if path_param.endswith("_path") else path_param
+
+
+def to_pil(obj) -> Image.Image:
+    """路径 / PIL / ndarray -> PIL"""
+    if obj is None:
+        return None
+    if isinstance(obj, Image.Image):
+        return obj
+    if isinstance(obj, np.ndarray):
+        if obj.dtype != np.uint8:
+            obj = (np.clip(obj, 0.0, 1.0) * 255).astype(np.uint8)
+        return Image.fromarray(obj)
+    record_file_read(obj)
+    return Image.open(obj)
+
+
+def to_json(obj):
+    """路径 / JSON 字符串 / dict -> dict"""
+    if isinstance(obj, (dict, list)):
+        return obj
+    if isinstance(obj, str) and obj.lstrip().startswith(("{", "[")):
+        return json.loads(obj)
+    record_file_read(obj)
+    with open(obj, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def to_text(obj) -> str:
+    """路径 / SVG 代码 -> SVG 代码"""
+    if isinstance(obj, bytes):
+        return obj.decode('utf-8')
+    if obj.lstrip().startswith("<"):
+        return obj
+    record_file_read(obj)
+    with open(obj, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+class StageHandoff:
+    """单次节点执行内的交接：内存直传优先，必要时落盘（同一对象只写一次）
+
+    落盘文件位于本次执行的工作区（见 workspace.py），节点函数返回后随工作区一起删除。
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self._workspace = None
+        self._written = {}  # id(obj) -> (obj, path)，持有 obj 防止 id 复用
+
+    @property
+    def workspace(self) -> Workspace:
+        """本次执行的工作区（惰性创建）"""
+        if self._workspace is None:
+            self._workspace = new_workspace(self.prefix)
+        return self._workspace
+
+    @property
+    def output_dir(self) -> str:
+        """工作区目录（确保已创建）"""
+        return self.workspace.open()
+
+    def _cached_path(self, obj, filename: str, write) -> str:
+        key = id(obj)
+        if key not in self._written:
+            path = self.workspace.file(f"{len(self._written)}_{filename}")
+            write(path)
+            record_file_written(path)
+            self._written[key] = (obj, path)
+        return self._written[key][1]
+
+    def image(self, func, path_param: str, image) -> dict:
+        """图片参数：PIL / ndarray"""
+        name = in_memory_name(path_param)
+        if supports(func, name):
+            return {name: image}
+        pil = to_pil(image)
+        path = self._cached_path(
+            image, f"{name}.png",
+            lambda p: pil.save(p, compress_level=FAST_PNG_COMPRESS_LEVEL)
+        )
+        return {path_param: path}
+
+    def upload(self, func, path_param: str, upload) -> dict:
+        """LLM 上传图片：UploadImage（见 upload.py）
+
+        内存直传时传入缩小后的图；落盘时将缩小后的图写为 PNG（上游按 .png 读取与声明 MIME）。
+        """
+        name = in_memory_name(path_param)
+        if supports(func, name):
+            return {name: upload.image}
+
+        path = self._cached_path(
+            upload, f"{name}.png",
+            lambda p: upload.image.save(p, format="PNG", compress_level=FAST_PNG_COMPRESS_LEVEL)
+        )
+        return {path_param: path}
+
+    def json(self, func, path_param: str, data) -> dict:
+        """JSON 参数：dict"""
+        name = in_memory_name(path_param)
+        if supports(func, name):
+            return {name: data}
+
+        def write(p):
+            with open(p, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+
+        return {path_param: self._cached_path(data, f"{name}.json", write)}
+
+    def text(self, func, path_param: str, text: str, path: str = None) -> dict:
+        """文本参数：SVG 代码；path 为已在磁盘上的同内容文件时直接复用"""
+        name = in_memory_name(path_param)
+        if supports(func, name):
+            return {name: text}
+        if path and os.path.isfile(path):
+            return {path_param: path}
+
+        def write(p):
+            with open(p, 'w', encoding='utf-8') as f:
+                f.write(text)
+
+        return {path_param: self._cached_path(text, f"{name}.svg", write)}
+
+    def output(self, filename: str) -> str:
+        """上游输出文件路径"""
+        return self.workspace.file(filename)
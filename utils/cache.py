@@ -0,0 +1,134 @@
+"""基于内容哈希的磁盘结果缓存（LRU + 过期淘汰）"""
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+from .constants import DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_BYTES, DEFAULT_CACHE_MAX_AGE
+
+
+def digest_array(array) -> str:
+    """Tensor / ndarray 内容摘要（含 shape 与 dtype）"""
+    if hasattr(array, "cpu"):
+        array = array.cpu().numpy()
+    array = np.ascontiguousarray(array)
+    h = hashlib.sha256()
+    h.update(f"{array.shape}|{array.dtype}".encode())
+    h.update(memoryview(array).cast("B"))
+    return h.hexdigest()
+
+
+def make_key(*parts) -> str:
+    """多个参数 -> 缓存键；bytes 直接参与哈希，数组取内容摘要，其余转为 JSON"""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            data = part
+        elif isinstance(part, np.ndarray) or hasattr(part, "cpu"):
+            data = digest_array(part).encode()
+        else:
+            data = json.dumps(part, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+        h.update(len(data).to_bytes(8, "little"))
+        h.update(data)
+    return h.hexdigest()
+
+
+class ResultCache:
+    """按命名空间划分的磁盘缓存，文件名即内容键
+
+    命中时刷新 mtime，淘汰按 mtime 从旧到新进行（LRU），
+    超过 max_age 秒的条目直接删除，总大小超过 max_bytes 时继续删除最旧条目。
+    """
+
+    def __init__(self, namespace: str, root: str = None,
+                 max_bytes: int = DEFAULT_CACHE_MAX_BYTES, max_age: float = DEFAULT_CACHE_MAX_AGE):
+        self.dir = Path(root or DEFAULT_CACHE_DIR) / namespace
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    def path(self, key: str, suffix: str) -> Path:
+        return self.dir / f"{key}{suffix}"
+
+    def get(self, key: str, suffix: str):
+        """命中返回路径，否则 None"""
+        path = self.path(key, suffix)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def get_bytes(self, key: str, suffix: str):
+        path = self.get(key, suffix)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except OSError:
+            return None
+
+    def get_json(self, key: str, suffix: str = ".json"):
+        data = self.get_bytes(key, suffix)
+        return json.loads(data) if data is not None else None
+
+    def put_bytes(self, key: str, suffix: str, data: bytes) -> Path:
+        """原子写入（先写临时文件再 rename），写后触发淘汰"""
+        self.dir.mkdir(parents=True, exist_ok=True)
+        path = self.path(key, suffix)
+        tmp = self.dir / f".{key}{suffix}.{uuid.uuid4().hex}.tmp"
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        self.evict()
+        return path
+
+    def put_json(self, key: str, data, suffix: str = ".json") -> Path:
+        return self.put_bytes(key, suffix, json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+    def evict(self):
+        """删除过期条目，并按 LRU 将总大小压到 max_bytes 以内
+
+        同一键的多个文件（如 Stage 1 的 .png 与 .json）视为一个条目，按其中最新的 mtime 一起删除。
+        """
+        try:
+            entries = [e for e in os.scandir(self.dir) if e.is_file() and not e.name.startswith(".")]
+        except OSError:
+            return
+        groups = {}  # 键 -> [mtime, 总大小, 路径列表]
+        for entry in entries:
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            group = groups.setdefault(entry.name.split(".", 1)[0], [0.0, 0, []])
+            group[0] = max(group[0], st.st_mtime)
+            group[1] += st.st_size
+            group[2].append(entry.path)
+
+        now = time.time()
+        stats = []
+        for mtime, size, paths in groups.values():
+            if self.max_age and now - mtime > self.max_age:
+                self._remove(*paths)
+            else:
+                stats.append((mtime, size, paths))
+
+        total = sum(size for _, size, _ in stats)
+        if not self.max_bytes or total <= self.max_bytes:
+            return
+        for _, size, paths in sorted(stats):
+            self._remove(*paths)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    @staticmethod
+    def _remove(*paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -1,4 +1,6 @@
 """从 server.py 提取的默认配置"""
+import os
+
 DEFAULT_SAM_PROMPT = "icon,person,animal,robot"
 DEFAULT_PLACEHOLDER_MODE = "label"
 DEFAULT_MERGE_THRESHOLD = 0.01
@@ -16,3 +18,70 @@ PROVIDER_CONFIGS = {
         "default_svg_model": "gemini-3-pro-preview",
     },
 }
+
+# 结果缓存（可通过环境变量 AF_CACHE_DIR 指定位置）
+DEFAULT_CACHE_DIR = os.environ.get(
+    "AF_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "comfyui-autofigure")
+)
+DEFAULT_CACHE_MAX_BYTES = 2 * 1024 ** 3     # 2 GB
+DEFAULT_CACHE_MAX_AGE = 30 * 24 * 3600      # 30 天
+
+# SVG 优化收敛阈值：相邻两轮渲染相似度（SSIM）提升低于该值即停止
+DEFAULT_CONVERGE_THRESHOLD = 0.002
+
+# 本地 SAM3 模型（transformers 格式，可为 HF 仓库名或本地目录）
+DEFAULT_SAM3_MODEL = os.environ.get("AF_SAM3_MODEL", "facebook/sam3")
+
+# RMBG2 去背景模型（HF 仓库名或本地目录）与批量大小
+DEFAULT_RMBG_MODEL = os.environ.get("AF_RMBG_MODEL", "briaai/RMBG-2.0")
+DEFAULT_RMBG_BATCH_SIZE = 8
+
+# 图标去重：dHash 汉明距离阈值（64 位）
+DEFAULT_DEDUPE_DISTANCE = 4
+
+# SVG 预览：最长边与渲染缓存条目数
+DEFAULT_PREVIEW_MAX_SIDE = 1024
+PREVIEW_CACHE_SIZE = 16
+
+# provider 调用：每个端点的并发上限与限流退避（秒）
+DEFAULT_PROVIDER_CONCURRENCY = int(os.environ.get("AF_PROVIDER_CONCURRENCY", "4"))
+DEFAULT_PROVIDER_MAX_RETRIES = 2
+DEFAULT_PROVIDER_BACKOFF_BASE = 2.0
+DEFAULT_PROVIDER_BACKOFF_MAX = 60.0
+
+# Stage 4 流式校验：SVG 响应损坏时的重试次数
+DEFAULT_STREAM_RETRIES = 2
+
+# Stage 1 批量模式默认并发数（实际并发还受 provider 并发上限约束）
+DEFAULT_BATCH_CONCURRENCY = 4
+
+# 无界面流水线：阶段间队列容量（满了即反压上游阶段）
+DEFAULT_PIPELINE_QUEUE_SIZE = 2
+
+# SAM3 分块模式：分块边长、相邻分块重叠像素、每次前向的分块数
+DEFAULT_TILE_SIZE = 1024
+DEFAULT_TILE_OVERLAP = 128
+DEFAULT_TILE_BATCH = 4
+
+# CPU 推理后端：算子线程数（0 为框架默认），可通过环境变量 AF_CPU_THREADS 指定
+DEFAULT_CPU_THREADS = int(os.environ.get("AF_CPU_THREADS", "0"))
+# RMBG 推理后端：torch（fp32，有 GPU 时用 GPU）/ CPU int8 动态量化 / ONNX Runtime（fp32 或 int8）
+RMBG_BACKENDS = ["torch", "cpu_int8", "onnx", "onnx_int8"]
+
+# LLM 上传图片：最长边（0 不限制）、视觉 token 预算（0 不限制）、缩小结果缓存条目数
+DEFAULT_UPLOAD_MAX_SIDE = 1536
+DEFAULT_UPLOAD_TOKEN_BUDGET = 0
+UPLOAD_CACHE_SIZE = 8
+
+# 作业工作区：上游函数所需的临时文件（空目录则为系统临时目录下的 autofigure/）
+# mode 为 ram 时放在 /dev/shm（tmpfs）；总大小超过 max_bytes 时淘汰最旧的闲置工作区
+DEFAULT_WORKSPACE_DIR = os.environ.get("AF_WORKSPACE_DIR", "")
+DEFAULT_WORKSPACE_MODE = os.environ.get("AF_WORKSPACE_MODE", "disk")
+DEFAULT_WORKSPACE_MAX_BYTES = int(os.environ.get("AF_WORKSPACE_MAX_BYTES", str(1024 ** 3)))
+# 调试用：为 1 时节点结束后保留工作区（仍受总大小限制）
+DEFAULT_WORKSPACE_KEEP = os.environ.get("AF_WORKSPACE_KEEP", "") == "1"
+
+# SVG 保存：压缩时保留的小数位数、svgz 的 gzip 压缩等级、后台写入队列容量（满了即阻塞保存节点）
+DEFAULT_SVG_PRECISION = 2
+SVGZ_COMPRESS_LEVEL = 6
+DEFAULT_SAVE_QUEUE_SIZE = 64
@@ -0,0 +1,115 @@
+"""无 GPU 环境的推理加速：torch 动态 int8 量化、ONNX Runtime、线程数配置与导出缓存
+
+- cpu_int8：对 nn.Linear 做 torch 动态量化（权重 int8、激活运行时量化），无需校准数据，
+  量化后的权重缓存在磁盘，之后加载时不再读取 fp32 权重；
+- onnx / onnx_int8：首次使用时把模型导出为 ONNX（可再做 int8 动态量化），
+  结果按 (模型, 输入尺寸, 变体) 缓存在磁盘，之后直接加载，不再经过 PyTorch。
+"""
+import hashlib
+import os
+import threading
+
+from .constants import DEFAULT_CACHE_DIR, DEFAULT_CPU_THREADS
+from .lazy import torch
+
+EXPORT_DIR = os.path.join(DEFAULT_CACHE_DIR, "exports")
+ONNX_OPSET = 17
+
+_threads_lock = threading.Lock()
+_threads_set = None
+
+
+def configure_threads(threads: int = DEFAULT_CPU_THREADS):
+    """设置 torch CPU 算子线程数（0 表示保持 torch 默认值）
+
+    torch.set_num_threads 为进程级设置，对所有 torch 模型生效，后设置的值覆盖之前的值；
+    因此各引擎在每次推理前调用，而不是只在加载时设置一次，常驻模型也不按线程数区分。
+    ONNX Runtime 会话的线程数则是会话自身的选项（见 OnnxModel）。
+    """
+    global _threads_set
+    if threads <= 0:
+        return
+    with _threads_lock:
+        if _threads_set != threads:
+            torch.set_num_threads(threads)
+            _threads_set = threads
+
+
+def quantize_int8(model):
+    """fp32 模型 -> Linear 层动态 int8 量化后的 CPU 模型"""
+    quantization = getattr(torch, "ao", torch).quantization
+    return quantization.quantize_dynamic(model.to("cpu").eval(), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def cached_int8(path: str, load_pretrained, build_empty):
+    """int8 动态量化模型的转换缓存
+
+    首次：加载 fp32 预训练权重 -> 量化 -> 保存量化后的 state_dict；
+    之后：按配置构建空模型 -> 量化结构 -> 直接载入缓存的 int8 权重，跳过 fp32 权重的读取。
+    """
+    if os.path.isfile(path):
+        try:
+            model = quantize_int8(build_empty())
+            model.load_state_dict(torch.load(path, map_location="cpu", weights_only=False))
+            return model.eval()
+        except (RuntimeError, KeyError, ValueError, OSError) as e:
+            # 模型或 torch 版本变化导致缓存不匹配时重新转换
+            print(f"[AutoFigure] Ignoring stale int8 cache {path}: {e}")
+    model = quantize_int8(load_pretrained())
+    tmp = f"{path}.{os.getpid()}.tmp"
+    torch.save(model.state_dict(), tmp)
+    os.replace(tmp, path)
+    print(f"[AutoFigure] Cached int8 model at {path}")
+    return model
+
+
+def export_path(model_id: str, variant: str, suffix: str = ".onnx") -> str:
+    """导出缓存路径：目录名含模型名，另加完整 id 的哈希避免不同本地路径同名冲突"""
+    name = os.path.basename(os.path.normpath(model_id)).replace(os.sep, "_") or "model"
+    digest = hashlib.sha1(model_id.encode("utf-8")).hexdigest()[:10]
+    directory = os.path.join(EXPORT_DIR, f"{name}_{digest}")
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{variant}{suffix}")
+
+
+def export_onnx(module, example, path: str, input_name: str = "input", output_name: str = "output"):
+    """导出 ONNX（batch 维动态）；先写临时文件再替换，中断不会留下损坏的缓存"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with torch.inference_mode():
+        torch.onnx.export(
+            module.to("cpu").eval(), example, tmp,
+            input_names=[input_name], output_names=[output_name],
+            dynamic_axes={input_name: {0: "batch"}, output_name: {0: "batch"}},
+            opset_version=ONNX_OPSET,
+        )
+    os.replace(tmp, path)
+    print(f"[AutoFigure] Exported ONNX model to {path}")
+    return path
+
+
+def quantize_onnx(src: str, dst: str):
+    """ONNX 权重动态 int8 量化（结果同样缓存）"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    tmp = f"{dst}.{os.getpid()}.tmp"
+    quantize_dynamic(src, tmp, weight_type=QuantType.QInt8)
+    os.replace(tmp, dst)
+    print(f"[AutoFigure] Quantized ONNX model to {dst}")
+    return dst
+
+
+class OnnxModel:
+    """ONNX Runtime CPU 会话"""
+
+    def __init__(self, path: str, threads: int = DEFAULT_CPU_THREADS):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.path = path
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, inputs):
+        """inputs: float32 ndarray -> 第一个输出 ndarray"""
+        return self.session.run(None, {self.input_name: inputs})[0]
@@ -0,0 +1,73 @@
+"""ICON_SET：变长图标集合（替代按最大尺寸 padding 的 IMAGE batch）"""
+import numpy as np
+
+
+class IconSet:
+    """所有图标的 RGBA uint8 像素打包在一块连续缓冲区中，按 offsets / shapes 切分
+
+    每个图标保持原始尺寸，内存只占各图标像素之和；取出的图标是缓冲区上的只读视图。
+    重复图标（groups 相同）共享同一段像素。
+    """
+
+    def __init__(self, buffer: np.ndarray, offsets: np.ndarray, shapes: np.ndarray, groups: np.ndarray = None):
+        self.buffer = buffer      # uint8 [total]
+        self.offsets = offsets    # int64 [N]
+        self.shapes = shapes      # int64 [N, 2] (H, W)，通道固定为 RGBA
+        self.groups = groups if groups is not None else np.arange(len(offsets), dtype=np.int64)  # int64 [N]
+
+    @classmethod
+    def from_arrays(cls, arrays: list) -> "IconSet":
+        """[H, W, 4] uint8 数组列表 -> IconSet"""
+        return cls.from_unique(arrays, list(range(len(arrays))))
+
+    @classmethod
+    def from_unique(cls, unique: list, groups: list) -> "IconSet":
+        """去重后的图标 + 每个图标所属组号 -> IconSet（每组像素只存一份）"""
+        u_shapes = np.array([a.shape[:2] for a in unique], dtype=np.int64).reshape(-1, 2)
+        u_sizes = u_shapes[:, 0] * u_shapes[:, 1] * 4
+        u_offsets = np.concatenate([[0], np.cumsum(u_sizes)[:-1]]).astype(np.int64) if len(unique) else np.zeros(0, np.int64)
+        buffer = np.empty(int(u_sizes.sum()), dtype=np.uint8)
+        for arr, off, size in zip(unique, u_offsets, u_sizes):
+            buffer[off:off + size] = np.ascontiguousarray(arr, dtype=np.uint8).reshape(-1)
+        buffer.flags.writeable = False
+        groups = np.asarray(groups, dtype=np.int64)
+        return cls(buffer, u_offsets[groups], u_shapes[groups].reshape(-1, 2), groups)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        """第 i 个图标 [H, W, 4] uint8（视图，不复制）"""
+        h, w = self.shapes[i]
+        off = self.offsets[i]
+        return self.buffer[off:off + h * w * 4].reshape(h, w, 4)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def nbytes(self) -> int:
+        return self.buffer.nbytes
+
+    @property
+    def unique_count(self) -> int:
+        return len(np.unique(self.groups))
+
+    def to_padded(self, dtype=np.float32):
+        """兼容旧接口：按最大尺寸左上角对齐 padding -> (icons [N, H, W, 4], masks [N, H, W])
+
+        dtype 为 float32 时取值 0-1；为 uint8 时直接复制像素，不做换算。
+        """
+        max_h, max_w = self.shapes.max(axis=0)
+        icons = np.zeros((len(self), max_h, max_w, 4), dtype=dtype)
+        for i, icon in enumerate(self):
+            h, w = icon.shape[:2]
+            if dtype == np.uint8:
+                icons[i, :h, :w] = icon
+            else:
+                np.divide(icon, dtype(255), out=icons[i, :h, :w])
+        return icons, icons[..., 3].copy()
+
+    def __repr__(self) -> str:
+        return f"IconSet(n={len(self)}, unique={self.unique_count}, bytes={self.nbytes})"
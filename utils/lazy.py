@@ -0,0 +1,35 @@
+"""延迟导入：首次访问属性时才真正 import，插件注册节点时不加载 torch / autofigure2 等重依赖"""
+import importlib
+import threading
+
+
+class LazyModule:
+    """模块代理：`torch = LazyModule("torch")` 后照常使用 `torch.xxx`"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<LazyModule {self._name!r} ({state})>"
+
+
+torch = LazyModule("torch")
+# 原项目入口（其导入链会拉起 transformers / OCR 等）
+autofigure2 = LazyModule("autofigure2")
@@ -0,0 +1,302 @@
+"""节点级性能指标：墙钟时间、子阶段耗时、LLM 请求数与耗时、临时文件 I/O、峰值显存
+
+各节点的 FUNCTION 由 @instrumented(stage) 包装：执行期间通过 contextvars 暴露当前 StageMetrics，
+代码各处用 phase(name) / record_llm / record_io 上报（没有当前指标时为空操作）；
+结束后指标追加为节点的最后一个 JSON 输出，并累加到进程级汇总。
+token 用量由上游函数内部的请求产生，插件拿不到响应，因此不统计。
+
+Prometheus 文本格式导出（可选，环境变量在导入时读取）：
+- AF_METRICS_FILE=/path/autofigure.prom  节点结束后原子覆盖写入，至多每 FILE_WRITE_INTERVAL 秒一次
+                                          （node_exporter textfile collector）
+- AF_METRICS_PORT=9464                    导入时启动后台 HTTP 服务，GET /metrics
+"""
+import atexit
+import contextvars
+import functools
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_current = contextvars.ContextVar("af_stage_metrics", default=None)
+
+# 指标文件最短写入间隔（秒）；间隔内的更新由定时器合并为一次写入
+FILE_WRITE_INTERVAL = 5.0
+
+
+def _cuda():
+    """已加载且可用的 torch.cuda（不主动导入 torch）"""
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        return torch.cuda
+    return None
+
+
+class StageMetrics:
+    """单次节点执行的指标"""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.wall_s = 0.0
+        self.phases = {}
+        self.llm = {"requests": 0, "errors": 0, "latency_s": 0.0, "max_latency_s": 0.0}
+        self.io = {"read_bytes": 0, "written_bytes": 0}
+        self.peak_cuda_bytes = None
+        self.error = None
+        self._lock = threading.Lock()
+        self._start = None
+
+    def start(self):
+        cuda = _cuda()
+        if cuda is not None:
+            cuda.reset_peak_memory_stats()
+        self._start = time.perf_counter()
+
+    def finish(self, error=None):
+        self.wall_s = time.perf_counter() - self._start
+        self.error = error
+        cuda = _cuda()
+        if cuda is not None:
+            self.peak_cuda_bytes = cuda.max_memory_allocated()
+
+    def add_phase(self, name: str, seconds: float):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def add_llm(self, latency: float, ok: bool = True):
+        with self._lock:
+            self.llm["requests"] += 1
+            self.llm["errors"] += 0 if ok else 1
+            self.llm["latency_s"] += latency
+            self.llm["max_latency_s"] = max(self.llm["max_latency_s"], latency)
+
+    def add_io(self, read: int = 0, written: int = 0):
+        with self._lock:
+            self.io["read_bytes"] += read
+            self.io["written_bytes"] += written
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "stage": self.stage,
+                "wall_s": round(self.wall_s, 4),
+                "phases_s": {k: round(v, 4) for k, v in self.phases.items()},
+                "llm": {k: round(v, 4) if isinstance(v, float) else v for k, v in self.llm.items()},
+                "temp_io": dict(self.io),
+                "peak_cuda_bytes": self.peak_cuda_bytes,
+                "error": self.error,
+            }
+
+
+def current():
+    """当前节点执行的 StageMetrics（不在节点内时为 None）"""
+    return _current.get()
+
+
+@contextmanager
+def phase(name: str):
+    """记录子阶段耗时（同名累加）"""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_phase(name, time.perf_counter() - start)
+
+
+def record_llm(latency: float, ok: bool = True):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add_llm(latency, ok)
+
+
+def record_io(read: int = 0, written: int = 0):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add_io(read, written)
+
+
+def record_file_read(path) -> None:
+    try:
+        record_io(read=os.path.getsize(path))
+    except OSError:
+        pass
+
+
+def record_file_written(path) -> None:
+    try:
+        record_io(written=os.path.getsize(path))
+    except OSError:
+        pass
+
+
+# ---------- 进程级汇总与 Prometheus 导出 ----------
+
+_totals = {}
+_totals_lock = threading.Lock()
+_server = None
+_server_lock = threading.Lock()
+_metrics_file = os.environ.get("AF_METRICS_FILE")
+_file_lock = threading.Lock()
+_file_written = 0.0   # 上次写入的 time.monotonic()
+_file_timer = None    # 已排定的延迟写入
+
+
+def _accumulate(metrics: StageMetrics):
+    data = metrics.to_dict()
+    with _totals_lock:
+        t = _totals.setdefault(metrics.stage, {
+            "runs": 0, "errors": 0, "seconds": 0.0, "last_seconds": 0.0, "phases": {},
+            "llm_requests": 0, "llm_errors": 0, "llm_seconds": 0.0,
+            "read_bytes": 0, "written_bytes": 0, "peak_cuda_bytes": 0,
+        })
+        t["runs"] += 1
+        t["errors"] += 1 if data["error"] else 0
+        t["seconds"] += data["wall_s"]
+        t["last_seconds"] = data["wall_s"]
+        for name, seconds in data["phases_s"].items():
+            t["phases"][name] = t["phases"].get(name, 0.0) + seconds
+        t["llm_requests"] += data["llm"]["requests"]
+        t["llm_errors"] += data["llm"]["errors"]
+        t["llm_seconds"] += data["llm"]["latency_s"]
+        t["read_bytes"] += data["temp_io"]["read_bytes"]
+        t["written_bytes"] += data["temp_io"]["written_bytes"]
+        t["peak_cuda_bytes"] = max(t["peak_cuda_bytes"], data["peak_cuda_bytes"] or 0)
+
+
+def snapshot() -> dict:
+    """各阶段累计指标"""
+    with _totals_lock:
+        return {stage: {**t, "phases": dict(t["phases"])} for stage, t in _totals.items()}
+
+
+def prometheus_text() -> str:
+    """Prometheus 文本暴露格式"""
+    series = [
+        ("af_stage_runs_total", "counter", "Node executions", "runs"),
+        ("af_stage_errors_total", "counter", "Node executions that raised", "errors"),
+        ("af_stage_seconds_total", "counter", "Total node wall time", "seconds"),
+        ("af_stage_last_seconds", "gauge", "Wall time of the most recent execution", "last_seconds"),
+        ("af_llm_requests_total", "counter", "LLM provider calls", "llm_requests"),
+        ("af_llm_errors_total", "counter", "Failed LLM provider calls (including retried ones)", "llm_errors"),
+        ("af_llm_seconds_total", "counter", "Total LLM provider call latency", "llm_seconds"),
+        ("af_temp_read_bytes_total", "counter", "Bytes read from temporary hand-off files", "read_bytes"),
+        ("af_temp_written_bytes_total", "counter", "Bytes written to temporary hand-off files", "written_bytes"),
+        ("af_peak_cuda_bytes", "gauge", "Peak CUDA memory allocated during a node execution", "peak_cuda_bytes"),
+    ]
+    totals = snapshot()
+    lines = []
+    for name, kind, help_text, field in series:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for stage, t in sorted(totals.items()):
+            lines.append(f'{name}{{stage="{stage}"}} {t[field]}')
+    lines.append("# HELP af_phase_seconds_total Total time spent in node sub-phases")
+    lines.append("# TYPE af_phase_seconds_total counter")
+    for stage, t in sorted(totals.items()):
+        for phase_name, seconds in sorted(t["phases"].items()):
+            lines.append(f'af_phase_seconds_total{{stage="{stage}",phase="{phase_name}"}} {round(seconds, 6)}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: str):
+    """原子写入 Prometheus 文本文件"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(tmp, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0"):
+    """启动 /metrics 服务（进程内只启动一次）"""
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+            print(f"[AutoFigure] Metrics endpoint listening on {host}:{port}/metrics")
+    return _server
+
+
+def _flush_file():
+    """写入指标文件（定时器与退出时调用）"""
+    global _file_written, _file_timer
+    with _file_lock:
+        _file_timer = None
+        _file_written = time.monotonic()
+        try:
+            write_prometheus(_metrics_file)
+        except OSError as e:
+            print(f"[AutoFigure] Metrics export failed: {e}")
+
+
+def _export():
+    """节点结束后更新指标文件：距上次写入不足 FILE_WRITE_INTERVAL 时排定一次延迟写入"""
+    global _file_timer
+    if not _metrics_file:
+        return
+    with _file_lock:
+        wait = _file_written + FILE_WRITE_INTERVAL - time.monotonic()
+        if wait > 0:
+            if _file_timer is None:
+                _file_timer = threading.Timer(wait, _flush_file)
+                _file_timer.daemon = True
+                _file_timer.start()
+            return
+    _flush_file()
+
+
+def instrumented(stage: str):
+    """节点 FUNCTION 装饰器：记录指标并作为最后一个输出（JSON）返回"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            metrics = StageMetrics(stage)
+            token = _current.set(metrics)
+            metrics.start()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                metrics.finish(error=f"{type(e).__name__}: {e}")
+                _accumulate(metrics)
+                _export()
+                raise
+            finally:
+                _current.reset(token)
+            metrics.finish()
+            _accumulate(metrics)
+            _export()
+            return tuple(result) + (metrics.to_dict(),)
+        return wrapper
+    return decorator
+
+
+if _metrics_file:
+    atexit.register(_flush_file)
+if os.environ.get("AF_METRICS_PORT"):
+    try:
+        start_metrics_server(int(os.environ["AF_METRICS_PORT"]))
+    except (OSError, ValueError) as e:
+        print(f"[AutoFigure] Metrics endpoint failed to start: {e}")
@@ -0,0 +1,50 @@
+"""图标感知哈希去重：dHash + 平均色 + 宽高比"""
+import numpy as np
+from PIL import Image
+
+from .constants import DEFAULT_DEDUPE_DISTANCE
+
+_COLOR_TOLERANCE = 16.0
+_ASPECT_TOLERANCE = 0.15
+
+
+def dhash(image: Image.Image, size: int = 8) -> int:
+    """差值哈希：缩放为 (size+1)×size 灰度图，比较水平相邻像素，得到 size² 位整数"""
+    gray = np.asarray(image.convert("L").resize((size + 1, size), Image.BILINEAR), dtype=np.int16)
+    bits = (gray[:, 1:] > gray[:, :-1]).flatten()
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+
+def icon_signature(image: Image.Image):
+    """(dHash, 平均 RGB, 宽高比)"""
+    mean_rgb = np.asarray(image.convert("RGB").resize((8, 8), Image.BOX), dtype=np.float32).mean(axis=(0, 1))
+    return dhash(image), mean_rgb, image.width / max(1, image.height)
+
+
+def _similar(a, b, max_distance: int) -> bool:
+    hash_a, color_a, aspect_a = a
+    hash_b, color_b, aspect_b = b
+    if bin(hash_a ^ hash_b).count("1") > max_distance:
+        return False
+    if float(np.abs(color_a - color_b).max()) > _COLOR_TOLERANCE:
+        return False
+    return abs(aspect_a - aspect_b) <= _ASPECT_TOLERANCE * max(aspect_a, aspect_b)
+
+
+def group_duplicates(images: list, max_distance: int = DEFAULT_DEDUPE_DISTANCE):
+    """相同图标分组 -> (groups, representatives)
+
+    groups[i] 为第 i 张图所属组号（即 representatives 中的下标），
+    representatives 为每组首次出现的图片下标。
+    """
+    signatures = [icon_signature(img) for img in images]
+    groups, representatives = [], []
+    for i, sig in enumerate(signatures):
+        for g, rep in enumerate(representatives):
+            if _similar(sig, signatures[rep], max_distance):
+                groups.append(g)
+                break
+        else:
+            groups.append(len(representatives))
+            representatives.append(i)
+    return groups, representatives
@@ -0,0 +1,225 @@
+"""无界面多任务流水线：Stage 1 → 5（含保存）按阶段并行执行
+
+每个阶段有自己的执行器与工作协程，阶段之间用有界队列连接（满了即反压上游）：
+- 网络密集阶段（1 文生图、4 SVG 生成）使用线程池；
+- CPU 密集阶段（2 SAM3、3 RMBG、5 替换 + 保存）使用进程池（也可改为线程池）。
+这样任务 B 可以在任务 A 等待 SVG LLM 时进行分割，CPU 与网络同时有活干。
+
+用法：
+    runner = PipelineRunner(cpu_workers=1, io_workers=4)
+    results = runner.run([
+        {"method_text": "...", "provider": "bianxie", "api_key": "...",
+         "stage2": {"sam_prompt": "icon,robot"}, "stage4": {"optimize_iterations": 1}},
+    ])
+
+任务字典中 stage1 ~ stage5 与 save 字段为对应节点的额外参数；单个任务失败不影响其它任务。
+"""
+import asyncio
+import importlib.util
+import multiprocessing
+import sys
+import time
+import traceback
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .adapters import compact_images
+from .constants import DEFAULT_PIPELINE_QUEUE_SIZE
+from .provider_client import run_coroutine_sync
+
+
+def stage1_generate(state: dict) -> dict:
+    from ..nodes.generator import AF_LLM_ImageGenerator
+    job = state["job"]
+    figure, metadata, metrics = AF_LLM_ImageGenerator().generate(
+        job["method_text"], job["provider"], job["api_key"], **job.get("stage1", {})
+    )
+    state.update(figure=figure, figure_metadata=metadata)
+    state.setdefault("metrics", {})["stage1"] = metrics
+    return state
+
+
+def stage2_segment(state: dict) -> dict:
+    from ..nodes.segmenter import AF_SAM3_Segment
+    from .constants import DEFAULT_SAM_PROMPT
+    kwargs = dict(state["job"].get("stage2", {}))
+    sam_prompt = kwargs.pop("sam_prompt", DEFAULT_SAM_PROMPT)
+    samed, boxlib, _, metrics = AF_SAM3_Segment().segment(state["figure"], sam_prompt, **kwargs)
+    state.update(samed=samed, boxlib=boxlib)
+    state["metrics"]["stage2"] = metrics
+    return state
+
+
+def stage3_extract(state: dict) -> dict:
+    from ..nodes.extractor import AF_IconExtractor
+    kwargs = {"pad_icons_batch": False, **state["job"].get("stage3", {})}
+    _, _, icon_infos, icon_set, metrics = AF_IconExtractor().extract(state["figure"], state["boxlib"], **kwargs)
+    state.update(icon_infos=icon_infos, icon_set=icon_set)
+    state["metrics"]["stage3"] = metrics
+    return state
+
+
+def stage4_svg(state: dict) -> dict:
+    from ..nodes.svg_generator import AF_SVG_TemplateGenerator
+    job = state["job"]
+    kwargs = {"enable_preview": False, **job.get("stage4", {})}
+    svg_template, _, scale_factors, optimize_scores, metrics = AF_SVG_TemplateGenerator().generate(
+        state["figure"], state["samed"], state["boxlib"], job["provider"], job["api_key"], **kwargs
+    )
+    state.update(svg_template=svg_template, scale_factors=scale_factors, optimize_scores=optimize_scores)
+    state["metrics"]["stage4"] = metrics
+    return state
+
+
+def stage5_replace_and_save(state: dict) -> dict:
+    from ..nodes.svg_replacer import AF_SVG_IconReplacer
+    from ..nodes.svg_saver import AF_SVG_Saver
+    job = state["job"]
+    kwargs = {"enable_preview": False, **job.get("stage5", {})}
+    final_svg, _, metrics = AF_SVG_IconReplacer().replace(
+        state["svg_template"], state["boxlib"], state["scale_factors"], icon_set=state["icon_set"], **kwargs
+    )
+    save_kwargs = dict(job.get("save", {}))
+    filename_prefix = save_kwargs.pop("filename_prefix", "AutoFigure")
+    filepath, save_metrics = AF_SVG_Saver().save(final_svg, filename_prefix, **save_kwargs)
+    state.update(final_svg=final_svg, filepath=filepath)
+    state["metrics"].update(stage5=metrics, save=save_metrics)
+    return state
+
+
+# (阶段名, 函数, 执行器类型)
+STAGES = [
+    ("stage1", stage1_generate, "io"),
+    ("stage2", stage2_segment, "cpu"),
+    ("stage3", stage3_extract, "cpu"),
+    ("stage4", stage4_svg, "io"),
+    ("stage5", stage5_replace_and_save, "cpu"),
+]
+
+_DONE = object()
+
+# 插件包名（ComfyUI 按目录名加载，形如 "ComfyUI-AutoFigure"）与目录
+_PACKAGE_NAME = __name__.rsplit(".", 2)[0]
+_PACKAGE_DIR = Path(__file__).resolve().parent.parent
+
+
+def _init_worker(package_name: str, package_dir: str):
+    """spawn 子进程初始化：按父进程中的包名重新加载插件包，阶段函数才能按名反序列化"""
+    if package_name in sys.modules:
+        return
+    spec = importlib.util.spec_from_file_location(
+        package_name, str(Path(package_dir) / "__init__.py"), submodule_search_locations=[package_dir]
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[package_name] = module
+    spec.loader.exec_module(module)
+
+
+def _timed(fn, state: dict) -> dict:
+    """在执行器中运行阶段函数并记录耗时（进程池中也可 pickle）
+
+    流水线内的图片只在 AutoFigure 节点之间传递，全程使用 uint8 IMAGE；
+    进程池传递的是 torch 张量，由 torch 的 multiprocessing 序列化走共享内存。
+    """
+    start = time.perf_counter()
+    with compact_images():
+        state = fn(state)
+    state.setdefault("timings", {})[fn.__name__] = round(time.perf_counter() - start, 3)
+    return state
+
+
+class PipelineRunner:
+    """多任务流水线执行器"""
+
+    def __init__(self, cpu_workers: int = 1, io_workers: int = 4,
+                 queue_size: int = DEFAULT_PIPELINE_QUEUE_SIZE, cpu_executor: str = "process"):
+        self.cpu_workers = cpu_workers
+        self.io_workers = io_workers
+        self.queue_size = queue_size
+        self.cpu_executor = cpu_executor
+
+    def _make_executor(self, kind: str):
+        if kind == "io":
+            return ThreadPoolExecutor(max_workers=self.io_workers), self.io_workers
+        if self.cpu_executor == "process":
+            # spawn：避免 fork 继承已加载的 torch 线程池 / CUDA 上下文；每个进程常驻各自的模型
+            context = multiprocessing.get_context("spawn")
+            executor = ProcessPoolExecutor(
+                max_workers=self.cpu_workers, mp_context=context,
+                initializer=_init_worker, initargs=(_PACKAGE_NAME, str(_PACKAGE_DIR)),
+            )
+            return executor, self.cpu_workers
+        return ThreadPoolExecutor(max_workers=self.cpu_workers), self.cpu_workers
+
+    def run(self, jobs: list) -> list:
+        """同步执行全部任务，按输入顺序返回结果"""
+        return run_coroutine_sync(self.arun(jobs))
+
+    async def arun(self, jobs: list) -> list:
+        loop = asyncio.get_running_loop()
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(len(STAGES) + 1)]
+        results = [None] * len(jobs)
+        executors = []
+
+        async def worker(stage_fn, executor, inbox, outbox):
+            while True:
+                item = await inbox.get()
+                if item is _DONE:
+                    await inbox.put(_DONE)  # 让同阶段其它工作协程也退出
+                    return
+                index, state = item
+                if "error" not in state:
+                    try:
+                        state = await loop.run_in_executor(executor, _timed, stage_fn, state)
+                    except Exception as e:
+                        state["error"] = f"{stage_fn.__name__}: {e}"
+                        state["traceback"] = traceback.format_exc()
+                        print(f"[AutoFigure] Pipeline job {index} failed in {stage_fn.__name__}: {e}")
+                await outbox.put((index, state))
+
+        async def feed():
+            for index, job in enumerate(jobs):
+                await queues[0].put((index, {"job": job}))
+            await queues[0].put(_DONE)
+
+        async def collect():
+            for _ in range(len(jobs)):
+                index, state = await queues[-1].get()
+                results[index] = self._summarize(state)
+
+        try:
+            stage_groups = []
+            for i, (_, fn, kind) in enumerate(STAGES):
+                executor, n_workers = self._make_executor(kind)
+                executors.append(executor)
+                stage_groups.append([
+                    asyncio.create_task(worker(fn, executor, queues[i], queues[i + 1]))
+                    for _ in range(n_workers)
+                ])
+
+            feeder = asyncio.create_task(feed())
+            await collect()
+            await feeder
+            # 逐阶段收尾：上一阶段全部退出后再通知下一阶段
+            for i, tasks in enumerate(stage_groups):
+                await asyncio.gather(*tasks)
+                if i + 1 < len(stage_groups):
+                    await queues[i + 1].put(_DONE)
+        finally:
+            for executor in executors:
+                executor.shutdown(wait=False, cancel_futures=True)
+        return results
+
+    @staticmethod
+    def _summarize(state: dict) -> dict:
+        """去掉张量等大对象，只保留结果摘要"""
+        return {
+            "filepath": state.get("filepath"),
+            "final_svg": state.get("final_svg"),
+            "boxlib": state.get("boxlib"),
+            "optimize_scores": state.get("optimize_scores"),
+            "timings": state.get("timings", {}),
+            "metrics": state.get("metrics", {}),
+            "error": state.get("error"),
+            "traceback": state.get("traceback"),
+        }
@@ -0,0 +1,87 @@
+"""SVG 预览渲染：保持宽高比、限制最长边、按内容哈希缓存"""
+from __future__ import annotations
+
+import hashlib
+import io
+import re
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from .adapters import TypeAdapter
+from .lazy import torch
+from .constants import DEFAULT_PREVIEW_MAX_SIDE, PREVIEW_CACHE_SIZE
+
+_SVG_TAG_RE = re.compile(r'<svg\b[^>]*>', re.S)
+# 只接受无单位或 px 的数值（%、em、mm 等无法换算为像素，交给 viewBox）；属性名前须为空白，排除 stroke-width
+_NUM_RE = r'(?<=\s){}\s*=\s*["\']\s*([\d.]+)\s*(?:px)?\s*["\']'
+_VIEWBOX_RE = re.compile(r'(?<=\s)viewBox\s*=\s*["\']\s*[-\d.]+[\s,]+[-\d.]+[\s,]+([\d.]+)[\s,]+([\d.]+)')
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def svg_size(svg_code: str):
+    """根元素的 (width, height)：优先 width/height 属性，否则取 viewBox；解析失败返回 None"""
+    m = _SVG_TAG_RE.search(svg_code)
+    if not m:
+        return None
+    tag = m.group(0)
+    w = re.search(_NUM_RE.format("width"), tag)
+    h = re.search(_NUM_RE.format("height"), tag)
+    if w and h and float(w.group(1)) > 0 and float(h.group(1)) > 0:
+        return float(w.group(1)), float(h.group(1))
+    vb = _VIEWBOX_RE.search(tag)
+    if vb and float(vb.group(1)) > 0 and float(vb.group(2)) > 0:
+        return float(vb.group(1)), float(vb.group(2))
+    return None
+
+
+def preview_size(svg_code: str, max_side: int = DEFAULT_PREVIEW_MAX_SIDE):
+    """按 SVG 自身宽高比缩放到最长边 max_side"""
+    size = svg_size(svg_code) or (max_side, max_side)
+    scale = max_side / max(size)
+    return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+
+def blank_preview() -> torch.Tensor:
+    """关闭预览时的占位输出"""
+    return torch.zeros((1, 64, 64, 3))
+
+
+def render_preview(svg_code: str, max_side: int = DEFAULT_PREVIEW_MAX_SIDE, enabled: bool = True) -> torch.Tensor:
+    """SVG -> ComfyUI IMAGE [1, H, W, 3]；相同内容与尺寸命中缓存时返回缓存结果的副本"""
+    if not enabled:
+        return blank_preview()
+
+    key = (hashlib.sha1(svg_code.encode("utf-8")).hexdigest(), max_side)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key].clone()
+
+    width, height = preview_size(svg_code, max_side)
+    try:
+        import cairosvg
+        png_data = cairosvg.svg2png(
+            bytestring=svg_code.encode(),
+            output_width=width,
+            output_height=height
+        )
+        rgba = Image.open(io.BytesIO(png_data)).convert("RGBA")
+        canvas = Image.new("RGBA", rgba.size, (255, 255, 255, 255))
+        canvas.alpha_composite(rgba)
+        # 预览为普通 IMAGE 输出且会进入缓存，固定为 float32
+        tensor = TypeAdapter.pil_to_tensor(canvas, torch.float32)
+    except Exception as e:
+        # 失败返回空白图（不缓存，便于修复环境后重试）
+        print(f"[AutoFigure] SVG preview failed: {e}")
+        return torch.zeros((1, height, width, 3))
+
+    with _cache_lock:
+        _cache[key] = tensor
+        while len(_cache) > PREVIEW_CACHE_SIZE:
+            _cache.popitem(last=False)
+    # 下游节点可能原地修改 IMAGE，缓存中的张量不直接交出
+    return tensor.clone()
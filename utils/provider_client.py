@@ -0,0 +1,140 @@
+"""共享 provider 客户端：并发上限 + 限流退避重试
+
+同一 (provider, base_url) 在进程内共用一个 ProviderClient。所有对 autofigure2 LLM
+入口函数的调用都经由 ProviderClient.call：
+- 并发数受 per-provider 信号量限制，避免批量任务同时打爆接口；
+- 遇到 408 / 425 / 429 / 5xx 或连接、超时异常时按指数退避（带抖动，优先遵循 Retry-After）重试，
+  默认最多重试 DEFAULT_PROVIDER_MAX_RETRIES 次；LLM 调用耗时长，重试次数不宜多。
+
+HTTP 请求由上游函数内部发出，插件拿不到其连接，因此这里没有 keep-alive 连接池，也没有 asyncio 接口
+（原需求中的这两部分未实现，需上游开放 session / client 参数后再接入）；
+批量与流水线的并发由调用方的线程池 / 事件循环提供，这一层只负责并发上限与重试。
+"""
+import asyncio
+import contextvars
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from .metrics import record_llm
+from .constants import (
+    DEFAULT_PROVIDER_CONCURRENCY,
+    DEFAULT_PROVIDER_MAX_RETRIES,
+    DEFAULT_PROVIDER_BACKOFF_BASE,
+    DEFAULT_PROVIDER_BACKOFF_MAX,
+)
+
+_RETRY_STATUS = {408, 425, 429, 500, 502, 503, 504}
+# 上游 HTTP 库的连接 / 超时异常（模块名, 类名）；只检查已导入的模块，不为此额外导入
+_RETRY_EXCEPTIONS = (
+    ("requests.exceptions", "ConnectionError"),
+    ("requests.exceptions", "Timeout"),
+    ("requests.exceptions", "ChunkedEncodingError"),
+    ("httpx", "TransportError"),
+    ("openai", "APIConnectionError"),  # 含 APITimeoutError
+)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _status_of(exc):
+    for obj in (exc, getattr(exc, "response", None)):
+        for attr in ("status_code", "status"):
+            value = getattr(obj, attr, None)
+            if isinstance(value, int):
+                return value
+    return None
+
+
+def _retry_after(exc):
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After") or headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_exception_types() -> tuple:
+    types = [ConnectionError, TimeoutError]
+    for module_name, name in _RETRY_EXCEPTIONS:
+        cls = getattr(sys.modules.get(module_name), name, None)
+        if isinstance(cls, type):
+            types.append(cls)
+    return tuple(types)
+
+
+def is_retryable(exc) -> bool:
+    """限流、服务端临时错误与网络错误可重试；鉴权 / 参数 / 冲突等错误不重试
+
+    只按 HTTP 状态码与异常类型判断，不匹配错误信息文本。
+    """
+    status = _status_of(exc)
+    if status is not None:
+        return status in _RETRY_STATUS
+    return isinstance(exc, _retry_exception_types())
+
+
+class ProviderClient:
+    """单个 provider 端点的共享客户端"""
+
+    def __init__(self, provider: str, base_url: str,
+                 max_concurrency: int = DEFAULT_PROVIDER_CONCURRENCY,
+                 max_retries: int = DEFAULT_PROVIDER_MAX_RETRIES,
+                 backoff_base: float = DEFAULT_PROVIDER_BACKOFF_BASE,
+                 backoff_max: float = DEFAULT_PROVIDER_BACKOFF_MAX):
+        self.provider = provider
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+
+    def backoff_delay(self, attempt: int, exc=None) -> float:
+        """第 attempt 次重试前的等待秒数：Retry-After 优先，否则指数退避 + 抖动"""
+        retry_after = _retry_after(exc) if exc is not None else None
+        if retry_after is not None:
+            return min(self.backoff_max, retry_after)
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay * (0.5 + random.random() / 2)
+
+    def call(self, func, **kwargs):
+        """在并发上限内调用 func，可重试错误按退避策略重试"""
+        for attempt in range(self.max_retries + 1):
+            with self._semaphore:
+                start = time.perf_counter()
+                try:
+                    result = func(**kwargs)
+                except Exception as e:
+                    record_llm(time.perf_counter() - start, ok=False)
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        raise
+                    error, delay = e, self.backoff_delay(attempt, e)
+                else:
+                    record_llm(time.perf_counter() - start)
+                    return result
+            # 退避期间释放并发名额
+            print(f"[AutoFigure] {self.provider} call failed ({error}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def get_client(provider: str, base_url: str) -> ProviderClient:
+    """取 (provider, base_url) 对应的共享客户端"""
+    key = (provider, base_url.rstrip("/"))
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = ProviderClient(provider, base_url)
+        return _clients[key]
+
+
+def run_coroutine_sync(coro):
+    """在同步代码中运行协程；当前线程已有事件循环（如新版 ComfyUI 执行器）时改在独立线程中运行"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(contextvars.copy_context().run, asyncio.run, coro).result()
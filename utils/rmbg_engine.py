@@ -0,0 +1,186 @@
+"""RMBG2 去背景：进程内常驻模型 + 批量前向，结果直接以 RGBA ndarray 返回"""
+from __future__ import annotations
+
+import os
+import threading
+from contextlib import nullcontext
+
+import numpy as np
+from PIL import Image
+
+from .constants import DEFAULT_RMBG_MODEL, DEFAULT_RMBG_BATCH_SIZE, DEFAULT_CPU_THREADS
+from .cpu_runtime import OnnxModel, cached_int8, configure_threads, export_onnx, export_path, quantize_onnx
+from .lazy import torch
+
+RMBG_INPUT_SIZE = 1024
+# 输入尺寸档位（需手动开启）：裁切按最长边取不小于它的最小一档（上限 RMBG_INPUT_SIZE），同档裁切一起成批，
+# 小图标不再统一放大到 1024×1024；RMBG-2.0 按 1024 训练，小档位的掩码与上游 crop_and_remove_background 不完全一致
+RMBG_SIZE_BUCKETS = (256, 512, 768, RMBG_INPUT_SIZE)
+_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+_POOL = {}
+_POOL_LOCK = threading.Lock()
+
+
+def default_device() -> str:
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+class RMBGHandle:
+    """常驻模型句柄；同一模型的推理串行执行
+
+    backend 为 torch 时按 device 运行 fp32 模型；cpu_int8 / onnx / onnx_int8 固定在 CPU 上运行。
+    ONNX 图按输入尺寸导出，每个尺寸档位在首次用到时导出并创建会话。
+    """
+
+    def __init__(self, model_id: str, device: str, backend: str = "torch", threads: int = DEFAULT_CPU_THREADS):
+        self.model_id = model_id
+        self.backend = backend
+        self.device = device if backend == "torch" else "cpu"
+        self.lock = threading.Lock()
+        self.threads = threads
+        self.model = None
+        self.sessions = {}  # 输入尺寸 -> OnnxModel
+        if backend in ("onnx", "onnx_int8"):
+            return
+        if backend == "cpu_int8":
+            model = cached_int8(export_path(model_id, "rmbg_int8", ".pt"),
+                                lambda: _load_torch_model(model_id), lambda: _build_empty_model(model_id))
+        else:
+            model = _load_torch_model(model_id)
+        self.model = model.to(self.device).eval()
+
+    @staticmethod
+    def _onnx_path(model_id: str, int8: bool, size: int = RMBG_INPUT_SIZE) -> str:
+        """ONNX 导出缓存（每个输入尺寸一份）；首次使用时导出（及量化），之后直接复用"""
+        fp32_path = export_path(model_id, f"rmbg_{size}_fp32")
+        if not os.path.isfile(fp32_path):
+            wrapped = _sigmoid_head(_load_torch_model(model_id))
+            example = torch.zeros((1, 3, size, size), dtype=torch.float32)
+            export_onnx(wrapped, example, fp32_path)
+        if not int8:
+            return fp32_path
+        int8_path = export_path(model_id, f"rmbg_{size}_int8")
+        if not os.path.isfile(int8_path):
+            quantize_onnx(fp32_path, int8_path)
+        return int8_path
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        """归一化后的 [B, 3, H, W] float32 -> 前景概率 [B, H, W]"""
+        if self.model is None:
+            size = batch.shape[-1]
+            if size not in self.sessions:
+                self.sessions[size] = OnnxModel(
+                    self._onnx_path(self.model_id, self.backend == "onnx_int8", size), self.threads
+                )
+            return self.sessions[size](batch)[:, 0]
+        inputs = torch.from_numpy(batch).to(self.device)
+        return self.model(inputs)[-1].sigmoid().float().cpu().numpy()[:, 0]
+
+
+def _load_torch_model(model_id: str):
+    from transformers import AutoModelForImageSegmentation
+    return AutoModelForImageSegmentation.from_pretrained(model_id, trust_remote_code=True).eval()
+
+
+def _build_empty_model(model_id: str):
+    from transformers import AutoConfig, AutoModelForImageSegmentation
+    config = AutoConfig.from_pretrained(model_id, trust_remote_code=True)
+    return AutoModelForImageSegmentation.from_config(config, trust_remote_code=True).eval()
+
+
+def _sigmoid_head(model):
+    """导出用包装：只保留最终输出并做 sigmoid，ONNX 图输出即前景概率"""
+    class SigmoidHead(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, x):
+            return self.inner(x)[-1].sigmoid()
+
+    return SigmoidHead(model)
+
+
+def get_rmbg(model_id: str = None, device: str = None, backend: str = "torch",
+             threads: int = DEFAULT_CPU_THREADS) -> RMBGHandle:
+    """按 (model_id, device, backend) 取常驻模型，首次调用时加载
+
+    ONNX 会话的线程数是会话选项，onnx / onnx_int8 按线程数区分常驻模型；
+    torch 后端的线程数是进程级设置（见 configure_threads），不区分。
+    """
+    model_id = model_id or DEFAULT_RMBG_MODEL
+    device = device or default_device()
+    onnx = backend in ("onnx", "onnx_int8")
+    key = (model_id, device if backend == "torch" else "cpu", backend, threads if onnx else None)
+    with _POOL_LOCK:
+        if key not in _POOL:
+            print(f"[AutoFigure] Loading RMBG model {model_id} ({backend}) on {key[1]}")
+            _POOL[key] = RMBGHandle(model_id, device, backend, threads)
+        return _POOL[key]
+
+
+def release_rmbg():
+    """释放全部常驻模型"""
+    with _POOL_LOCK:
+        _POOL.clear()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def input_size(crop, size_buckets: bool = False) -> int:
+    """裁切的模型输入边长：默认固定为 RMBG_INPUT_SIZE；开启档位时取不小于最长边的最小档位"""
+    if not size_buckets:
+        return RMBG_INPUT_SIZE
+    side = max(crop.size)
+    for size in RMBG_SIZE_BUCKETS:
+        if side <= size:
+            return size
+    return RMBG_INPUT_SIZE
+
+
+def _preprocess(crops: list, size: int = RMBG_INPUT_SIZE) -> np.ndarray:
+    """crops -> 归一化后的 [B, 3, size, size] float32"""
+    batch = np.empty((len(crops), size, size, 3), dtype=np.float32)
+    for i, crop in enumerate(crops):
+        resized = crop.convert("RGB").resize((size, size), Image.BILINEAR)
+        batch[i] = np.asarray(resized, dtype=np.float32)
+    batch /= 255.0
+    batch -= _MEAN
+    batch /= _STD
+    return np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
+
+
+def remove_background(crops: list, model_id: str = None, device: str = None,
+                      batch_size: int = DEFAULT_RMBG_BATCH_SIZE, backend: str = "torch",
+                      threads: int = DEFAULT_CPU_THREADS, size_buckets: bool = False) -> list:
+    """一批裁切图 -> RGBA uint8 ndarray 列表（与输入一一对应、尺寸不变）
+
+    裁切按输入尺寸分组（见 input_size，默认全部为 RMBG_INPUT_SIZE），同组内按 batch_size 分块前向，
+    掩码再缩放回各自尺寸作为 alpha。
+    """
+    if not crops:
+        return []
+    if backend not in ("onnx", "onnx_int8"):
+        configure_threads(threads)
+    handle = get_rmbg(model_id, device, backend, threads)
+    buckets = {}
+    for i, crop in enumerate(crops):
+        buckets.setdefault(input_size(crop, size_buckets), []).append(i)
+    results = [None] * len(crops)
+    # ONNX 会话不经过 torch
+    mode = torch.inference_mode() if handle.model is not None else nullcontext()
+    with handle.lock, mode:
+        for size, indices in sorted(buckets.items()):
+            for start in range(0, len(indices), batch_size):
+                chunk = indices[start:start + batch_size]
+                preds = handle.predict(_preprocess([crops[i] for i in chunk], size))
+                for i, pred in zip(chunk, preds):
+                    crop = crops[i]
+                    alpha = Image.fromarray((pred * 255).astype(np.uint8)).resize(crop.size, Image.BILINEAR)
+                    rgba = np.empty((crop.height, crop.width, 4), dtype=np.uint8)
+                    rgba[:, :, :3] = np.asarray(crop.convert("RGB"))
+                    rgba[:, :, 3] = np.asarray(alpha)
+                    results[i] = rgba
+    return results
@@ -0,0 +1,292 @@
+"""本地 SAM3 推理：进程内常驻模型池 + 多 prompt 单次批量前向 + 大图重叠分块"""
+import threading
+
+import numpy as np
+
+from .boxes import overlap_matrix
+from .constants import (
+    DEFAULT_CPU_THREADS,
+    DEFAULT_SAM3_MODEL,
+    DEFAULT_TILE_SIZE,
+    DEFAULT_TILE_OVERLAP,
+    DEFAULT_TILE_BATCH,
+)
+from .cpu_runtime import cached_int8, configure_threads, export_path
+from .lazy import torch
+
+# 分块合并：框距分块内部边界不超过该像素数视为被截断
+TILE_EDGE_MARGIN = 2
+# 被截断的框与另一分块完整框的重叠比例达到该值即视为同一对象、丢弃截断框
+TILE_COVERED_RATIO = 0.9
+# 跨分块框重叠比例超过该值即取并集
+TILE_SEAM_THRESHOLD = 0.3
+
+_POOL = {}
+_POOL_LOCK = threading.Lock()
+
+
+def default_device() -> str:
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+class SAM3Handle:
+    """常驻模型句柄；同一模型的推理串行执行
+
+    runtime 为 cpu_int8 时在 CPU 上运行 Linear 层动态 int8 量化的模型（量化权重缓存在磁盘）。
+    """
+
+    def __init__(self, model_id: str, device: str, runtime: str = "torch"):
+        from transformers import Sam3Model, Sam3Processor
+        self.model_id = model_id
+        self.runtime = runtime
+        self.device = device if runtime == "torch" else "cpu"
+        self.processor = Sam3Processor.from_pretrained(model_id)
+        if runtime == "cpu_int8":
+            model = cached_int8(
+                export_path(model_id, "sam3_int8", ".pt"),
+                lambda: Sam3Model.from_pretrained(model_id),
+                lambda: Sam3Model(Sam3Model.config_class.from_pretrained(model_id)),
+            )
+        else:
+            model = Sam3Model.from_pretrained(model_id)
+        self.model = model.to(self.device).eval()
+        self.lock = threading.Lock()
+        # 批量文本解码是否可用（见 _decode；不可用时置 False，之后直接逐 prompt 解码）
+        self.batched_decode = True
+
+
+def get_sam3(model_id: str = DEFAULT_SAM3_MODEL, device: str = None, runtime: str = "torch") -> SAM3Handle:
+    """按 (model_id, device, runtime) 取常驻模型，首次调用时加载
+
+    CPU 线程数是进程级设置（见 configure_threads），不区分常驻模型。
+    """
+    device = device or default_device()
+    key = (model_id, device if runtime == "torch" else "cpu", runtime)
+    with _POOL_LOCK:
+        if key not in _POOL:
+            print(f"[AutoFigure] Loading SAM3 model {model_id} ({runtime}) on {key[1]}")
+            _POOL[key] = SAM3Handle(model_id, device, runtime)
+        return _POOL[key]
+
+
+def release_sam3():
+    """释放全部常驻模型"""
+    with _POOL_LOCK:
+        _POOL.clear()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def parse_prompts(text_prompts: str) -> list:
+    """"icon,person" -> ["icon", "person"]"""
+    return [p.strip() for p in text_prompts.split(",") if p.strip()]
+
+
+def _repeat_batch(obj, n: int):
+    """视觉特征（Tensor / ModelOutput / tuple）沿第 0 维每项重复 n 次；batch=1 时用 expand，不复制数据"""
+    if isinstance(obj, torch.Tensor):
+        if obj.dim() == 0 or n == 1:
+            return obj
+        if obj.shape[0] == 1:
+            return obj.expand(n, *obj.shape[1:])
+        return obj.repeat_interleave(n, dim=0)
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_repeat_batch(o, n) for o in obj)
+    if isinstance(obj, dict):
+        return obj.__class__(**{k: _repeat_batch(v, n) for k, v in obj.items()})
+    return obj
+
+
+def _select_batch(obj, i: int):
+    """取视觉特征中第 i 张图（保留 batch 维）"""
+    if isinstance(obj, torch.Tensor):
+        return obj[i:i + 1] if obj.dim() > 0 else obj
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_select_batch(o, i) for o in obj)
+    if isinstance(obj, dict):
+        return obj.__class__(**{k: _select_batch(v, i) for k, v in obj.items()})
+    return obj
+
+
+def _decode(handle, images: list, prompts: list, min_score: float) -> list:
+    """多图 × 多 prompt 一次前向 -> results[图][prompt]（post_process_instance_segmentation 的结果）
+
+    视觉编码每张图只算一次；(图, prompt) 组合展开为一个 batch 完成文本解码。
+    """
+    processor, model = handle.processor, handle.model
+    n_images, n_prompts = len(images), len(prompts)
+    target_sizes = [[im.height, im.width] for im in images for _ in prompts]
+
+    img_inputs = processor(images=images, return_tensors="pt").to(handle.device)
+    vision_embeds = model.get_vision_features(pixel_values=img_inputs.pixel_values)
+    outputs = None
+    if handle.batched_decode and len(target_sizes) > 1:
+        text_inputs = processor(text=prompts, return_tensors="pt", padding=True).to(handle.device)
+        try:
+            outputs = model(
+                vision_embeds=_repeat_batch(vision_embeds, n_prompts),
+                input_ids=text_inputs.input_ids.repeat(n_images, 1),
+                attention_mask=text_inputs.attention_mask.repeat(n_images, 1),
+            )
+        except RuntimeError as e:
+            # 只处理旧版 transformers 不支持视觉特征与文本按 batch 对齐时的形状错误；显存不足照常抛出
+            if isinstance(e, torch.cuda.OutOfMemoryError):
+                raise
+            handle.batched_decode = False
+            print(f"[AutoFigure] Batched SAM3 decode unavailable ({e}), decoding per prompt")
+    if outputs is not None:
+        flat = processor.post_process_instance_segmentation(
+            outputs, threshold=min_score, mask_threshold=0.5, target_sizes=target_sizes
+        )
+    else:
+        # 逐 (图, prompt) 解码，复用视觉特征
+        flat = []
+        for i in range(n_images):
+            embeds = _select_batch(vision_embeds, i) if n_images > 1 else vision_embeds
+            for j, prompt in enumerate(prompts):
+                single = processor(text=prompt, return_tensors="pt").to(handle.device)
+                out = model(vision_embeds=embeds, **single)
+                flat += processor.post_process_instance_segmentation(
+                    out, threshold=min_score, mask_threshold=0.5,
+                    target_sizes=[target_sizes[i * n_prompts + j]]
+                )
+    return [flat[i * n_prompts:(i + 1) * n_prompts] for i in range(n_images)]
+
+
+def _to_detections(results: list, prompts: list, max_masks: int, width: int, height: int,
+                   offset=(0, 0)) -> list:
+    """单张图的各 prompt 结果 -> 检测框（每个 prompt 取分数最高的 max_masks 个，坐标加上 offset）"""
+    detections = []
+    for prompt, result in zip(prompts, results):
+        scores = result["scores"].float().cpu()
+        boxes = result["boxes"].float().cpu()
+        order = torch.argsort(scores, descending=True)[:max_masks]
+        for idx in order.tolist():
+            x1, y1, x2, y2 = boxes[idx].round().int().tolist()
+            x1, y1 = max(0, x1), max(0, y1)
+            x2, y2 = min(width, x2), min(height, y2)
+            if x2 > x1 and y2 > y1:
+                detections.append({
+                    "x1": x1 + offset[0], "y1": y1 + offset[1],
+                    "x2": x2 + offset[0], "y2": y2 + offset[1],
+                    "score": float(scores[idx]), "prompt": prompt,
+                })
+    return detections
+
+
+def detect(image, prompts: list, min_score: float = 0.5, max_masks: int = 32,
+           model_id: str = DEFAULT_SAM3_MODEL, device: str = None, runtime: str = "torch",
+           threads: int = DEFAULT_CPU_THREADS) -> list:
+    """单图多 prompt 检测，返回 [{x1, y1, x2, y2, score, prompt}, ...]
+
+    视觉编码只计算一次；所有文本 prompt 组成一个 batch 在一次前向中完成解码。
+    每个 prompt 只保留分数最高的 max_masks 个结果。
+    """
+    if not prompts:
+        return []
+    configure_threads(threads)
+    handle = get_sam3(model_id, device, runtime)
+    image = image.convert("RGB")
+    with handle.lock, torch.inference_mode():
+        results = _decode(handle, [image], prompts, min_score)[0]
+    return _to_detections(results, prompts, max_masks, image.width, image.height)
+
+
+def plan_tiles(width: int, height: int, tile_size: int, overlap: int) -> list:
+    """覆盖整图的重叠分块 [(x0, y0, x1, y1), ...]；最后一行 / 列贴齐图像边缘"""
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        stride = max(1, tile_size - overlap)
+        positions = list(range(0, length - tile_size, stride))
+        return positions + [length - tile_size]
+
+    return [
+        (x0, y0, min(width, x0 + tile_size), min(height, y0 + tile_size))
+        for y0 in starts(height) for x0 in starts(width)
+    ]
+
+
+def _cut_edges(det: dict, tile, width: int, height: int, margin: int) -> bool:
+    """框是否贴着分块的内部边界（即可能被分块截断；图像自身边缘不算）"""
+    x0, y0, x1, y1 = tile
+    return ((x0 > 0 and det["x1"] - x0 <= margin) or (y0 > 0 and det["y1"] - y0 <= margin)
+            or (x1 < width and x1 - det["x2"] <= margin) or (y1 < height and y1 - det["y2"] <= margin))
+
+
+def merge_seams(detections: list, tiles: list, width: int, height: int,
+                edge_margin: int = TILE_EDGE_MARGIN, seam_threshold: float = TILE_SEAM_THRESHOLD) -> list:
+    """合并跨分块边界的检测结果
+
+    1. 被截断的框若几乎完全落在另一分块的完整框内，说明另一分块看到了整个对象，直接丢弃；
+    2. 不同分块、同一 prompt、重叠比例超过 seam_threshold 的框（重叠区重复检测、
+       跨缝被截成两半的对象）取并集，保留分数较高者的字段。
+    同一分块内的框不在这里合并，交由节点的 merge_threshold 处理。
+    """
+    if not detections:
+        return []
+    cut = np.array([_cut_edges(d, tiles[d["tile"]], width, height, edge_margin) for d in detections])
+    tile_ids = np.array([d["tile"] for d in detections])
+    prompts = np.array([d["prompt"] for d in detections], dtype=object)
+    ratio = overlap_matrix(detections)
+    cross = (tile_ids[:, None] != tile_ids[None, :]) & (prompts[:, None] == prompts[None, :])
+
+    areas = np.array([(d["x2"] - d["x1"]) * (d["y2"] - d["y1"]) for d in detections])
+    covered = (ratio >= TILE_COVERED_RATIO) & cross & ~cut[None, :] & (areas[:, None] <= areas[None, :])
+    keep = ~(cut & covered.any(axis=1))
+    idx = np.flatnonzero(keep)
+
+    # 并查集：跨分块且重叠足够的框归为一组
+    parent = list(range(len(idx)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    linked = (ratio[np.ix_(idx, idx)] > seam_threshold) & cross[np.ix_(idx, idx)]
+    for a, b in zip(*np.nonzero(np.triu(linked, k=1))):
+        parent[find(a)] = find(b)
+
+    groups = {}
+    for i in range(len(idx)):
+        groups.setdefault(find(i), []).append(detections[idx[i]])
+    merged = []
+    for members in groups.values():
+        best = max(members, key=lambda d: d["score"])
+        merged.append({
+            "x1": min(d["x1"] for d in members), "y1": min(d["y1"] for d in members),
+            "x2": max(d["x2"] for d in members), "y2": max(d["y2"] for d in members),
+            "score": best["score"], "prompt": best["prompt"],
+        })
+    return merged
+
+
+def detect_tiled(image, prompts: list, min_score: float = 0.5, max_masks: int = 32,
+                 tile_size: int = DEFAULT_TILE_SIZE, overlap: int = DEFAULT_TILE_OVERLAP,
+                 tile_batch: int = DEFAULT_TILE_BATCH, model_id: str = DEFAULT_SAM3_MODEL,
+                 device: str = None, runtime: str = "torch", threads: int = DEFAULT_CPU_THREADS) -> list:
+    """大图分块检测：重叠分块按 tile_batch 张一组批量前向，再合并跨缝结果
+
+    每个分块以原始分辨率送入模型，小图标不会因整图缩放而丢失；峰值显存只取决于 tile_batch。
+    max_masks 对每个分块、每个 prompt 分别生效。
+    """
+    image = image.convert("RGB")
+    if max(image.width, image.height) <= tile_size:
+        return detect(image, prompts, min_score, max_masks, model_id, device, runtime, threads)
+    if not prompts:
+        return []
+    configure_threads(threads)
+    handle = get_sam3(model_id, device, runtime)
+    tiles = plan_tiles(image.width, image.height, tile_size, overlap)
+    detections = []
+    with handle.lock, torch.inference_mode():
+        for start in range(0, len(tiles), tile_batch):
+            chunk = tiles[start:start + tile_batch]
+            crops = [image.crop(tile) for tile in chunk]
+            for k, (tile, crop, results) in enumerate(zip(chunk, crops, _decode(handle, crops, prompts, min_score))):
+                for det in _to_detections(results, prompts, max_masks, crop.width, crop.height, tile[:2]):
+                    det["tile"] = start + k
+                    detections.append(det)
+    return merge_seams(detections, tiles, image.width, image.height)
@@ -0,0 +1,72 @@
+"""SVG 渲染结果与原图的本地相似度评分（用于优化循环的收敛判断）"""
+import io
+
+import numpy as np
+from PIL import Image
+
+# 评分时的渲染分辨率上限：只比较整体结构，无需全分辨率
+SCORE_MAX_SIDE = 512
+
+_SSIM_WINDOW = 7
+_SSIM_C1 = (0.01 * 255) ** 2
+_SSIM_C2 = (0.03 * 255) ** 2
+
+
+def score_size(width: int, height: int, max_side: int = SCORE_MAX_SIDE):
+    """按原图宽高比缩放到 max_side 以内"""
+    scale = min(1.0, max_side / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def reference_gray(figure_pil: Image.Image, max_side: int = SCORE_MAX_SIDE) -> np.ndarray:
+    """原图 -> 评分用灰度图 float64 [H, W]"""
+    size = score_size(figure_pil.width, figure_pil.height, max_side)
+    return np.asarray(figure_pil.convert("L").resize(size, Image.BILINEAR), dtype=np.float64)
+
+
+def render_gray(svg_code: str, width: int, height: int) -> np.ndarray:
+    """SVG -> 白底灰度图 float64 [H, W]"""
+    import cairosvg
+    png_data = cairosvg.svg2png(
+        bytestring=svg_code.encode(),
+        output_width=width,
+        output_height=height
+    )
+    rgba = Image.open(io.BytesIO(png_data)).convert("RGBA")
+    canvas = Image.new("RGBA", rgba.size, (255, 255, 255, 255))
+    canvas.alpha_composite(rgba)
+    return np.asarray(canvas.convert("L"), dtype=np.float64)
+
+
+def _box_mean(x: np.ndarray, k: int) -> np.ndarray:
+    """k×k 均值滤波（积分图实现，valid 区域）"""
+    s = np.pad(x, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+    return (s[k:, k:] - s[:-k, k:] - s[k:, :-k] + s[:-k, :-k]) / (k * k)
+
+
+def ssim(a: np.ndarray, b: np.ndarray, window: int = _SSIM_WINDOW) -> float:
+    """两张同尺寸灰度图的平均 SSIM，取值约在 [-1, 1]，越大越相似"""
+    k = min(window, a.shape[0], a.shape[1])
+    mu_a, mu_b = _box_mean(a, k), _box_mean(b, k)
+    var_a = _box_mean(a * a, k) - mu_a ** 2
+    var_b = _box_mean(b * b, k) - mu_b ** 2
+    cov = _box_mean(a * b, k) - mu_a * mu_b
+    num = (2 * mu_a * mu_b + _SSIM_C1) * (2 * cov + _SSIM_C2)
+    den = (mu_a ** 2 + mu_b ** 2 + _SSIM_C1) * (var_a + var_b + _SSIM_C2)
+    return float(np.mean(num / den))
+
+
+class ConvergenceScorer:
+    """对同一原图反复评分 SVG 候选；cairosvg 不可用或渲染失败时返回 None"""
+
+    def __init__(self, figure_pil: Image.Image, max_side: int = SCORE_MAX_SIDE):
+        self.reference = reference_gray(figure_pil, max_side)
+
+    def score(self, svg_code: str):
+        h, w = self.reference.shape
+        try:
+            rendered = render_gray(svg_code, w, h)
+        except Exception as e:
+            print(f"[AutoFigure] SVG scoring failed: {e}")
+            return None
+        return round(ssim(self.reference, rendered), 5)
@@ -0,0 +1,254 @@
+"""图标嵌入 SVG：线程池并行编码 base64 + 占位符索引 + 单次拼接替换（全程不落盘）"""
+import base64
+import io
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from .bridge import FAST_PNG_COMPRESS_LEVEL
+
+# 占位符元素：id 形如 AF01 / AF_01 / af1（属性名前须为空白，data-id 等不算）
+_PLACEHOLDER_RE = re.compile(
+    r'<(?P<tag>g|rect|image|use)\b[^>]*?(?<=\s)id\s*=\s*["\'](?:AF|af)_?(?P<num>\d+)["\'][^>]*?(?P<close>/?)>'
+)
+_TAG_RE = re.compile(r'<(/?)g\b[^>]*?(/?)>')
+_RECT_RE = re.compile(r'<rect\b[^>]*>')
+_ATTR_RE = r'(?<=\s){}\s*=\s*["\']\s*(-?[\d.]+)'
+_SVG_CLOSE_RE = re.compile(r'</svg\s*>\s*$')
+_SVG_OPEN_RE = re.compile(r'<svg\b[^>]*>')
+# 引用写为 xlink:href：SVG 1.1 渲染器（旧版 Inkscape、部分转换库）只认它，SVG 2 渲染器也都兼容；
+# 不再同时写 href，避免 base64 数据重复一份
+_XLINK_NS = "http://www.w3.org/1999/xlink"
+
+
+def label_number(label: str):
+    """"<AF>01" / "AF01" -> 1"""
+    m = re.search(r'(\d+)', label or "")
+    return int(m.group(1)) if m else None
+
+
+def _attr(tag_text: str, name: str):
+    m = re.search(_ATTR_RE.format(name), tag_text)
+    return float(m.group(1)) if m else None
+
+
+def _geometry(element: str):
+    """占位符元素的 (x, y, w, h)：取自身或组内第一个 rect 的几何属性"""
+    for tag_text in [element[:element.find(">") + 1]] + _RECT_RE.findall(element):
+        x, y = _attr(tag_text, "x"), _attr(tag_text, "y")
+        w, h = _attr(tag_text, "width"), _attr(tag_text, "height")
+        if None not in (x, y, w, h):
+            return x, y, w, h
+    return None
+
+
+def _element_end(svg_code: str, match) -> int:
+    """占位符元素在 svg_code 中的结束位置（处理 <g> 嵌套）"""
+    if match.group("close") == "/":
+        return match.end()
+    tag = match.group("tag")
+    if tag != "g":
+        close = svg_code.find(f"</{tag}>", match.end())
+        return close + len(f"</{tag}>") if close != -1 else match.end()
+    depth = 1
+    for m in _TAG_RE.finditer(svg_code, match.end()):
+        if m.group(2) == "/":
+            continue
+        depth += -1 if m.group(1) == "/" else 1
+        if depth == 0:
+            return m.end()
+    return match.end()
+
+
+def build_placeholder_index(svg_code: str) -> dict:
+    """一次扫描 SVG，建立 编号 -> (start, end, geometry) 索引；同号取首个"""
+    index = {}
+    for m in _PLACEHOLDER_RE.finditer(svg_code):
+        num = int(m.group("num"))
+        if num in index:
+            continue
+        end = _element_end(svg_code, m)
+        index[num] = (m.start(), end, _geometry(svg_code[m.start():end]))
+    return index
+
+
+ICON_FORMATS = ["png", "png_palette", "webp"]
+
+# 超出字节预算时依次尝试的降级档位：(尺寸倍率, 质量降幅)
+_BUDGET_LADDER = [(1.0, 0), (1.0, 20), (0.75, 20), (0.5, 30), (0.35, 40), (0.25, 50)]
+
+
+def encode_icon(icon, fmt: str = "png", max_size=None, quality: int = 90) -> str:
+    """RGBA uint8 ndarray / PIL -> data URI
+
+    fmt: png（无损）/ png_palette（256 色调色板，保留 alpha）/ webp（有损，quality 生效）
+    max_size: (w, h) 上限，仅缩小、保持宽高比
+    """
+    pil = icon if isinstance(icon, Image.Image) else Image.fromarray(icon, "RGBA")
+    if max_size is not None and (pil.width > max_size[0] or pil.height > max_size[1]):
+        pil = pil.copy()
+        pil.thumbnail((max(1, max_size[0]), max(1, max_size[1])), Image.LANCZOS)
+    buf = io.BytesIO()
+    if fmt == "webp":
+        pil.save(buf, format="WEBP", quality=max(1, min(100, quality)), method=4)
+        mime = "image/webp"
+    elif fmt == "png_palette":
+        pil.quantize(colors=256, method=Image.FASTOCTREE).save(buf, format="PNG", optimize=True)
+        mime = "image/png"
+    else:
+        pil.save(buf, format="PNG", compress_level=FAST_PNG_COMPRESS_LEVEL)
+        mime = "image/png"
+    return f"data:{mime};base64,{base64.b64encode(buf.getvalue()).decode('ascii')}"
+
+
+def encode_icons(icons: list, fmt: str = "png", max_sizes: list = None, quality: int = 90,
+                 max_workers: int = None) -> list:
+    """线程池并行编码为 data URI（图像编码在 C 层释放 GIL）"""
+    max_sizes = max_sizes or [None] * len(icons)
+    jobs = [(icon, fmt, size, quality) for icon, size in zip(icons, max_sizes)]
+    if len(jobs) <= 1:
+        return [encode_icon(*job) for job in jobs]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(lambda job: encode_icon(*job), jobs))
+
+
+def rendered_sizes(icon_infos: list, scale_factors, render_scale: float = 2.0) -> list:
+    """每个图标在 SVG 中的渲染像素尺寸（box × scale_factors × render_scale）"""
+    scale_x, scale_y = scale_factors
+    return [
+        (math.ceil(info["width"] * scale_x * render_scale), math.ceil(info["height"] * scale_y * render_scale))
+        for info in icon_infos
+    ]
+
+
+def embed_icons_within_budget(svg_code: str, icons: list, icon_infos: list, scale_factors,
+                              match_by_label: bool = True, fmt: str = "png", max_sizes: list = None,
+                              quality: int = 90, max_bytes: int = 0, groups: list = None) -> str:
+    """编码并嵌入图标；max_bytes > 0 时按降级档位（缩小尺寸 / 降低质量）重试直到满足预算
+
+    groups[i] 为第 i 个图标的去重组号，每组只编码一次。
+    所有档位都超出预算时返回最后一档结果并打印警告。
+    """
+    groups = list(groups) if groups is not None else list(range(len(icons)))
+    first = {}
+    for i, g in enumerate(groups):
+        first.setdefault(g, i)
+    unique_icons = {g: icons[i] for g, i in first.items()}
+    # 每组的编码尺寸上限：组内渲染尺寸最大者，未指定时为图标原始尺寸
+    base_sizes = {g: _pixel_size(icon) for g, icon in unique_icons.items()}
+    if max_sizes is not None:
+        base_sizes = {}
+        for (w, h), g in zip(max_sizes, groups):
+            bw, bh = base_sizes.get(g, (0, 0))
+            base_sizes[g] = (max(w, bw), max(h, bh))
+
+    ladder = _BUDGET_LADDER if max_bytes > 0 else _BUDGET_LADDER[:1]
+    if fmt != "webp":  # 无损格式只有尺寸档位有效
+        ladder = sorted({(scale, 0) for scale, _ in ladder}, reverse=True)
+    keys = list(unique_icons)
+    for size_scale, quality_drop in ladder:
+        sizes = [(max(1, int(base_sizes[g][0] * size_scale)), max(1, int(base_sizes[g][1] * size_scale))) for g in keys]
+        encoded = encode_icons([unique_icons[g] for g in keys], fmt, sizes, quality - quality_drop)
+        hrefs = dict(zip(keys, encoded))
+        group_sizes = {g: _pixel_size(unique_icons[g]) for g in keys}
+        final_svg = embed_icons(svg_code, icon_infos, hrefs, scale_factors, match_by_label,
+                                groups=groups, group_sizes=group_sizes)
+        size = len(final_svg.encode("utf-8"))
+        if max_bytes <= 0 or size <= max_bytes:
+            return final_svg
+    print(f"[AutoFigure] SVG size {size} bytes exceeds budget {max_bytes} bytes")
+    return final_svg
+
+
+def _pixel_size(icon):
+    """ndarray [H, W, C] / PIL -> (w, h)"""
+    return (icon.shape[1], icon.shape[0]) if hasattr(icon, "shape") else icon.size
+
+
+def _image_tag(info: dict, href: str, geometry) -> str:
+    x, y, w, h = geometry
+    return (
+        f'<image id="{info["label_clean"]}" x="{x:.2f}" y="{y:.2f}" width="{w:.2f}" height="{h:.2f}" '
+        f'preserveAspectRatio="xMidYMid meet" xlink:href="{href}"/>'
+    )
+
+
+def _use_tag(info: dict, symbol_id: str, geometry) -> str:
+    x, y, w, h = geometry
+    return (
+        f'<use id="{info["label_clean"]}" x="{x:.2f}" y="{y:.2f}" width="{w:.2f}" height="{h:.2f}" '
+        f'xlink:href="#{symbol_id}"/>'
+    )
+
+
+def _symbol_tag(symbol_id: str, href: str, size) -> str:
+    w, h = size
+    return (
+        f'<symbol id="{symbol_id}" viewBox="0 0 {w} {h}" preserveAspectRatio="xMidYMid meet">'
+        f'<image width="{w}" height="{h}" xlink:href="{href}"/></symbol>'
+    )
+
+
+def embed_icons(svg_code: str, icon_infos: list, icon_hrefs, scale_factors,
+                match_by_label: bool = True, groups: list = None, group_sizes: dict = None) -> str:
+    """把图标插入 SVG：命中占位符时替换该元素并沿用其几何，否则按 box 坐标 × scale_factors 放置
+
+    icon_hrefs 按组号索引（未去重时即图标序号）。出现多次的组在 <defs> 中以 <symbol>
+    只嵌入一次，各位置用 <use> 引用（需提供 group_sizes 以确定 symbol 的 viewBox）。
+    所有替换一次性拼接，不对 SVG 做逐图标的重复搜索。
+    """
+    scale_x, scale_y = scale_factors
+    groups = list(groups) if groups is not None else list(range(len(icon_infos)))
+    counts = {}
+    for g in groups:
+        counts[g] = counts.get(g, 0) + 1
+    shared = {g for g, n in counts.items() if n > 1} if group_sizes else set()
+
+    index = build_placeholder_index(svg_code) if match_by_label else {}
+    replacements = []  # (start, end, text)
+    appended = []
+    for info, g in zip(icon_infos, groups):
+        hit = index.pop(label_number(info["label"]), None) if match_by_label else None
+        box_geometry = (info["x1"] * scale_x, info["y1"] * scale_y,
+                        info["width"] * scale_x, info["height"] * scale_y)
+        geometry = (hit[2] or box_geometry) if hit is not None else box_geometry
+        if g in shared:
+            text = _use_tag(info, f"af_icon_{g}", geometry)
+        else:
+            text = _image_tag(info, icon_hrefs[g], geometry)
+        if hit is not None:
+            replacements.append((hit[0], hit[1], text))
+        else:
+            appended.append(text)
+
+    if shared:
+        symbols = "".join(_symbol_tag(f"af_icon_{g}", icon_hrefs[g], group_sizes[g]) for g in sorted(shared))
+        appended.insert(0, f"<defs>{symbols}</defs>")
+
+    parts = []
+    pos = 0
+    for start, end, text in sorted(replacements):
+        if start < pos:  # 占位符嵌套在另一个已替换的占位符内
+            appended.append(text)
+            continue
+        parts.append(svg_code[pos:start])
+        parts.append(text)
+        pos = end
+    tail = svg_code[pos:]
+    if appended:
+        m = _SVG_CLOSE_RE.search(tail)
+        insert_at = m.start() if m else len(tail)
+        tail = tail[:insert_at] + "\n".join(appended) + "\n" + tail[insert_at:]
+    parts.append(tail)
+    return _declare_xlink("".join(parts))
+
+
+def _declare_xlink(svg_code: str) -> str:
+    """根 <svg> 未声明 xmlns:xlink 时补上（否则 xlink:href 的前缀未绑定，XML 无效）"""
+    root = _SVG_OPEN_RE.search(svg_code)
+    if root is None or "xmlns:xlink" in root.group(0):
+        return svg_code
+    insert_at = root.start() + len("<svg")
+    return f'{svg_code[:insert_at]} xmlns:xlink="{_XLINK_NS}"{svg_code[insert_at:]}'
@@ -0,0 +1,150 @@
+"""SVG 压缩：去除注释与标签间空白、缩短数值精度、重复的内嵌图片只保留一份
+
+全部基于正则的线性扫描，不构建 DOM；<text> 内的空白与 base64 数据不做改动。
+"""
+import base64
+import io
+import re
+
+from PIL import Image
+
+from .constants import DEFAULT_SVG_PRECISION
+
+_COMMENT_RE = re.compile(r'<!--.*?-->', re.S)
+_TEXT_RE = re.compile(r'(<text\b.*?</text\s*>)', re.S)
+_BETWEEN_TAGS_RE = re.compile(r'>\s+<')
+_TAG_RE = re.compile(r'<[^<>]+>')
+_SPACES_RE = re.compile(r'\s+')
+# 只处理几何 / 样式类数值属性，避免改动 id、href、文本等；
+# transform 不取整：matrix / scale 中的小系数按坐标精度取整后会明显移动或缩放内容
+_NUMERIC_ATTR_RE = re.compile(
+    r'(\s(?:x|y|x1|y1|x2|y2|cx|cy|r|rx|ry|dx|dy|width|height|d|points|viewBox|'
+    r'stroke-width|stroke-dashoffset|stroke-dasharray|font-size|opacity|fill-opacity|'
+    r'stroke-opacity|offset)\s*=\s*)(["\'])([^"\']*)\2'
+)
+_DECIMAL_RE = re.compile(r'-?\d*\.\d+(?:[eE][-+]?\d+)?')
+_IMAGE_RE = re.compile(r'<image\b[^>]*?(?:/>|>\s*</image\s*>)', re.S)
+_HREF_RE = re.compile(r'\s((?:xlink:)?href)\s*=\s*(["\'])(data:[^"\']+)\2')
+_ATTR_VALUE_RE = r'\s{}\s*=\s*(["\'])([^"\']*)\1'
+_SVG_OPEN_RE = re.compile(r'<svg\b[^>]*>', re.S)
+
+
+def _round_number(match, precision: int) -> str:
+    text = match.group(0)
+    try:
+        value = round(float(text), precision)
+    except ValueError:
+        return text
+    out = f"{value:.{precision}f}".rstrip("0").rstrip(".") if precision > 0 else str(int(value))
+    return "0" if out in ("-0", "") else out
+
+
+def _shorten_numbers(svg_code: str, precision: int) -> str:
+    def number(n, value):
+        out = _round_number(n, precision)
+        # 路径紧凑写法 ".5.5" 拆成两个数；补零后需加空格分隔，否则会被解析成一个数
+        if n.start() > 0 and (value[n.start() - 1].isdigit() or value[n.start() - 1] == "."):
+            out = " " + out
+        return out
+
+    def attr(m):
+        value = _DECIMAL_RE.sub(lambda n: number(n, m.group(3)), m.group(3))
+        return f"{m.group(1)}{m.group(2)}{value}{m.group(2)}"
+    return _NUMERIC_ATTR_RE.sub(attr, svg_code)
+
+
+def _collapse_tag(match) -> str:
+    """标签内（属性之间、属性值中）的连续空白合并为一个空格"""
+    tag = match.group(0)
+    if "  " in tag or "\n" in tag or "\t" in tag or "\r" in tag:
+        return _SPACES_RE.sub(" ", tag)
+    return tag
+
+
+def _collapse_whitespace(svg_code: str) -> str:
+    parts = _TEXT_RE.split(svg_code)
+    for i in range(0, len(parts), 2):  # 奇数下标为 <text> 元素，原样保留
+        part = _BETWEEN_TAGS_RE.sub("><", parts[i])
+        if i > 0:
+            part = part.lstrip()
+        if i < len(parts) - 1:
+            part = part.rstrip()
+        parts[i] = _TAG_RE.sub(_collapse_tag, part)
+    return "".join(parts).strip()
+
+
+def _attr_value(tag: str, name: str):
+    m = re.search(_ATTR_VALUE_RE.format(re.escape(name)), tag)
+    return m.group(2) if m else None
+
+
+def _image_size(data_uri: str):
+    """data URI -> 像素尺寸（只解析图片头）"""
+    try:
+        payload = data_uri.split(",", 1)[1]
+        return Image.open(io.BytesIO(base64.b64decode(payload))).size
+    except (IndexError, ValueError, OSError):
+        return None
+
+
+def dedupe_images(svg_code: str) -> str:
+    """相同 base64 数据的 <image> 出现多次时，数据移入 <defs> 的 <symbol>，各处改为 <use>
+
+    与 Stage 5 的图标去重方式一致；没有 width/height 的 <image> 不参与。
+    """
+    matches = list(_IMAGE_RE.finditer(svg_code))
+    groups = {}
+    for m in matches:
+        tag = m.group(0)
+        href = _HREF_RE.search(tag)
+        if href is None or _attr_value(tag, "width") is None or _attr_value(tag, "height") is None:
+            continue
+        key = (href.group(3), _attr_value(tag, "preserveAspectRatio") or "xMidYMid meet")
+        groups.setdefault(key, []).append((m, href))
+    shared = {key: members for key, members in groups.items() if len(members) > 1}
+    if not shared:
+        return svg_code
+
+    replacements = []
+    symbols = []
+    for n, ((uri, aspect), members) in enumerate(shared.items()):
+        size = _image_size(uri)
+        if size is None:
+            continue
+        symbol_id = f"af_img_{n}"
+        attr_name = members[0][1].group(1)
+        symbols.append(
+            f'<symbol id="{symbol_id}" viewBox="0 0 {size[0]} {size[1]}" preserveAspectRatio="{aspect}">'
+            f'<image width="{size[0]}" height="{size[1]}" {attr_name}="{uri}"/></symbol>'
+        )
+        for m, href in members:
+            tag = m.group(0)
+            start, end = href.span()
+            body = tag[len("<image"):start] + f' {href.group(1)}="#{symbol_id}"' + tag[end:]
+            body = re.sub(r'\s*(?:/>|>\s*</image\s*>)$', "", body)
+            body = re.sub(r'\spreserveAspectRatio\s*=\s*(["\'])[^"\']*\1', "", body)
+            replacements.append((m.start(), m.end(), f"<use{body}/>"))
+    if not symbols:
+        return svg_code
+
+    parts = []
+    pos = 0
+    for start, end, text in sorted(replacements):
+        parts.append(svg_code[pos:start])
+        parts.append(text)
+        pos = end
+    parts.append(svg_code[pos:])
+    out = "".join(parts)
+    root = _SVG_OPEN_RE.search(out)
+    insert_at = root.end() if root else 0
+    return f"{out[:insert_at]}<defs>{''.join(symbols)}</defs>{out[insert_at:]}"
+
+
+def minify_svg(svg_code: str, precision: int = DEFAULT_SVG_PRECISION, dedupe: bool = True) -> str:
+    """SVG -> 压缩后的 SVG（precision < 0 表示不改动数值）"""
+    svg_code = _COMMENT_RE.sub("", svg_code)
+    if dedupe:
+        svg_code = dedupe_images(svg_code)
+    if precision >= 0:
+        svg_code = _shorten_numbers(svg_code, precision)
+    return _collapse_whitespace(svg_code)
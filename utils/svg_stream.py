@@ -0,0 +1,89 @@
+"""流式 SVG 增量校验：边接收边解析，明显损坏时立即中止"""
+
+# 收到这么多字符仍未出现 SVG / XML 起始标记即判定缺少根元素
+ROOT_SEARCH_LIMIT = 4096
+_ROOT_MARKERS = ("<?xml", "<!DOCTYPE", "<svg")
+
+
+class SVGStreamError(ValueError):
+    """流式响应中的 SVG 已可判定为损坏"""
+
+
+class IncrementalSVGValidator:
+    """基于 lxml XMLPullParser 的增量校验器
+
+    feed() 逐块接收 LLM 输出（允许前置说明文字与 ``` 代码块标记），出现以下情况即抛出 SVGStreamError：
+    - 超过 ROOT_SEARCH_LIMIT 个字符仍未出现 SVG 起始；
+    - 根元素不是 <svg>；
+    - 标签嵌套错误等 XML 语法错误。
+    close() 在流结束时检查根元素是否完整闭合。
+    """
+
+    def __init__(self):
+        from lxml import etree
+        self._etree = etree
+        self._parser = etree.XMLPullParser(events=("start", "end"))
+        self._prefix = ""        # 根元素出现前的缓冲
+        self._started = False    # 已开始向解析器送数据
+        self._depth = 0
+        self._root_seen = False
+        self.done = False        # 根元素已闭合，或遇到无法继续校验的非结构性错误
+        self.chars = 0
+
+    def feed(self, chunk: str):
+        if self.done or not chunk:
+            return
+        self.chars += len(chunk)
+        if not self._started:
+            self._prefix += chunk
+            starts = [i for i in (self._prefix.find(m) for m in _ROOT_MARKERS) if i != -1]
+            if not starts:
+                if len(self._prefix) > ROOT_SEARCH_LIMIT:
+                    raise SVGStreamError("missing root <svg> element")
+                return
+            chunk, self._prefix, self._started = self._prefix[min(starts):], "", True
+        self._feed_parser(chunk)
+
+    def _feed_parser(self, data: str):
+        try:
+            self._parser.feed(data)
+            self._drain()
+        except self._etree.XMLSyntaxError as e:
+            self._drain_quietly()
+            if (self._root_seen and self._depth == 0) or "Extra content at the end" in str(e):
+                # 根元素已闭合，其后是代码块结束标记等多余内容
+                self.done = True
+                return
+            if "Entity" in str(e):
+                # 未定义实体（如 &nbsp;）交给上游 4.5 修复，不据此中止；解析器已失效，停止校验
+                self.done = True
+                return
+            raise SVGStreamError(f"malformed SVG stream: {e}") from e
+
+    def _drain(self):
+        for event, element in self._parser.read_events():
+            if event == "start":
+                if not self._root_seen:
+                    tag = self._etree.QName(element).localname
+                    if tag != "svg":
+                        raise SVGStreamError(f"root element is <{tag}>, expected <svg>")
+                    self._root_seen = True
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.done = True
+
+    def _drain_quietly(self):
+        try:
+            self._drain()
+        except self._etree.XMLSyntaxError:
+            pass
+
+    def close(self):
+        """流结束：根元素必须已完整闭合"""
+        if not self._root_seen:
+            raise SVGStreamError("missing root <svg> element")
+        if not self.done:
+            raise SVGStreamError("SVG stream ended before </svg>")
+
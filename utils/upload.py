@@ -0,0 +1,93 @@
+"""LLM 上传图片准备：按最长边 / 视觉 token 预算缩小，按内容缓存缩小结果
+
+视觉 token 按 Gemini 的计费方式估算：每个 768×768 分块约 258 token（两边都不超过 384 时按单块计）。
+视觉 token 只取决于像素尺寸；编码由上游（内存直传）或落盘时的 PNG 决定，这里不另做编码。
+缩小后的坐标系通过 scale 换算回原图。
+"""
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from PIL import Image
+
+from .constants import UPLOAD_CACHE_SIZE
+
+TOKEN_TILE = 768
+TOKENS_PER_TILE = 258
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class UploadImage:
+    """准备好的上传图片
+
+    image 为缩小后的图（内存直传或落盘均使用它）；scale = 上传尺寸 / 原图尺寸。
+    """
+    image: Image.Image
+    original_size: tuple
+    scale: float
+
+
+def estimate_tokens(width: int, height: int) -> int:
+    """估算一张图的视觉 token 数"""
+    if width <= TOKEN_TILE // 2 and height <= TOKEN_TILE // 2:
+        return TOKENS_PER_TILE
+    return math.ceil(width / TOKEN_TILE) * math.ceil(height / TOKEN_TILE) * TOKENS_PER_TILE
+
+
+def fit_scale(width: int, height: int, max_side: int = 0, token_budget: int = 0) -> float:
+    """满足最长边与 token 预算的最大缩放比例（不放大；0 表示不限制）"""
+    scale = 1.0
+    if max_side > 0:
+        scale = min(scale, max_side / max(width, height))
+    if token_budget > 0:
+        tiles = max(1, token_budget // TOKENS_PER_TILE)
+        scale = min(scale, math.sqrt(tiles * TOKEN_TILE * TOKEN_TILE / (width * height)))
+        while scale > 0.01 and estimate_tokens(*_scaled(width, height, scale)) > token_budget:
+            scale *= 0.95
+    return scale
+
+
+def _scaled(width: int, height: int, scale: float) -> tuple:
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def prepare_upload(image: Image.Image, max_side: int = 0, token_budget: int = 0) -> UploadImage:
+    """原图 -> UploadImage；相同内容与参数命中缓存，多轮优化只缩小一次"""
+    image = image.convert("RGB")
+    key = (hashlib.sha1(image.tobytes()).hexdigest(), image.size, max_side, token_budget)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    scale = fit_scale(image.width, image.height, max_side, token_budget)
+    resized = image
+    if scale < 1.0:
+        resized = image.resize(_scaled(image.width, image.height, scale), Image.LANCZOS)
+        scale = resized.width / image.width
+    upload = UploadImage(resized, image.size, scale)
+
+    with _cache_lock:
+        _cache[key] = upload
+        while len(_cache) > UPLOAD_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return upload
+
+
+def scale_boxlib(boxlib: dict, upload: UploadImage) -> dict:
+    """boxlib 坐标换算到上传图的坐标系（未缩放时原样返回）"""
+    if upload.scale == 1.0:
+        return boxlib
+    sx = upload.image.width / upload.original_size[0]
+    sy = upload.image.height / upload.original_size[1]
+    boxes = [
+        {**b, "x1": round(b["x1"] * sx), "y1": round(b["y1"] * sy),
+         "x2": round(b["x2"] * sx), "y2": round(b["y2"] * sy)}
+        for b in boxlib.get("boxes", [])
+    ]
+    return {**boxlib, "image_width": upload.image.width, "image_height": upload.image.height, "boxes": boxes}
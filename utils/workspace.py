@@ -0,0 +1,169 @@
+"""作业工作区：每次节点执行一个目录，引用计数释放，全局总大小限制
+
+上游 autofigure2 函数只接受文件路径时，交接文件写在工作区中（见 bridge.StageHandoff）。
+工作区在所属范围（scoped 装饰的节点函数）结束、且额外引用都释放后删除；
+进程崩溃等原因残留的目录由配额淘汰回收：目录名含创建进程 pid，
+本进程仍在使用或其他存活进程的目录不会被淘汰。
+"""
+import contextvars
+import functools
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+
+from .constants import (
+    DEFAULT_WORKSPACE_DIR,
+    DEFAULT_WORKSPACE_MODE,
+    DEFAULT_WORKSPACE_MAX_BYTES,
+    DEFAULT_WORKSPACE_KEEP,
+)
+
+RAM_DIR = "/dev/shm"
+
+_scope = contextvars.ContextVar("af_workspace_scope", default=None)
+_active = {}  # path -> Workspace（本进程尚未释放的工作区）
+_lock = threading.Lock()
+_warned_ram = False
+
+
+def root_dir() -> str:
+    """工作区根目录；每次调用时解析，便于测试与基准重定向临时目录"""
+    global _warned_ram
+    if DEFAULT_WORKSPACE_DIR:
+        return DEFAULT_WORKSPACE_DIR
+    if DEFAULT_WORKSPACE_MODE == "ram":
+        if os.path.isdir(RAM_DIR) and os.access(RAM_DIR, os.W_OK):
+            return os.path.join(RAM_DIR, "autofigure")
+        if not _warned_ram:
+            print(f"[AutoFigure] {RAM_DIR} is not available, workspaces fall back to disk")
+            _warned_ram = True
+    return os.path.join(tempfile.gettempdir(), "autofigure")
+
+
+class Workspace:
+    """单个工作区目录（惰性创建）；acquire / release 计数归零时删除"""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.path = os.path.join(root_dir(), f"{prefix}_{os.getpid()}_{uuid.uuid4().hex[:12]}")
+        self._refs = 0
+        self._created = False
+
+    def open(self) -> str:
+        """确保目录已创建（首次创建时检查配额），返回目录路径"""
+        if not self._created:
+            os.makedirs(self.path, exist_ok=True)
+            self._created = True
+            enforce_quota()
+        return self.path
+
+    def file(self, name: str) -> str:
+        """工作区内的文件路径"""
+        return os.path.join(self.open(), name)
+
+    def acquire(self) -> "Workspace":
+        with _lock:
+            self._refs += 1
+            _active[self.path] = self
+        return self
+
+    def release(self):
+        with _lock:
+            self._refs -= 1
+            if self._refs > 0:
+                return
+            _active.pop(self.path, None)
+        if self._created and not DEFAULT_WORKSPACE_KEEP:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+
+def new_workspace(prefix: str) -> Workspace:
+    """新建工作区；当前范围结束时释放范围持有的引用（不在范围内时由调用方 release）"""
+    workspace = Workspace(prefix).acquire()
+    holder = _scope.get()
+    if holder is not None:
+        holder.append(workspace)
+    return workspace
+
+
+def scoped(func):
+    """节点函数装饰器：执行期间创建的工作区在返回后释放（嵌套调用由最外层统一释放）"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _scope.get() is not None:
+            return func(*args, **kwargs)
+        holder = []
+        token = _scope.set(holder)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _scope.reset(token)
+            for workspace in holder:
+                workspace.release()
+    return wrapper
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+def _dir_bytes(path: str) -> int:
+    total = 0
+    for base, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(base, name))
+            except OSError:
+                pass
+    return total
+
+
+def enforce_quota(max_bytes: int = DEFAULT_WORKSPACE_MAX_BYTES):
+    """总大小超过 max_bytes 时按修改时间从旧到新删除闲置工作区
+
+    闲置：本进程已释放（或遗留）的目录，以及创建进程已退出的目录。
+    """
+    root = root_dir()
+    entries = []
+    total = 0
+    try:
+        scanned = list(os.scandir(root))
+    except OSError:
+        return
+    with _lock:
+        active = set(_active)
+    for entry in scanned:
+        if not entry.is_dir(follow_symlinks=False):
+            continue
+        size = _dir_bytes(entry.path)
+        total += size
+        try:
+            pid = int(entry.name.rsplit("_", 2)[-2])
+        except (IndexError, ValueError):
+            continue
+        if entry.path in active or (pid != os.getpid() and _pid_alive(pid)):
+            continue
+        try:
+            mtime = entry.stat().st_mtime
+        except OSError:
+            continue
+        entries.append((mtime, size, entry.path))
+    if total <= max_bytes:
+        return
+    for _, size, path in sorted(entries):
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        print(f"[AutoFigure] Evicted workspace {os.path.basename(path)} ({size / 1024:.0f} KB)")
+        if total <= max_bytes:
+            break
+
@@ -0,0 +1,81 @@
+"""文件输出：原子写入（临时文件 + rename）与后台写入队列
+
+后台队列由单个守护线程顺序消费，队列满时提交方阻塞（反压）；
+解释器退出前等待队列写完，不丢失已返回路径的文件。
+"""
+import atexit
+import os
+import queue
+import threading
+import uuid
+
+from .constants import DEFAULT_SAVE_QUEUE_SIZE
+
+
+def write_atomic(path: str, data: bytes):
+    """先写同目录临时文件再 os.replace：读者只会看到完整文件，并发写同名文件互不破坏"""
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp = os.path.join(directory, f".{os.path.basename(path)}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class BackgroundWriter:
+    """后台写入线程（惰性启动）"""
+
+    def __init__(self, maxsize: int = DEFAULT_SAVE_QUEUE_SIZE):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._pending = set()
+        self.errors = 0
+
+    def submit(self, path: str, data: bytes) -> bool:
+        """加入队列；同一路径已在队列中时跳过并返回 False"""
+        with self._lock:
+            if path in self._pending:
+                return False
+            self._pending.add(path)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="af-svg-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+        self._queue.put((path, data))
+        return True
+
+    def flush(self):
+        """等待已提交的写入全部完成"""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            path, data = self._queue.get()
+            try:
+                write_atomic(path, data)
+            except OSError as e:
+                self.errors += 1
+                print(f"[AutoFigure] Background write failed for {path}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(path)
+                self._queue.task_done()
+
+
+_writer = BackgroundWriter()
+
+
+def write_background(path: str, data: bytes) -> bool:
+    """提交到全局后台写入队列"""
+    return _writer.submit(path, data)
+
+
+def flush_background():
+    _writer.flush()